@@ -1,9 +1,50 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import List, Optional
+from collections import Counter
+from collections.abc import MutableSequence
+import asyncio
+import difflib
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import math
+import mimetypes
+import multiprocessing
+import operator
+import os
+import queue
+import random
+import re
+import secrets
+import socket
 import sqlite3
+import stat
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import tracemalloc
+import webbrowser
+import zipfile
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from contextlib import closing
 from datetime import datetime
+from functools import wraps
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:
+    # Related notes are only offered when numpy is installed
+    np = None
 
 # ──────────────────────────────────────────────
 # Theme Configuration (Unchanged)
@@ -60,6 +101,46 @@ class ThemeManager:
 # Global theme manager
 theme = ThemeManager()
 
+# ──────────────────────────────────────────────
+# Timestamp Formatting
+# ──────────────────────────────────────────────
+
+
+class TimeFormatter:
+    # Epoch timestamps; display strings are cached per minute
+    CACHE_LIMIT = 4096
+
+    def __init__(self):
+        self.now = int(time.time())
+        self.cache = {}
+
+    def tick(self):
+        self.now = int(time.time())
+
+    def absolute(self, epoch: int, fmt: str = "%m/%d %H:%M") -> str:
+        key = (epoch // 60, fmt)
+        text = self.cache.get(key)
+        if text is None:
+            if len(self.cache) >= self.CACHE_LIMIT:
+                self.cache.clear()
+            text = datetime.fromtimestamp(epoch).strftime(fmt)
+            self.cache[key] = text
+        return text
+
+    def relative(self, epoch: int) -> str:
+        age = self.now - epoch
+        if age < 60:
+            return "just now"
+        if age < 3600:
+            return f"{age // 60} min ago"
+        if age < 86400:
+            return f"{age // 3600} h ago"
+        return self.absolute(epoch)
+
+
+# Global timestamp formatter
+time_formatter = TimeFormatter()
+
 # ──────────────────────────────────────────────
 # Custom Widgets with Rounded Borders (Unchanged)
 # ──────────────────────────────────────────────
@@ -183,6 +264,22 @@ class ModernText(tk.Text):
         )
 
 
+class ModernCheckbutton(tk.Checkbutton):
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.configure(
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectcolor=theme.get_color("primary"),
+            activebackground=theme.get_color("surface"),
+            activeforeground=theme.get_color("text"),
+            font=("Segoe UI", 10, "normal"),
+            relief="flat",
+            bd=0,
+            highlightthickness=0,
+        )
+
+
 class ModernLabel(tk.Label):
     def __init__(self, parent, style="normal", **kwargs):
         super().__init__(parent, **kwargs)
@@ -230,6 +327,9 @@ class NoteCard(tk.Frame):
         pinned,
         on_click,
         on_pin,
+        task_total=0,
+        task_done=0,
+        preview="",
     ):
         super().__init__(parent)
         self.note_id = note_id
@@ -247,7 +347,7 @@ class NoteCard(tk.Frame):
             highlightthickness=0,
         )
         self.grid_propagate(False)
-        self.configure(width=200, height=150)
+        self.configure(width=200, height=180)
 
         # Card content
         card_frame = tk.Frame(self, bg=self.bg_color)
@@ -281,6 +381,19 @@ class NoteCard(tk.Frame):
         )
         title_label.pack(fill=tk.X, pady=(5, 2))
 
+        # Content preview; the text arrives already wrapped to the card
+        if preview:
+            preview_label = tk.Label(
+                card_frame,
+                text=preview,
+                bg=self.bg_color,
+                fg=theme.get_color("text_secondary"),
+                font=("Segoe UI", 8, "normal"),
+                anchor="w",
+                justify=tk.LEFT,
+            )
+            preview_label.pack(fill=tk.X, pady=(0, 2))
+
         # Category
         if category:
             cat_label = tk.Label(
@@ -295,27 +408,52 @@ class NoteCard(tk.Frame):
             cat_label.pack(fill=tk.X)
 
         # Timestamp
-        try:
-            dt = datetime.fromisoformat(modified_at)
-            time_str = dt.strftime("%m/%d %H:%M")
-            time_label = tk.Label(
+        self.modified_at = modified_at or 0
+        self.time_label = tk.Label(
+            card_frame,
+            text=time_formatter.relative(self.modified_at),
+            bg=self.bg_color,
+            fg=theme.get_color("text_secondary"),
+            font=("Segoe UI", 8, "normal"),
+            anchor="w",
+        )
+        self.time_label.pack(fill=tk.X, pady=(2, 5))
+
+        # Task progress
+        if task_total:
+            progress = tk.Canvas(
+                card_frame,
+                width=160,
+                height=6,
+                bg=theme.get_color("border"),
+                highlightthickness=0,
+                bd=0,
+            )
+            progress.create_rectangle(
+                0,
+                0,
+                160 * task_done // task_total,
+                6,
+                fill=theme.get_color("success"),
+                width=0,
+            )
+            progress.pack(anchor=tk.W)
+            tk.Label(
                 card_frame,
-                text=time_str,
+                text=f"{task_done}/{task_total} done",
                 bg=self.bg_color,
                 fg=theme.get_color("text_secondary"),
                 font=("Segoe UI", 8, "normal"),
                 anchor="w",
-            )
-            time_label.pack(fill=tk.X, pady=(2, 5))
-        except:
-            pass
+            ).pack(fill=tk.X)
 
-        # Bind click and hover effects
-        self.bind("<Button-1>", lambda e: on_click(self.note_id))
+        # on_click gets the event, to tell Ctrl and Shift clicks apart
+        self.selected = False
+        self.bind("<Button-1>", lambda e: on_click(self.note_id, e))
         for child in self.winfo_children():
-            child.bind("<Button-1>", lambda e: on_click(self.note_id))
+            child.bind("<Button-1>", lambda e: on_click(self.note_id, e))
             for subchild in child.winfo_children():
-                subchild.bind("<Button-1>", lambda e: on_click(self.note_id))
+                subchild.bind("<Button-1>", lambda e: on_click(self.note_id, e))
 
         self.bind("<Enter>", self._on_enter)
         self.bind("<Leave>", self._on_leave)
@@ -337,11 +475,21 @@ class NoteCard(tk.Frame):
             child.configure(bg=hover_color)
 
     def _on_leave(self, event):
-        self.configure(bg=self.bg_color, highlightthickness=0)
+        self.configure(bg=self.bg_color, highlightthickness=3 if self.selected else 0)
         for child in self.winfo_children():
             child.configure(bg=self.bg_color)
 
-    def _lighten_color(self, hex_color):
+    def set_selected(self, selected: bool):
+        if selected != self.selected:
+            self.selected = selected
+            self.configure(
+                highlightbackground=theme.get_color("primary"),
+                highlightcolor=theme.get_color("primary"),
+                highlightthickness=3 if selected else 0,
+            )
+
+    @staticmethod
+    def _lighten_color(hex_color):
         # Simple function to lighten a hex color for hover effect
         hex_color = hex_color.lstrip("#")
         rgb = tuple(int(hex_color[i : i + 2], 16) for i in (0, 2, 4))
@@ -349,16 +497,348 @@ class NoteCard(tk.Frame):
         return f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
 
 
+class CanvasCardGrid:
+    # Draws every card as items on one canvas, tagged "note<id>" and "card"
+    CARD_WIDTH = 200
+    CARD_HEIGHT = 180
+    PADDING = 5
+    COLUMNS = 4
+
+    def __init__(self, canvas, on_click, on_pin, on_press_empty):
+        self.canvas = canvas
+        self.on_click = on_click
+        self.on_pin = on_pin
+        self.on_press_empty = on_press_empty
+        self.background_items = {}
+        self.card_colors = {}
+        self.palette = {}
+        self.time_items = {}
+        self.positions = {}  # note_id -> position in the grid
+        self.hovered = None
+        self.selected = set()
+
+    def attach(self):
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Motion>", self._on_motion)
+        self.canvas.bind("<Leave>", lambda e: self._set_hovered(None))
+
+    def detach(self):
+        self.clear()
+        for sequence in ("<Button-1>", "<Motion>", "<Leave>"):
+            self.canvas.unbind(sequence)
+
+    def clear(self):
+        self.canvas.delete("card")
+        self.background_items = {}
+        self.card_colors = {}
+        self.time_items = {}
+        self.positions = {}
+        self.hovered = None
+
+    def _colors(self, color_tag: str) -> tuple:
+        # (fill, hover fill), computed once per distinct colour tag
+        colors = self.palette.get(color_tag)
+        if colors is None:
+            if color_tag == "default":
+                colors = (theme.get_color("surface"), theme.get_color("hover"))
+            else:
+                colors = (color_tag, NoteCard._lighten_color(color_tag))
+            self.palette[color_tag] = colors
+        return colors
+
+    def render(self, notes: List[tuple]):
+        self.clear()
+        # Theme colours may have changed since the last render
+        self.palette = {}
+        for position, note in enumerate(notes):
+            self.draw_card(position, note)
+        self.resize(len(notes))
+
+    def resize(self, count: int):
+        # Fits the scroll region to count cards
+        rows = (count + self.COLUMNS - 1) // self.COLUMNS
+        self.canvas.configure(
+            scrollregion=(
+                0,
+                0,
+                self.COLUMNS * (self.CARD_WIDTH + 2 * self.PADDING),
+                rows * (self.CARD_HEIGHT + 2 * self.PADDING),
+            )
+        )
+
+    def origin(self, position: int) -> tuple:
+        # Top-left corner of the card at position
+        cell_width = self.CARD_WIDTH + 2 * self.PADDING
+        cell_height = self.CARD_HEIGHT + 2 * self.PADDING
+        return (
+            (position % self.COLUMNS) * cell_width + self.PADDING,
+            (position // self.COLUMNS) * cell_height + self.PADDING,
+        )
+
+    def draw_card(self, position: int, note: tuple):
+        canvas = self.canvas
+        (
+            note_id,
+            title,
+            category,
+            modified_at,
+            mode,
+            pinned,
+            color_tag,
+            task_total,
+            task_done,
+            preview,
+        ) = note
+        text_color = theme.get_color("text")
+        secondary_color = theme.get_color("secondary")
+        caption_color = theme.get_color("text_secondary")
+        border_color = theme.get_color("border")
+        colors = self._colors(color_tag or "default")
+        x, y = self.origin(position)
+        tag = f"note{note_id}"
+        background = canvas.create_rectangle(
+            x,
+            y,
+            x + self.CARD_WIDTH,
+            y + self.CARD_HEIGHT,
+            fill=colors[0],
+            outline=self._outline(note_id),
+            width=self._border_width(note_id),
+            tags=("card", tag, "bg"),
+        )
+        self.background_items[note_id] = background
+        self.card_colors[note_id] = colors
+        self.positions[note_id] = position
+        canvas.create_text(
+            x + self.CARD_WIDTH - 10,
+            y + 10,
+            text="📌" if pinned else "📍",
+            font=("Segoe UI", 8),
+            fill=text_color,
+            anchor="ne",
+            tags=("card", tag, "pin"),
+        )
+        mode_icon = "📋" if mode == "task" else "📝"
+        canvas.create_text(
+            x + 10,
+            y + 10,
+            text=f"{mode_icon} {title[:20]}{'...' if len(title) > 20 else ''}",
+            font=("Segoe UI", 12, "bold"),
+            fill=text_color,
+            anchor="nw",
+            width=160,
+            tags=("card", tag),
+        )
+        if preview:
+            # Already wrapped to the card, so no width for Tk to wrap at
+            canvas.create_text(
+                x + 10,
+                y + 56,
+                text=preview,
+                font=("Segoe UI", 8, "normal"),
+                fill=caption_color,
+                anchor="nw",
+                tags=("card", tag),
+            )
+        if category:
+            canvas.create_text(
+                x + 10,
+                y + 114,
+                text=category,
+                font=("Segoe UI", 9, "normal"),
+                fill=secondary_color,
+                anchor="nw",
+                width=160,
+                tags=("card", tag),
+            )
+        time_item = canvas.create_text(
+            x + 10,
+            y + 132,
+            text=time_formatter.relative(modified_at or 0),
+            font=("Segoe UI", 8, "normal"),
+            fill=caption_color,
+            anchor="nw",
+            tags=("card", tag),
+        )
+        self.time_items[time_item] = modified_at or 0
+        if task_total:
+            canvas.create_rectangle(
+                x + 10,
+                y + 150,
+                x + 170,
+                y + 156,
+                fill=border_color,
+                width=0,
+                tags=("card", tag),
+            )
+            canvas.create_rectangle(
+                x + 10,
+                y + 150,
+                x + 10 + 160 * task_done // task_total,
+                y + 156,
+                fill=theme.get_color("success"),
+                width=0,
+                tags=("card", tag),
+            )
+            canvas.create_text(
+                x + 10,
+                y + 160,
+                text=f"{task_done}/{task_total} done",
+                font=("Segoe UI", 8, "normal"),
+                fill=caption_color,
+                anchor="nw",
+                tags=("card", tag),
+            )
+
+    def update_card(self, position: int, note: tuple):
+        # Redraws one card at position, drawing it if it is not there yet
+        self.remove_card(note[0])
+        self.draw_card(position, note)
+
+    def move_card(self, note_id: int, position: int):
+        # Shifts an unchanged card's items instead of drawing them again
+        old_x, old_y = self.origin(self.positions[note_id])
+        x, y = self.origin(position)
+        self.canvas.move(f"note{note_id}", x - old_x, y - old_y)
+        self.positions[note_id] = position
+
+    def remove_card(self, note_id: int):
+        for item in self.canvas.find_withtag(f"note{note_id}"):
+            self.time_items.pop(item, None)
+        self.canvas.delete(f"note{note_id}")
+        self.background_items.pop(note_id, None)
+        self.card_colors.pop(note_id, None)
+        self.positions.pop(note_id, None)
+        if self.hovered == note_id:
+            self.hovered = None
+
+    def refresh_times(self):
+        for item, modified_at in self.time_items.items():
+            self.canvas.itemconfigure(item, text=time_formatter.relative(modified_at))
+
+    def _hit(self):
+        # Returns (note_id, tags) for the item under the pointer
+        items = self.canvas.find_withtag("current")
+        if not items:
+            return None, ()
+        tags = self.canvas.gettags(items[0])
+        for tag in tags:
+            if tag.startswith("note"):
+                return int(tag[4:]), tags
+        return None, tags
+
+    def _on_click(self, event):
+        note_id, tags = self._hit()
+        if note_id is None:
+            self.on_press_empty(event)
+        elif "pin" in tags:
+            self.on_pin(note_id)
+        else:
+            self.on_click(note_id, event)
+
+    def _on_motion(self, event):
+        note_id, tags = self._hit()
+        self._set_hovered(note_id)
+
+    def _set_hovered(self, note_id):
+        if note_id == self.hovered:
+            return
+        if self.hovered in self.background_items:
+            self.canvas.itemconfigure(
+                self.background_items[self.hovered],
+                fill=self.card_colors[self.hovered][0],
+                width=self._border_width(self.hovered),
+            )
+        self.hovered = note_id
+        if note_id in self.background_items:
+            self.canvas.itemconfigure(
+                self.background_items[note_id],
+                fill=self.card_colors[note_id][1],
+                width=max(3, self._border_width(note_id)),
+            )
+
+    def _outline(self, note_id: int) -> str:
+        return theme.get_color("primary" if note_id in self.selected else "border")
+
+    def _border_width(self, note_id: int) -> int:
+        return 4 if note_id in self.selected else 2
+
+    def set_selected(self, note_ids: set):
+        # Restyles only the cards whose selection changed
+        changed = self.selected ^ note_ids
+        self.selected = set(note_ids)
+        for note_id in changed:
+            item = self.background_items.get(note_id)
+            if item is not None:
+                self.canvas.itemconfigure(
+                    item,
+                    outline=self._outline(note_id),
+                    width=self._border_width(note_id),
+                )
+
+    def cards_in(self, x0, y0, x1, y1) -> List[int]:
+        # Ids of the cards overlapping a rectangle in canvas coordinates
+        note_ids = []
+        for item in self.canvas.find_overlapping(x0, y0, x1, y1):
+            tags = self.canvas.gettags(item)
+            if "bg" in tags:
+                note_ids.extend(int(tag[4:]) for tag in tags if tag.startswith("note"))
+        return note_ids
+
+
 # ──────────────────────────────────────────────
 # Database Setup (Unchanged)
 # ──────────────────────────────────────────────
 
 DB_FILE = "notes.db"
+BUSY_TIMEOUT = 5.0  # seconds a connection waits for another writer
+BUSY_RETRIES = 4
+# Set by init_database when SQLite has FTS5 with the trigram tokenizer
+FUZZY_SEARCH_AVAILABLE = False
+
+
+def get_connection():
+    # BEGIN IMMEDIATE, so two instances never deadlock upgrading a read
+    conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT, isolation_level="IMMEDIATE")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def retry_on_busy(func):
+    # Retries a whole write when the busy timeout was not enough
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as error:
+                message = str(error)
+                if attempt == BUSY_RETRIES - 1 or (
+                    "locked" not in message and "busy" not in message
+                ):
+                    raise
+            time.sleep(0.1 * 2**attempt)
+
+    return wrapper
 
 
 def init_database():
-    conn = sqlite3.connect(DB_FILE)
+    global FUZZY_SEARCH_AVAILABLE
+    conn = get_connection()
     cursor = conn.cursor()
+    # Existing databases are converted by vacuum_database_job
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL lets readers and one writer from different processes work at once
+    cursor.execute("PRAGMA journal_mode=WAL")
+
+    # Categories are referenced by id; triggers keep note_count current
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            note_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
 
     # Create the notes table if it doesn't exist
     cursor.execute("""
@@ -367,9 +847,9 @@ def init_database():
             title TEXT NOT NULL,
             content TEXT NOT NULL DEFAULT '',
             mode TEXT NOT NULL DEFAULT 'normal',
-            category TEXT DEFAULT '',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            category_id INTEGER REFERENCES categories (id),
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            modified_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
         )
     """)
 
@@ -383,6 +863,34 @@ def init_database():
     if "color_tag" not in columns:
         cursor.execute("ALTER TABLE notes ADD COLUMN color_tag TEXT DEFAULT 'default'")
 
+    # Card preview text; NULL until built, see NotesDB.fill_previews
+    if "preview" not in columns:
+        cursor.execute("ALTER TABLE notes ADD COLUMN preview TEXT")
+
+    # Move the old free-text category column into the categories table
+    if "category_id" not in columns:
+        cursor.execute(
+            "ALTER TABLE notes ADD COLUMN category_id INTEGER REFERENCES categories (id)"
+        )
+        if "category" in columns:
+            cursor.execute("""
+                INSERT OR IGNORE INTO categories (name)
+                SELECT DISTINCT category FROM notes WHERE category != ''
+            """)
+            cursor.execute("""
+                UPDATE notes SET category_id =
+                    (SELECT id FROM categories WHERE name = notes.category)
+            """)
+            cursor.execute("""
+                UPDATE categories SET note_count =
+                    (SELECT COUNT(*) FROM notes WHERE category_id = categories.id)
+            """)
+            try:
+                cursor.execute("ALTER TABLE notes DROP COLUMN category")
+            except sqlite3.OperationalError:
+                # SQLite before 3.35; the column stays behind unused
+                pass
+
     # Create the tasks table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS tasks (
@@ -390,9 +898,39 @@ def init_database():
             note_id INTEGER NOT NULL,
             content TEXT NOT NULL,
             done BOOLEAN DEFAULT 0,
+            position REAL,
             FOREIGN KEY (note_id) REFERENCES notes (id) ON DELETE CASCADE
         )
     """)
+    # Tasks are ordered by a fractional position, so a move rewrites one row
+    cursor.execute("PRAGMA table_info(tasks)")
+    if "position" not in [col[1] for col in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE tasks ADD COLUMN position REAL")
+        cursor.execute("UPDATE tasks SET position = id")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_note_position ON tasks (note_id, position)"
+    )
+    # Tasks added by other tools without a position go to the end
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_position AFTER INSERT ON tasks
+        WHEN NEW.position IS NULL
+        BEGIN
+            UPDATE tasks SET position = (
+                SELECT COALESCE(MAX(position), 0) + 1 FROM tasks
+                WHERE note_id = NEW.note_id AND id != NEW.id
+            ) WHERE id = NEW.id;
+        END
+    """)
+    # Per-note task counts are served from here
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_note_done ON tasks (note_id, done)"
+    )
+    # For has:open-tasks and the open-tasks list; replaces the note_id index
+    cursor.execute("DROP INDEX IF EXISTS idx_tasks_open")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_open_position "
+        "ON tasks (note_id, position) WHERE done = 0"
+    )
 
     # Create the settings table
     cursor.execute("""
@@ -402,6 +940,371 @@ def init_database():
         )
     """)
 
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+
+    # Version 1: epoch timestamps instead of local or UTC ISO text
+    if version < 1:
+        for column in ("created_at", "modified_at"):
+            cursor.execute(f"""
+                UPDATE notes
+                SET {column} = CAST(
+                    CASE WHEN instr({column}, 'T')
+                        THEN strftime('%s', {column}, 'utc')
+                        ELSE strftime('%s', {column})
+                    END AS INTEGER)
+                WHERE typeof({column}) = 'text'
+            """)
+        version = 1
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_pinned_modified ON notes (pinned, modified_at)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_created ON notes (created_at)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_category ON notes (category_id)"
+    )
+    # Filters of the search query language; the cat: filter ignores case
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_categories_name_nocase "
+        "ON categories (name COLLATE NOCASE)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_modified ON notes (modified_at)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_mode ON notes (mode)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_color ON notes (color_tag)")
+    cursor.execute(f"PRAGMA user_version = {version}")
+
+    # Change log read by ChangeWatcher to see writes from other processes
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS note_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            note_id INTEGER NOT NULL,
+            changed_at INTEGER NOT NULL
+        )
+    """)
+    # Counter columns changing is no change to the note
+    cursor.execute("""
+        SELECT 1 FROM sqlite_master
+        WHERE name = 'notes_log_update' AND sql NOT LIKE '%UPDATE OF%'
+    """)
+    if cursor.fetchone():
+        cursor.execute("DROP TRIGGER notes_log_update")
+    for event, row in (
+        ("INSERT", "NEW"),
+        (
+            "UPDATE OF title, content, preview, mode, category_id, created_at, "
+            "modified_at, pinned, color_tag",
+            "NEW",
+        ),
+        ("DELETE", "OLD"),
+    ):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS notes_log_{event.split()[0].lower()}
+            AFTER {event} ON notes
+            BEGIN
+                INSERT INTO note_changes (note_id, changed_at)
+                VALUES ({row}.id, CAST(strftime('%s', 'now') AS INTEGER));
+            END
+        """)
+    cursor.execute(
+        "DELETE FROM note_changes WHERE changed_at < ?",
+        (int(time.time()) - 86400,),
+    )
+
+    # Category note counts; a category is dropped when its last note leaves
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_category_insert
+        AFTER INSERT ON notes WHEN NEW.category_id IS NOT NULL
+        BEGIN
+            UPDATE categories SET note_count = note_count + 1
+            WHERE id = NEW.category_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_category_delete
+        AFTER DELETE ON notes WHEN OLD.category_id IS NOT NULL
+        BEGIN
+            UPDATE categories SET note_count = note_count - 1
+            WHERE id = OLD.category_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_category_update
+        AFTER UPDATE OF category_id ON notes
+        WHEN OLD.category_id IS NOT NEW.category_id
+        BEGIN
+            UPDATE categories SET note_count = note_count - 1
+            WHERE id = OLD.category_id;
+            UPDATE categories SET note_count = note_count + 1
+            WHERE id = NEW.category_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS categories_prune
+        AFTER UPDATE OF note_count ON categories WHEN NEW.note_count <= 0
+        BEGIN
+            DELETE FROM categories WHERE id = NEW.id;
+        END
+    """)
+    # A rename touches no note rows, so log its notes for other instances
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS categories_log_rename
+        AFTER UPDATE OF name ON categories
+        BEGIN
+            INSERT INTO note_changes (note_id, changed_at)
+            SELECT id, CAST(strftime('%s', 'now') AS INTEGER)
+            FROM notes WHERE category_id = NEW.id;
+        END
+    """)
+
+    # Content history of every note, see RevisionStore
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS revisions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            note_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            depth INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            data BLOB NOT NULL
+        )
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_revisions_note ON revisions (note_id, id)"
+    )
+
+    # Attachments: one blob per content hash; metadata and thumbnails apart
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attachment_blobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sha256 TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            note_id INTEGER NOT NULL,
+            blob_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            mime_type TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            FOREIGN KEY (note_id) REFERENCES notes (id) ON DELETE CASCADE,
+            FOREIGN KEY (blob_id) REFERENCES attachment_blobs (id)
+        )
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attachments_note ON attachments (note_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attachments_blob ON attachments (blob_id)"
+    )
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attachment_previews (
+            blob_id INTEGER PRIMARY KEY,
+            metadata TEXT,
+            thumbnail BLOB
+        )
+    """)
+
+    # Trigram index for typo-tolerant search, kept in sync by triggers
+    try:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'notes_trigram'")
+        if cursor.fetchone() is None:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE notes_trigram USING fts5(
+                    title, content, content='notes', content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+            cursor.execute(
+                "INSERT INTO notes_trigram (notes_trigram) VALUES ('rebuild')"
+            )
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS notes_trigram_insert AFTER INSERT ON notes
+            BEGIN
+                INSERT INTO notes_trigram (rowid, title, content)
+                VALUES (NEW.id, NEW.title, NEW.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS notes_trigram_delete AFTER DELETE ON notes
+            BEGIN
+                INSERT INTO notes_trigram (notes_trigram, rowid, title, content)
+                VALUES ('delete', OLD.id, OLD.title, OLD.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS notes_trigram_update
+            AFTER UPDATE OF title, content ON notes
+            BEGIN
+                INSERT INTO notes_trigram (notes_trigram, rowid, title, content)
+                VALUES ('delete', OLD.id, OLD.title, OLD.content);
+                INSERT INTO notes_trigram (rowid, title, content)
+                VALUES (NEW.id, NEW.title, NEW.content);
+            END
+        """)
+        FUZZY_SEARCH_AVAILABLE = True
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5 or older than 3.34
+        FUZZY_SEARCH_AVAILABLE = False
+
+    # [[Title]] links; target_id stays NULL until that title exists
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'links'")
+    links_missing = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS links (
+            source_id INTEGER NOT NULL,
+            target_id INTEGER,
+            target_title TEXT NOT NULL COLLATE NOCASE
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_links_source ON links (source_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_links_target ON links (target_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_links_title ON links (target_title)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_title ON notes (title COLLATE NOCASE)"
+    )
+    if links_missing:
+        # Notes written before links existed are parsed once
+        for note_id, content in cursor.execute(
+            "SELECT id, content FROM notes WHERE content LIKE '%[[%]]%'"
+        ).fetchall():
+            NotesDB.update_links(cursor, note_id, content)
+
+    # Per-note counters kept by triggers, so has: filters are index lookups
+    counters = {
+        "task_count": "SELECT COUNT(*) FROM tasks WHERE note_id = notes.id",
+        "open_task_count": "SELECT COUNT(*) FROM tasks WHERE note_id = notes.id AND done = 0",
+        "attachment_count": "SELECT COUNT(*) FROM attachments WHERE note_id = notes.id",
+        "link_count": "SELECT COUNT(*) FROM links WHERE source_id = notes.id",
+        "backlink_count": "SELECT COUNT(*) FROM links WHERE target_id = notes.id",
+    }
+    cursor.execute("PRAGMA table_info(notes)")
+    columns = [col[1] for col in cursor.fetchall()]
+    for column in counters:
+        if column not in columns:
+            cursor.execute(
+                f"ALTER TABLE notes ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"
+            )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_notes_{column} ON notes ({column})"
+        )
+    # table: (columns that move a count, [(note column, counts)])
+    counted = {
+        "tasks": (
+            "note_id, done",
+            [
+                (
+                    "note_id",
+                    [("task_count", "1"), ("open_task_count", "({row}.done = 0)")],
+                )
+            ],
+        ),
+        "attachments": ("note_id", [("note_id", [("attachment_count", "1")])]),
+        "links": (
+            "source_id, target_id",
+            [
+                ("source_id", [("link_count", "1")]),
+                ("target_id", [("backlink_count", "1")]),
+            ],
+        ),
+    }
+    for table, (update_of, uses) in counted.items():
+        for event, rows in (
+            ("INSERT", [("NEW", "+")]),
+            ("DELETE", [("OLD", "-")]),
+            (f"UPDATE OF {update_of}", [("OLD", "-"), ("NEW", "+")]),
+        ):
+            statements = []
+            for row, sign in rows:
+                for key, counts in uses:
+                    changes = ", ".join(
+                        f"{counter} = {counter} {sign} {amount.format(row=row)}"
+                        for counter, amount in counts
+                    )
+                    statements.append(
+                        f"UPDATE notes SET {changes} WHERE id = {row}.{key};"
+                    )
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_count_{event.split()[0].lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    {" ".join(statements)}
+                END
+            """)
+    if links_missing or any(column not in columns for column in counters):
+        cursor.execute(
+            "UPDATE notes SET "
+            + ", ".join(f"{column} = ({query})" for column, query in counters.items())
+        )
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_preview_missing ON notes (id) "
+        "WHERE preview IS NULL"
+    )
+    NotesDB.fill_previews(cursor)
+
+    # Related notes term vectors as of the note's modified_at
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vector_terms (
+            id INTEGER PRIMARY KEY,
+            term TEXT NOT NULL UNIQUE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS note_vectors (
+            note_id INTEGER PRIMARY KEY,
+            modified_at INTEGER,
+            terms BLOB NOT NULL,
+            weights BLOB NOT NULL
+        )
+    """)
+
+    # MinHash signatures for the duplicate finder, as of modified_at
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS minhash_signatures (
+            note_id INTEGER PRIMARY KEY,
+            modified_at INTEGER,
+            signature BLOB
+        )
+    """)
+
+    # Files written by MarkdownSync, keyed by path relative to the folder
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_manifest (
+            path TEXT PRIMARY KEY,
+            note_id INTEGER NOT NULL UNIQUE,
+            note_modified INTEGER,
+            file_mtime_ns INTEGER NOT NULL,
+            file_size INTEGER NOT NULL,
+            content_hash TEXT NOT NULL
+        )
+    """)
+
+    # Log written by MaintenanceScheduler
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job TEXT NOT NULL,
+            finished_at INTEGER NOT NULL,
+            steps INTEGER NOT NULL,
+            duration_ms REAL NOT NULL,
+            reclaimed_bytes INTEGER NOT NULL
+        )
+    """)
+
+    # Version 2: incremental auto-vacuum; the full VACUUM runs as a job
+    if version < 2:
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            cursor.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('vacuum_pending', '1')"
+            )
+        cursor.execute("PRAGMA user_version = 2")
+
     conn.commit()
     conn.close()
 
@@ -411,189 +1314,4209 @@ def init_database():
 # ──────────────────────────────────────────────
 
 
-@dataclass
+@dataclass(slots=True)
 class TaskItem:
     content: str
     done: bool = False
     id: Optional[int] = None
+    position: Optional[float] = None
+
+
+class TaskList(MutableSequence):
+    # Tasks kept as parallel arrays, expanded into TaskItems on access;
+    # inserting, deleting or moving switches to a plain list
+    __slots__ = ("ids", "done", "ends", "positions", "text", "items")
+    MIN_GAP = 1e-9  # closest two positions may get before renumbering
+
+    def __init__(self, items=()):
+        self.ids = self.done = self.ends = self.positions = None
+        self.text = ""
+        self.items = list(items)
+
+    @classmethod
+    def from_rows(cls, rows) -> "TaskList":
+        # rows of (id, content, done, position)
+        tasks = cls()
+        tasks.ids = array("q")
+        tasks.done = bytearray()
+        tasks.ends = array("L")
+        tasks.positions = array("d")
+        texts = []
+        offset = 0
+        for task_id, content, done, position in rows:
+            offset += len(content)
+            tasks.ids.append(task_id)
+            tasks.done.append(1 if done else 0)
+            tasks.ends.append(offset)
+            tasks.positions.append(position)
+            texts.append(content)
+        tasks.text = "".join(texts)
+        tasks.items = None
+        return tasks
+
+    def __len__(self) -> int:
+        return len(self.items) if self.ids is None else len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.ids is None:
+            return self.items[index]
+        count = len(self.ids)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("task index out of range")
+        if self.items is None:
+            self.items = [None] * count
+        item = self.items[index]
+        if item is None:
+            start = self.ends[index - 1] if index else 0
+            item = TaskItem(
+                self.text[start : self.ends[index]],
+                bool(self.done[index]),
+                self.ids[index],
+                self.positions[index],
+            )
+            self.items[index] = item
+        return item
+
+    def __setitem__(self, index, value):
+        self.expand()
+        self.items[index] = value
+
+    def __delitem__(self, index):
+        self.expand()
+        del self.items[index]
+
+    def insert(self, index, value):
+        self.expand()
+        self.items.insert(index, value)
+
+    def __repr__(self) -> str:
+        return f"TaskList({list(self)!r})"
+
+    def expand(self):
+        if self.ids is not None:
+            items = [self[i] for i in range(len(self.ids))]
+            self.ids = self.done = self.ends = self.positions = None
+            self.text = ""
+            self.items = items
+
+    def move(self, source: int, target: int):
+        # The moved task gets a new position when the note is saved
+        self.expand()
+        item = self.items.pop(source)
+        item.position = None
+        self.items.insert(target, item)
+
+    def assign_positions(self):
+        # Spaces new or moved tasks between their neighbours, renumbering
+        # every task once the gap runs out
+        if self.ids is not None:
+            return  # nothing was added or moved since loading
+        items = self.items
+        previous = None
+        index = 0
+        while index < len(items):
+            position = items[index].position
+            if position is not None and (previous is None or position > previous):
+                previous = position
+                index += 1
+                continue
+            end = index
+            while end < len(items) and not (
+                items[end].position is not None
+                and (previous is None or items[end].position > previous)
+            ):
+                end += 1
+            count = end - index
+            upper = items[end].position if end < len(items) else None
+            if previous is not None:
+                lower = previous
+            elif upper is not None:
+                lower = upper - count - 1
+            else:
+                lower = 0.0
+            if upper is None:
+                upper = lower + count + 1
+            step = (upper - lower) / (count + 1)
+            if step < self.MIN_GAP:
+                for number, item in enumerate(items, 1):
+                    item.position = float(number)
+                return
+            for offset in range(count):
+                items[index + offset].position = lower + step * (offset + 1)
+            previous = items[end - 1].position
+            index = end
+
+    def entries(self):
+        # (id, content, done, position) of every task without creating
+        # TaskItems
+        if self.ids is None:
+            for item in self.items:
+                yield item.id, item.content, item.done, item.position
+            return
+        start = 0
+        for index, end in enumerate(self.ends):
+            item = self.items[index] if self.items else None
+            if item is not None:
+                yield item.id, item.content, item.done, item.position
+            else:
+                yield (
+                    self.ids[index],
+                    self.text[start:end],
+                    bool(self.done[index]),
+                    self.positions[index],
+                )
+            start = end
+
+    def rows(self):
+        # (content, done) of every task
+        for _, content, done, _ in self.entries():
+            yield content, done
 
 
-@dataclass
 class Note:
-    title: str
-    content: str = ""
-    tasks: List[TaskItem] = None
-    mode: str = "normal"
-    category: str = ""
-    pinned: bool = False
-    color_tag: str = "default"
-    id: Optional[int] = None
-    created_at: Optional[str] = None
-    modified_at: Optional[str] = None
+    # Content and tasks of unloaded() notes are read on first access
+    __slots__ = (
+        "title",
+        "mode",
+        "category",
+        "pinned",
+        "color_tag",
+        "id",
+        "created_at",
+        "modified_at",
+        "_content",
+        "_tasks",
+    )
+
+    def __init__(
+        self,
+        title: str,
+        content: str = "",
+        tasks: Optional[List[TaskItem]] = None,
+        mode: str = "normal",
+        category: str = "",
+        pinned: bool = False,
+        color_tag: str = "default",
+        id: Optional[int] = None,
+        created_at: Optional[int] = None,
+        modified_at: Optional[int] = None,
+    ):
+        self.title = title
+        self.content = content
+        self.tasks = tasks or []
+        self.mode = mode
+        self.category = category
+        self.pinned = pinned
+        self.color_tag = color_tag
+        self.id = id
+        self.created_at = created_at
+        self.modified_at = modified_at
+
+    @classmethod
+    def unloaded(cls, **fields) -> "Note":
+        note = cls(**fields)
+        note._content = None
+        note._tasks = None
+        return note
+
+    def __repr__(self) -> str:
+        return (
+            f"Note(id={self.id!r}, title={self.title!r}, mode={self.mode!r}, "
+            f"category={self.category!r}, modified_at={self.modified_at!r})"
+        )
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            self._content = NotesDB.load_content(self.id)
+        return self._content
+
+    @content.setter
+    def content(self, value: str):
+        self._content = value
+
+    @property
+    def content_loaded(self) -> bool:
+        return self._content is not None
+
+    @property
+    def tasks(self) -> TaskList:
+        if self._tasks is None:
+            self._tasks = NotesDB.load_tasks(self.id)
+        return self._tasks
 
-    def __post_init__(self):
-        if self.tasks is None:
-            self.tasks = []
+    @tasks.setter
+    def tasks(self, value):
+        self._tasks = value if isinstance(value, TaskList) else TaskList(value)
+
+    @property
+    def tasks_loaded(self) -> bool:
+        return self._tasks is not None
 
 
 # ──────────────────────────────────────────────
-# Database Operations (Unchanged)
+# Fuzzy Matching
 # ──────────────────────────────────────────────
 
-
-class NotesDB:
-    @staticmethod
-    def save_note(note: Note) -> int:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        now = datetime.now().isoformat()
-        if note.id is None:
-            cursor.execute(
-                """
-                INSERT INTO notes (title, content, mode, category, created_at, modified_at, pinned, color_tag)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
-                    note.title,
-                    note.content,
-                    note.mode,
-                    note.category,
-                    now,
-                    now,
-                    note.pinned,
-                    note.color_tag,
-                ),
-            )
-            note_id = cursor.lastrowid
-            note.id = note_id
-        else:
-            cursor.execute(
-                """
-                UPDATE notes 
-                SET title=?, content=?, mode=?, category=?, modified_at=?, pinned=?, color_tag=?
-                WHERE id=?
-            """,
-                (
-                    note.title,
-                    note.content,
-                    note.mode,
-                    note.category,
-                    now,
-                    note.pinned,
-                    note.color_tag,
-                    note.id,
-                ),
-            )
-            note_id = note.id
-        cursor.execute("DELETE FROM tasks WHERE note_id=?", (note_id,))
-        for task in note.tasks:
-            cursor.execute(
-                """
-                INSERT INTO tasks (note_id, content, done)
-                VALUES (?, ?, ?)
-            """,
-                (note_id, task.content, task.done),
+WORD_PATTERN = re.compile(r"\w+")
+FUZZY_CANDIDATES = 200  # notes fetched from the trigram index
+FUZZY_RERANK = 40  # best candidates re-ranked by edit distance
+FUZZY_TEXT_LIMIT = 20000  # characters of content examined per candidate
+
+
+def trigrams(word: str) -> set:
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    # Levenshtein distance, or limit + 1 once it must exceed limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
             )
-        conn.commit()
-        conn.close()
-        return note_id
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def closest_word_distance(word: str, text_words: set) -> int:
+    limit = max(1, len(word) // 3)
+    word_trigrams = trigrams(word)
+    best = limit + 1
+    for candidate in text_words:
+        # Only words sharing a trigram can be within the limit
+        if abs(len(candidate) - len(word)) > limit or not any(
+            trigram in candidate for trigram in word_trigrams
+        ):
+            continue
+        best = min(best, edit_distance(word, candidate, limit))
+        if best == 0:
+            break
+    return best
 
-    @staticmethod
-    def load_note(note_id: int) -> Optional[Note]:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM notes WHERE id=?", (note_id,))
-        row = cursor.fetchone()
-        if not row:
-            conn.close()
+
+# ──────────────────────────────────────────────
+# Note Previews
+# ──────────────────────────────────────────────
+
+PREVIEW_SOURCE = 1000  # characters of content a preview is built from
+PREVIEW_WIDTH = 28  # characters per line, sized for a 160 px card column
+PREVIEW_LINES = 4
+
+PREVIEW_FENCE = re.compile(r"^\s*(```|~~~).*$", re.MULTILINE)
+PREVIEW_LINE_MARKUP = re.compile(
+    r"^\s*(?:#{1,6}\s+|>\s?|(?:[-*+]|\d+[.)])\s+(?:\[[ xX]\]\s+)?)+", re.MULTILINE
+)
+PREVIEW_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+PREVIEW_WIKI_LINK = re.compile(r"\[\[([^\[\]\n]+)\]\]")
+PREVIEW_EMPHASIS = re.compile(r"\*\*|__|~~|`|(?<![\w*])[*_](?=\S)|(?<=\S)[*_](?![\w*])")
+
+
+def note_preview(content: str) -> str:
+    # Plain text of the start of a note, wrapped for a card
+    text = content[:PREVIEW_SOURCE]
+    text = PREVIEW_FENCE.sub("", text)
+    text = PREVIEW_LINE_MARKUP.sub("", text)
+    text = PREVIEW_LINK.sub(r"\1", text)
+    text = PREVIEW_WIKI_LINK.sub(r"\1", text)
+    text = PREVIEW_EMPHASIS.sub("", text)
+    # Text past what fits is only needed to know that an ellipsis is due
+    text = " ".join(text.split())[: PREVIEW_WIDTH * (PREVIEW_LINES + 1)]
+    return "\n".join(
+        textwrap.wrap(text, PREVIEW_WIDTH, max_lines=PREVIEW_LINES, placeholder=" …")
+    )
+
+
+# ──────────────────────────────────────────────
+# Search Queries
+# ──────────────────────────────────────────────
+
+
+class QueryError(ValueError):
+    pass
+
+
+@dataclass
+class TextTerm:
+    text: str
+    column: Optional[str] = None  # None matches title or content
+
+
+@dataclass
+class FilterTerm:
+    key: str
+    op: str
+    value: str
+
+
+@dataclass
+class NotTerm:
+    term: object
+
+
+@dataclass
+class AndTerm:
+    terms: list
+
+
+@dataclass
+class OrTerm:
+    terms: list
+
+
+class SearchQuery:
+    # Parses the sidebar search, e.g. cat:work is:pinned "exact phrase" -draft,
+    # and compiles it to one parameterized query
+    TOKEN = re.compile(
+        r"\s*(?:(?P<paren>[()])|(?P<neg>-)?(?:(?P<key>[A-Za-z]+):)?"
+        r'(?:"(?P<quoted>[^"]*)"?|(?P<word>[^\s()"]+)))'
+    )
+    FTS_MATCH = "id IN (SELECT rowid FROM notes_trigram WHERE notes_trigram MATCH ?)"
+    DATE_OP = re.compile(r"(>=|<=|>|<|=)?(.*)")
+    RELATIVE = re.compile(r"(\d+)([dwmy])")
+    RELATIVE_SECONDS = {"d": 86400, "w": 7 * 86400, "m": 30 * 86400, "y": 365 * 86400}
+    KEYS = {
+        "cat": "cat",
+        "category": "cat",
+        "is": "is",
+        "mode": "mode",
+        "has": "has",
+        "color": "color",
+        "colour": "color",
+        "modified": "modified",
+        "created": "created",
+        "title": "title",
+        "content": "content",
+    }
+    IS_VALUES = {
+        "pinned": "pinned = 1",
+        "unpinned": "pinned = 0",
+        "task": "mode = 'task'",
+        "note": "mode = 'normal'",
+    }
+    MODE_VALUES = {
+        "task": "task",
+        "tasks": "task",
+        "normal": "normal",
+        "note": "normal",
+    }
+    HAS_VALUES = {
+        "tasks": "task_count > 0",
+        "open-tasks": "open_task_count > 0",
+        "attachments": "attachment_count > 0",
+        "links": "link_count > 0",
+        "backlinks": "backlink_count > 0",
+    }
+
+    def __init__(self, text: str):
+        self.tokens = self.tokenize(text)
+        self.position = 0
+        self.tree = self.parse_or() if self.tokens else None
+        if self.position < len(self.tokens):
+            raise QueryError("Unbalanced ')'")
+
+    def tokenize(self, text: str) -> list:
+        tokens = []
+        position = 0
+        text = text.strip()
+        while position < len(text):
+            match = self.TOKEN.match(text, position)
+            if not match:
+                break
+            position = match.end()
+            if match["paren"]:
+                tokens.append(match["paren"])
+            elif match["word"] == "OR" and not (match["neg"] or match["key"]):
+                tokens.append("OR")
+            else:
+                value = (
+                    match["quoted"] if match["quoted"] is not None else match["word"]
+                )
+                term = self.make_term(match["key"], value, match["quoted"] is not None)
+                tokens.append(NotTerm(term) if match["neg"] else term)
+        return tokens
+
+    def make_term(self, key: Optional[str], value: str, quoted: bool):
+        name = self.KEYS.get((key or "").lower())
+        if name is None:
+            # Not a known filter, e.g. a URL: search for it as typed
+            text = f"{key}:{value}" if key else value
+            return TextTerm(text)
+        if name in ("title", "content"):
+            return TextTerm(value, name)
+        value = value if quoted else value.lower()
+        if name == "is" and value not in self.IS_VALUES:
+            raise QueryError(f"is: takes {', '.join(self.IS_VALUES)}")
+        if name == "mode" and value not in self.MODE_VALUES:
+            raise QueryError("mode: takes task or note")
+        if name == "has" and value not in self.HAS_VALUES:
+            raise QueryError(f"has: takes {', '.join(self.HAS_VALUES)}")
+        op = "="
+        if name in ("modified", "created"):
+            op, value = self.DATE_OP.fullmatch(value).groups()
+            self.date_range(value)  # reject bad dates while parsing
+            if op is None:
+                # modified:7d means within the last 7 days
+                op = ">=" if self.RELATIVE.fullmatch(value) else "="
+        return FilterTerm(name, op, value)
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.peek() == "OR":
+            self.position += 1
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else OrTerm(terms)
+
+    def parse_and(self):
+        terms = []
+        while self.peek() not in (None, "OR", ")"):
+            token = self.peek()
+            self.position += 1
+            if token == "(":
+                terms.append(self.parse_or())
+                if self.peek() != ")":
+                    raise QueryError("Missing ')'")
+                self.position += 1
+            else:
+                terms.append(token)
+        if not terms:
+            raise QueryError("Empty group or dangling OR")
+        return terms[0] if len(terms) == 1 else AndTerm(terms)
+
+    def date_range(self, value: str) -> tuple:
+        # (start, end) epoch seconds: a whole local day for dates
+        relative = self.RELATIVE.fullmatch(value)
+        if relative:
+            start = (
+                int(time.time())
+                - int(relative[1]) * (self.RELATIVE_SECONDS[relative[2]])
+            )
+            return start, start + 1
+        if value in ("today", "yesterday"):
+            day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            if value == "yesterday":
+                day = day.fromordinal(day.toordinal() - 1)
+        else:
+            try:
+                day = datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise QueryError(
+                    f"Not a date: {value!r} (use YYYY-MM-DD or 7d)"
+                ) from None
+        following = day.fromordinal(day.toordinal() + 1)
+        return int(day.timestamp()), int(following.timestamp())
+
+    def compile(self, category: Optional[str] = None) -> tuple:
+        # (sql, params) selecting the ids of matching notes
+        tree = self.tree
+        if category is not None:
+            category_term = FilterTerm("cat", "=", category)
+            tree = AndTerm([category_term, tree]) if tree else category_term
+        params = []
+        where = self.compile_term(tree, params) if tree else "1"
+        return f"SELECT id FROM notes WHERE {where}", params
+
+    def compile_term(self, term, params: list) -> str:
+        if isinstance(term, AndTerm):
+            # Words and phrases ANDed together share one trigram lookup
+            indexed = [t for t in term.terms if self.uses_fts(t)]
+            parts = []
+            if indexed:
+                params.append(" AND ".join(self.fts_phrase(t) for t in indexed))
+                parts.append(self.FTS_MATCH)
+            parts += [
+                self.compile_term(t, params) for t in term.terms if not self.uses_fts(t)
+            ]
+            return "(" + " AND ".join(parts) + ")"
+        if isinstance(term, OrTerm):
+            return (
+                "("
+                + " OR ".join(self.compile_term(t, params) for t in term.terms)
+                + ")"
+            )
+        if isinstance(term, NotTerm):
+            # NULL columns (no category, no colour) count as "not matching"
+            return f"NOT IFNULL({self.compile_term(term.term, params)}, 0)"
+        if isinstance(term, TextTerm):
+            if self.uses_fts(term):
+                params.append(self.fts_phrase(term))
+                return self.FTS_MATCH
+            pattern = "%" + re.sub(r"([\\%_])", r"\\\1", term.text) + "%"
+            if term.column:
+                params.append(pattern)
+                return f"{term.column} LIKE ? ESCAPE '\\'"
+            params.extend((pattern, pattern))
+            return "(title LIKE ? ESCAPE '\\' OR content LIKE ? ESCAPE '\\')"
+        return self.compile_filter(term, params)
+
+    @staticmethod
+    def uses_fts(term) -> bool:
+        # Trigrams need at least three characters
+        return (
+            isinstance(term, TextTerm)
+            and FUZZY_SEARCH_AVAILABLE
+            and len(term.text) >= 3
+        )
+
+    @staticmethod
+    def fts_phrase(term: TextTerm) -> str:
+        phrase = '"' + term.text.replace('"', '""') + '"'
+        return f"{term.column} : {phrase}" if term.column else phrase
+
+    def compile_filter(self, term: FilterTerm, params: list) -> str:
+        if term.key == "cat":
+            if term.value in ("", "none"):
+                return "category_id IS NULL"
+            params.append(term.value)
+            return "category_id IN (SELECT id FROM categories WHERE name = ? COLLATE NOCASE)"
+        if term.key == "is":
+            return self.IS_VALUES[term.value]
+        if term.key == "mode":
+            params.append(self.MODE_VALUES[term.value])
+            return "mode = ?"
+        if term.key == "has":
+            return self.HAS_VALUES[term.value]
+        if term.key == "color":
+            params.append("default" if term.value in ("", "none") else term.value)
+            return "color_tag = ?"
+        column = f"{term.key}_at"
+        start, end = self.date_range(term.value)
+        if term.op == "=":
+            params.extend((start, end))
+            return f"({column} >= ? AND {column} < ?)"
+        column_op, bound = {
+            ">": (">=", end),
+            ">=": (">=", start),
+            "<": ("<", start),
+            "<=": ("<", end),
+        }[term.op]
+        params.append(bound)
+        return f"{column} {column_op} ?"
+
+    def note_ids(self, category: Optional[str] = None) -> List[int]:
+        sql, params = self.compile(category)
+        with closing(get_connection()) as conn:
+            ids = [row[0] for row in conn.execute(sql, params)]
+        return ids
+
+
+# ──────────────────────────────────────────────
+# Database Operations (Unchanged)
+# ──────────────────────────────────────────────
+
+
+class NoteConflictError(Exception):
+    # Raised when a note was changed or deleted by someone else since it
+    # was loaded
+    def __init__(self, note_id: int, deleted: bool = False):
+        self.note_id = note_id
+        self.deleted = deleted
+        super().__init__(
+            f"Note {note_id} was {'deleted' if deleted else 'modified'} elsewhere"
+        )
+
+
+class NotesDB:
+    # Called as callback(event, note_ids) after every write
+    listeners = []
+    # A note's category name, or '' for none
+    CATEGORY_NAME = "COALESCE((SELECT name FROM categories WHERE categories.id = notes.category_id), '')"
+    # (task_total, task_done) per note, without loading the tasks
+    TASK_COUNTS = (
+        "(SELECT COUNT(*) FROM tasks WHERE tasks.note_id = notes.id), "
+        "(SELECT COUNT(*) FROM tasks WHERE tasks.note_id = notes.id AND tasks.done = 1)"
+    )
+    # Wrapped preview text for cards; listings read it instead of content
+    PREVIEW = "IFNULL(preview, '')"
+    # [[Note Title]] in a note's text links to the note of that title
+    WIKI_LINK = re.compile(r"\[\[([^\[\]\n]+)\]\]")
+
+    @staticmethod
+    def add_listener(callback):
+        NotesDB.listeners.append(callback)
+
+    @staticmethod
+    def remove_listener(callback):
+        if callback in NotesDB.listeners:
+            NotesDB.listeners.remove(callback)
+
+    @staticmethod
+    def notify(event: str, note_ids: List[int]):
+        for callback in list(NotesDB.listeners):
+            callback(event, note_ids)
+
+    @staticmethod
+    @retry_on_busy
+    def save_note(note: Note, force: bool = False, notify: bool = True) -> int:
+        # Fails with NoteConflictError if modified_at moved, unless force is set
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            now = int(time.time())
+            category_id = NotesDB.category_id(cursor, note.category)
+            previous_title = previous_content = None
+            if note.id is None:
+                cursor.execute(
+                    """
+                    INSERT INTO notes (title, content, preview, mode, category_id, created_at, modified_at, pinned, color_tag)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                    (
+                        note.title,
+                        note.content,
+                        note_preview(note.content),
+                        note.mode,
+                        category_id,
+                        now,
+                        now,
+                        note.pinned,
+                        note.color_tag,
+                    ),
+                )
+                note_id = cursor.lastrowid
+            else:
+                # Two saves within one second must still move modified_at
+                expected = note.modified_at
+                now = max(now, (expected or 0) + 1)
+                # Content that was never loaded is unchanged and left alone
+                content_loaded = note.content_loaded
+                cursor.execute(
+                    f"SELECT title{', content' if content_loaded else ''} FROM notes WHERE id=?",
+                    (note.id,),
+                )
+                row = cursor.fetchone()
+                previous_title = row[0] if row else None
+                previous_content = row[1] if row and content_loaded else None
+                cursor.execute(
+                    f"""
+                    UPDATE notes 
+                    SET title=?, {"content=?, preview=?, " if content_loaded else ""}mode=?, category_id=?, modified_at=?, pinned=?, color_tag=?
+                    WHERE id=? AND (? OR modified_at IS ?)
+                """,
+                    (
+                        note.title,
+                        *(
+                            (note.content, note_preview(note.content))
+                            if content_loaded
+                            else ()
+                        ),
+                        note.mode,
+                        category_id,
+                        now,
+                        note.pinned,
+                        note.color_tag,
+                        note.id,
+                        force,
+                        expected,
+                    ),
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute("SELECT 1 FROM notes WHERE id=?", (note.id,))
+                    deleted = cursor.fetchone() is None
+                    # Content or tasks never loaded are gone with the row
+                    if not force or not content_loaded or not note.tasks_loaded:
+                        conn.rollback()
+                        raise NoteConflictError(note.id, deleted)
+                    # Forced save of a note deleted elsewhere brings it back
+                    cursor.execute(
+                        """
+                        INSERT INTO notes (id, title, content, preview, mode, category_id, created_at, modified_at, pinned, color_tag)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                        (
+                            note.id,
+                            note.title,
+                            note.content,
+                            note_preview(note.content),
+                            note.mode,
+                            category_id,
+                            note.created_at or now,
+                            now,
+                            note.pinned,
+                            note.color_tag,
+                        ),
+                    )
+                note_id = note.id
+            if note.content_loaded:
+                RevisionStore.record(
+                    cursor, note_id, previous_content, note.content, now
+                )
+                if note.content != previous_content:
+                    NotesDB.update_links(cursor, note_id, note.content)
+            if note.title != previous_title:
+                NotesDB.link_title(cursor, note_id, note.title)
+            if note.tasks_loaded:
+                NotesDB.save_tasks(cursor, note_id, note.tasks)
+            conn.commit()
+        # Only once committed, so a retried save sees the note unchanged
+        if note.id is None:
+            note.created_at = now
+        note.id = note_id
+        note.modified_at = now
+        if notify:
+            NotesDB.notify("save", [note_id])
+        return note_id
+
+    @staticmethod
+    def insert_notes(cursor, notes: List[Note]) -> List[int]:
+        # New notes in the caller's transaction, e.g. a batch of imported files
+        now = int(time.time())
+        for note in notes:
+            cursor.execute(
+                """
+                INSERT INTO notes (title, content, preview, mode, category_id, created_at, modified_at, pinned, color_tag)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    note.title,
+                    note.content,
+                    note_preview(note.content),
+                    note.mode,
+                    NotesDB.category_id(cursor, note.category),
+                    now,
+                    now,
+                    note.pinned,
+                    note.color_tag,
+                ),
+            )
+            note.id = cursor.lastrowid
+            note.created_at = note.modified_at = now
+            RevisionStore.record(cursor, note.id, None, note.content, now)
+            NotesDB.update_links(cursor, note.id, note.content)
+            NotesDB.link_title(cursor, note.id, note.title)
+            NotesDB.save_tasks(cursor, note.id, note.tasks)
+        return [note.id for note in notes]
+
+    @staticmethod
+    def fill_previews(cursor):
+        # Fills in missing previews, e.g. of notes inserted by other tools
+        while True:
+            rows = cursor.execute(
+                "SELECT id, substr(content, 1, ?) FROM notes "
+                "WHERE preview IS NULL LIMIT 500",
+                (PREVIEW_SOURCE,),
+            ).fetchall()
+            if not rows:
+                return
+            cursor.executemany(
+                "UPDATE notes SET preview=? WHERE id=?",
+                [(note_preview(content or ""), note_id) for note_id, content in rows],
+            )
+
+    @staticmethod
+    def save_tasks(cursor, note_id: int, tasks: TaskList):
+        # Writes only what changed; new tasks get their row id back
+        tasks.assign_positions()
+        stored = {
+            task_id: (content, bool(done), position)
+            for task_id, content, done, position in cursor.execute(
+                "SELECT id, content, done, position FROM tasks WHERE note_id=?",
+                (note_id,),
+            )
+        }
+        kept = set()
+        updates = []
+        added = []
+        for index, (task_id, content, done, position) in enumerate(tasks.entries()):
+            if task_id in stored and task_id not in kept:
+                kept.add(task_id)
+                if stored[task_id] != (content, bool(done), position):
+                    updates.append((content, done, position, task_id))
+            else:
+                added.append(index)
+        cursor.executemany(
+            "DELETE FROM tasks WHERE id=?",
+            [(task_id,) for task_id in stored.keys() - kept],
+        )
+        cursor.executemany(
+            "UPDATE tasks SET content=?, done=?, position=? WHERE id=?", updates
+        )
+        for index in added:
+            task = tasks[index]
+            cursor.execute(
+                "INSERT INTO tasks (note_id, content, done, position) VALUES (?, ?, ?, ?)",
+                (note_id, task.content, task.done, task.position),
+            )
+            task.id = cursor.lastrowid
+
+    @staticmethod
+    def load_note(note_id: int) -> Optional[Note]:
+        # Content and tasks are fetched when first used
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT id, title, mode, {NotesDB.CATEGORY_NAME},
+                created_at, modified_at, pinned, color_tag
+                FROM notes WHERE id=?
+            """,
+                (note_id,),
+            )
+            row = cursor.fetchone()
+        if not row:
             return None
-        note = Note(
+        return Note.unloaded(
             id=row[0],
             title=row[1],
-            content=row[2],
-            mode=row[3],
-            category=row[4],
-            created_at=row[5],
-            modified_at=row[6],
-            pinned=bool(row[7]),
-            color_tag=row[8],
-        )
-        cursor.execute("SELECT content, done FROM tasks WHERE note_id=?", (note_id,))
-        tasks = cursor.fetchall()
-        note.tasks = [TaskItem(content=task[0], done=bool(task[1])) for task in tasks]
-        conn.close()
-        return note
+            mode=row[2],
+            category=row[3],
+            created_at=row[4],
+            modified_at=row[5],
+            pinned=bool(row[6]),
+            color_tag=row[7],
+        )
+
+    @staticmethod
+    def load_content(note_id: Optional[int]) -> str:
+        if note_id is None:
+            return ""
+        with closing(get_connection()) as conn:
+            row = conn.execute(
+                "SELECT content FROM notes WHERE id=?", (note_id,)
+            ).fetchone()
+        return row[0] if row else ""
+
+    @staticmethod
+    def load_tasks(note_id: Optional[int]) -> TaskList:
+        if note_id is None:
+            return TaskList()
+        with closing(get_connection()) as conn:
+            tasks = TaskList.from_rows(
+                conn.execute(
+                    "SELECT id, content, done, position FROM tasks "
+                    "WHERE note_id=? ORDER BY position, id",
+                    (note_id,),
+                )
+            )
+        return tasks
 
     @staticmethod
     def load_all_notes() -> List[tuple]:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, title, category, modified_at, mode, pinned, color_tag
-            FROM notes 
-            ORDER BY pinned DESC, modified_at DESC
-        """)
-        notes = cursor.fetchall()
-        conn.close()
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, title, {NotesDB.CATEGORY_NAME}, modified_at, mode, pinned,
+                color_tag, {NotesDB.TASK_COUNTS}, {NotesDB.PREVIEW}
+                FROM notes
+                ORDER BY pinned DESC, modified_at DESC
+            """)
+            notes = cursor.fetchall()
         return notes
 
     @staticmethod
-    def delete_note(note_id: int):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM notes WHERE id=?", (note_id,))
-        cursor.execute("DELETE FROM tasks WHERE note_id=?", (note_id,))
-        conn.commit()
-        conn.close()
+    def delete_note(note_id: int, notify: bool = True):
+        NotesDB.delete_notes([note_id], notify)
 
     @staticmethod
-    def search_notes(query: str) -> List[tuple]:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+    def id_chunks(note_ids):
+        # Keeps IN-lists below SQLite's bound-parameter limit
+        note_ids = list(note_ids)
+        for start in range(0, len(note_ids), 500):
+            chunk = note_ids[start : start + 500]
+            yield chunk, ",".join("?" * len(chunk))
+
+    @staticmethod
+    @retry_on_busy
+    def delete_notes(
+        note_ids: List[int], notify: bool = True, merge_into: Optional[int] = None
+    ):
+        # With merge_into, attachments and links move to that note first
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            for chunk, placeholders in NotesDB.id_chunks(note_ids):
+                if merge_into is not None:
+                    for table, column in (
+                        ("attachments", "note_id"),
+                        ("links", "target_id"),
+                    ):
+                        cursor.execute(
+                            f"UPDATE {table} SET {column}=? WHERE {column} IN ({placeholders})",
+                            (merge_into, *chunk),
+                        )
+                cursor.execute(f"DELETE FROM notes WHERE id IN ({placeholders})", chunk)
+                cursor.execute(
+                    f"DELETE FROM tasks WHERE note_id IN ({placeholders})", chunk
+                )
+                cursor.execute(
+                    f"DELETE FROM revisions WHERE note_id IN ({placeholders})", chunk
+                )
+                cursor.execute(
+                    f"DELETE FROM links WHERE source_id IN ({placeholders})", chunk
+                )
+                # Links to a deleted note fall back to another note of that title
+                cursor.execute(
+                    f"""
+                    UPDATE links SET target_id = (
+                        SELECT id FROM notes WHERE links.target_title = notes.title
+                        ORDER BY modified_at DESC LIMIT 1
+                    )
+                    WHERE target_id IN ({placeholders})
+                """,
+                    chunk,
+                )
+                AttachmentStore.delete_for_notes(cursor, chunk)
+            conn.commit()
+        if notify:
+            NotesDB.notify("delete", list(note_ids))
+
+    @staticmethod
+    def _update_notes(cursor, note_ids: List[int], column: str, value) -> dict:
+        # Moves modified_at as save_note does; returns note_id -> modified_at,
+        # so a window with one of these notes open can keep saving it
+        now = int(time.time())
+        stamps = {}
+        for chunk, placeholders in NotesDB.id_chunks(note_ids):
+            cursor.execute(
+                f"""
+                UPDATE notes SET {column}=?, modified_at=MAX(?, modified_at + 1)
+                WHERE id IN ({placeholders})
+            """,
+                (value, now, *chunk),
+            )
+            cursor.execute(
+                f"SELECT id, modified_at FROM notes WHERE id IN ({placeholders})",
+                chunk,
+            )
+            stamps.update(cursor.fetchall())
+        return stamps
+
+    @staticmethod
+    @retry_on_busy
+    def set_pinned(note_ids: List[int], pinned: bool, notify: bool = True) -> dict:
+        with closing(get_connection()) as conn:
+            stamps = NotesDB._update_notes(
+                conn.cursor(), note_ids, "pinned", bool(pinned)
+            )
+            conn.commit()
+        if notify:
+            NotesDB.notify("save", list(note_ids))
+        return stamps
+
+    @staticmethod
+    @retry_on_busy
+    def set_color(note_ids: List[int], color_tag: str, notify: bool = True) -> dict:
+        with closing(get_connection()) as conn:
+            stamps = NotesDB._update_notes(
+                conn.cursor(), note_ids, "color_tag", color_tag
+            )
+            conn.commit()
+        if notify:
+            NotesDB.notify("save", list(note_ids))
+        return stamps
+
+    @staticmethod
+    @retry_on_busy
+    def set_category(note_ids: List[int], category: str, notify: bool = True) -> dict:
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            category_id = NotesDB.category_id(cursor, category)
+            stamps = NotesDB._update_notes(cursor, note_ids, "category_id", category_id)
+            conn.commit()
+        if notify:
+            NotesDB.notify("save", list(note_ids))
+        return stamps
+
+    @staticmethod
+    def find_note_by_title(cursor, title: str) -> Optional[int]:
+        # Titles need not be unique; the most recently edited note wins
         cursor.execute(
             """
-            SELECT id, title, category, modified_at, mode, pinned, color_tag
-            FROM notes 
-            WHERE title LIKE ? OR content LIKE ?
-            ORDER BY pinned DESC, modified_at DESC
+            SELECT id FROM notes WHERE title = ? COLLATE NOCASE
+            ORDER BY modified_at DESC LIMIT 1
         """,
-            (f"%{query}%", f"%{query}%"),
+            (title,),
         )
-        notes = cursor.fetchall()
-        conn.close()
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def update_links(cursor, note_id: int, content: str):
+        # Resolved links keep their target, so they survive renames
+        titles = {}
+        for match in NotesDB.WIKI_LINK.finditer(content):
+            title = match.group(1).strip()
+            if title:
+                titles.setdefault(title.casefold(), title)
+        cursor.execute(
+            "SELECT target_title, target_id FROM links WHERE source_id=?", (note_id,)
+        )
+        known = {
+            title.casefold(): target_id
+            for title, target_id in cursor.fetchall()
+            if target_id is not None
+        }
+        cursor.execute("DELETE FROM links WHERE source_id=?", (note_id,))
+        cursor.executemany(
+            "INSERT INTO links (source_id, target_id, target_title) VALUES (?, ?, ?)",
+            [
+                (
+                    note_id,
+                    known.get(key) or NotesDB.find_note_by_title(cursor, title),
+                    title,
+                )
+                for key, title in titles.items()
+            ],
+        )
+
+    @staticmethod
+    def link_title(cursor, note_id: int, title: str):
+        # Links waiting for this title now point to the note
+        cursor.execute(
+            "UPDATE links SET target_id=? WHERE target_id IS NULL AND target_title=?",
+            (note_id, title),
+        )
+
+    @staticmethod
+    def resolve_link(source_id: Optional[int], title: str) -> Optional[int]:
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT target_id FROM links
+                WHERE source_id=? AND target_title=? AND target_id IS NOT NULL
+            """,
+                (source_id, title),
+            )
+            row = cursor.fetchone()
+            # Links typed since the last save are looked up by title
+            note_id = row[0] if row else NotesDB.find_note_by_title(cursor, title)
+        return note_id
+
+    @staticmethod
+    def list_backlinks(note_id: int) -> List[tuple]:
+        # (id, title) of the notes linking to a note, most recently edited
+        # first
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT DISTINCT notes.id, notes.title, notes.modified_at
+                FROM links JOIN notes ON notes.id = links.source_id
+                WHERE links.target_id = ?
+                ORDER BY notes.modified_at DESC
+            """,
+                (note_id,),
+            )
+            backlinks = [(row[0], row[1]) for row in cursor.fetchall()]
+        return backlinks
+
+    @staticmethod
+    def search_notes(query: str) -> List[tuple]:
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT id, title, {NotesDB.CATEGORY_NAME}, modified_at, mode, pinned,
+                color_tag, {NotesDB.TASK_COUNTS}, {NotesDB.PREVIEW}
+                FROM notes
+                WHERE title LIKE ? OR content LIKE ?
+                ORDER BY pinned DESC, modified_at DESC
+            """,
+                (f"%{query}%", f"%{query}%"),
+            )
+            notes = cursor.fetchall()
         return notes
 
+    @staticmethod
+    def search_note_ids(query: str) -> List[int]:
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id FROM notes WHERE title LIKE ? OR content LIKE ?",
+                (f"%{query}%", f"%{query}%"),
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        return ids
+
+    @staticmethod
+    def fuzzy_search_note_ids(query: str) -> List[int]:
+        # Trigram candidates, re-ranked by edit distance to the query words
+        words = [word for word in WORD_PATTERN.findall(query.lower()) if len(word) >= 3]
+        if not FUZZY_SEARCH_AVAILABLE or not words:
+            return NotesDB.search_note_ids(query)
+        query_trigrams = set().union(*map(trigrams, words))
+        match = " OR ".join(f'"{trigram}"' for trigram in sorted(query_trigrams))
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT notes.id, notes.title, substr(notes.content, 1, ?)
+                FROM (
+                    SELECT rowid FROM notes_trigram
+                    WHERE notes_trigram MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                ) AS hits
+                JOIN notes ON notes.id = hits.rowid
+            """,
+                (FUZZY_TEXT_LIMIT, match, FUZZY_CANDIDATES),
+            )
+            rows = cursor.fetchall()
+        scored = []
+        for note_id, title, content in rows:
+            text = f"{title} {content}".lower()
+            overlap = sum(trigram in text for trigram in query_trigrams)
+            overlap /= len(query_trigrams)
+            if overlap >= 0.4:
+                scored.append((overlap, note_id, text))
+        scored.sort(key=lambda item: -item[0])
+        head = []
+        for overlap, note_id, text in scored[:FUZZY_RERANK]:
+            text_words = set(WORD_PATTERN.findall(text))
+            distance = sum(closest_word_distance(word, text_words) for word in words)
+            head.append((distance, -overlap, note_id))
+        head.sort()
+        return [note_id for _, _, note_id in head] + [
+            note_id for _, note_id, _ in scored[FUZZY_RERANK:]
+        ]
+
+    @staticmethod
+    def load_note_metadata(note_ids: Optional[List[int]] = None) -> List[tuple]:
+        # Everything the notes grid needs, without the note body
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            columns = (
+                f"id, title, {NotesDB.CATEGORY_NAME}, created_at, modified_at, mode, "
+                f"pinned, color_tag, {NotesDB.TASK_COUNTS}, {NotesDB.PREVIEW}"
+            )
+            if note_ids is None:
+                cursor.execute(f"SELECT {columns} FROM notes")
+                rows = cursor.fetchall()
+            else:
+                rows = []
+                for chunk, placeholders in NotesDB.id_chunks(note_ids):
+                    cursor.execute(
+                        f"SELECT {columns} FROM notes WHERE id IN ({placeholders})",
+                        chunk,
+                    )
+                    rows.extend(cursor.fetchall())
+        return rows
+
+    @staticmethod
+    def list_open_tasks(after: Optional[tuple] = None, limit: int = 100) -> List[tuple]:
+        # Unchecked tasks by note; pass the (note_id, position, task_id) of
+        # the last row to continue
+        keyset = "AND (tasks.note_id, tasks.position, tasks.id) > (?, ?, ?)"
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT tasks.id, tasks.note_id, notes.title, tasks.content, tasks.position
+                FROM tasks JOIN notes ON notes.id = tasks.note_id
+                WHERE tasks.done = 0 {keyset if after else ""}
+                ORDER BY tasks.note_id, tasks.position, tasks.id LIMIT ?
+            """,
+                (*(after or ()), limit),
+            )
+            tasks = cursor.fetchall()
+        return tasks
+
     @staticmethod
     def get_categories() -> List[str]:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT category FROM notes WHERE category != ""')
-        categories = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return sorted(categories)
+        return [name for name, count in NotesDB.list_categories()]
+
+    @staticmethod
+    def list_categories() -> List[tuple]:
+        # (name, note_count) sorted by name, straight from the counters
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT name, note_count FROM categories WHERE note_count > 0 ORDER BY name"
+            )
+            categories = cursor.fetchall()
+        return categories
+
+    @staticmethod
+    def category_id(cursor, name: str) -> Optional[int]:
+        # Looks up a category by name, creating it if needed
+        if not name:
+            return None
+        cursor.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (name,))
+        cursor.execute("SELECT id FROM categories WHERE name=?", (name,))
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    @retry_on_busy
+    def rename_category(old_name: str, new_name: str) -> List[int]:
+        # Renaming onto an existing category merges the two; returns the ids
+        # of the affected notes
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM categories WHERE name=?", (old_name,))
+            row = cursor.fetchone()
+            if row is None or old_name == new_name:
+                return []
+            old_id = row[0]
+            cursor.execute("SELECT id FROM notes WHERE category_id=?", (old_id,))
+            note_ids = [note_id for (note_id,) in cursor.fetchall()]
+            cursor.execute("SELECT id FROM categories WHERE name=?", (new_name,))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    "UPDATE categories SET name=? WHERE id=?", (new_name, old_id)
+                )
+            else:
+                # The old category is pruned once its last note has moved
+                cursor.execute(
+                    "UPDATE notes SET category_id=? WHERE category_id=?",
+                    (row[0], old_id),
+                )
+            conn.commit()
+        NotesDB.notify("save", note_ids)
+        return note_ids
 
     @staticmethod
+    @retry_on_busy
     def save_setting(key: str, value: str):
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO settings (key, value)
+                VALUES (?, ?)
+            """,
+                (key, value),
+            )
+            conn.commit()
+
+    @staticmethod
+    def load_setting(key: str, default: str = "") -> str:
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM settings WHERE key=?", (key,))
+            row = cursor.fetchone()
+        return row[0] if row else default
+
+
+class ChangeWatcher:
+    # Notes changed by other connections, via PRAGMA data_version and the
+    # note_changes log
+    def __init__(self):
+        self.conn = get_connection()
+        self.data_version = self._data_version()
+        row = self.conn.execute("SELECT MAX(seq) FROM note_changes").fetchone()
+        self.last_seq = row[0] or 0
+
+    def _data_version(self) -> int:
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def poll(self) -> Optional[List[int]]:
+        # None when nothing was committed since the last poll
+        data_version = self._data_version()
+        if data_version == self.data_version:
+            return None
+        self.data_version = data_version
+        rows = self.conn.execute(
+            "SELECT seq, note_id FROM note_changes WHERE seq > ? ORDER BY seq",
+            (self.last_seq,),
+        ).fetchall()
+        if rows:
+            self.last_seq = rows[-1][0]
+        return list(dict.fromkeys(note_id for _, note_id in rows))
+
+    def close(self):
+        self.conn.close()
+
+
+# ──────────────────────────────────────────────
+# Revision History
+# ──────────────────────────────────────────────
+
+
+class RevisionStore:
+    # Revisions are zlib-compressed line deltas with a full copy every
+    # KEYFRAME_INTERVAL saves
+    KEYFRAME_INTERVAL = 20
+    THIN_EVERY = 50  # saves of a note between retention passes
+    KEEP_ALL_FOR = 86400  # seconds during which every revision is kept
+    KEEP_DAILY_FOR = 30 * 86400  # then one per day, afterwards one per week
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+    @staticmethod
+    def make_delta(old: str, new: str) -> list:
+        # [start, end] copies lines of the old text, a string is inserted
+        old_lines = old.splitlines(keepends=True)
+        new_lines = new.splitlines(keepends=True)
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        ops = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                ops.append([i1, i2])
+            elif tag in ("replace", "insert"):
+                ops.append("".join(new_lines[j1:j2]))
+        return ops
+
+    @staticmethod
+    def apply_delta(old: str, ops: list) -> str:
+        old_lines = old.splitlines(keepends=True)
+        parts = []
+        for op in ops:
+            if isinstance(op, str):
+                parts.append(op)
+            else:
+                parts.extend(old_lines[op[0] : op[1]])
+        return "".join(parts)
+
+    @staticmethod
+    def encode(previous: Optional[str], content: str) -> tuple:
+        # Returns (is_keyframe, data)
+        keyframe = zlib.compress(content.encode())
+        if previous is None:
+            return True, keyframe
+        delta = zlib.compress(
+            json.dumps(
+                RevisionStore.make_delta(previous, content), separators=(",", ":")
+            ).encode()
+        )
+        if len(delta) >= len(keyframe):
+            return True, keyframe
+        return False, delta
+
+    @staticmethod
+    def decode(depth: int, data: bytes, previous: Optional[str]) -> str:
+        if depth == 0:
+            return zlib.decompress(data).decode()
+        return RevisionStore.apply_delta(previous, json.loads(zlib.decompress(data)))
+
+    @staticmethod
+    def record(cursor, note_id: int, previous_content, content: str, now: int):
+        # Runs inside NotesDB.save_note's transaction
+        content_hash = RevisionStore.content_hash(content)
         cursor.execute(
             """
-            INSERT OR REPLACE INTO settings (key, value)
-            VALUES (?, ?)
+            SELECT depth, content_hash FROM revisions
+            WHERE note_id=? ORDER BY id DESC LIMIT 1
         """,
-            (key, value),
+            (note_id,),
+        )
+        last = cursor.fetchone()
+        if last and last[1] == content_hash:
+            return
+        # Keep the replaced content first if no revision holds it
+        if previous_content is not None:
+            previous_hash = RevisionStore.content_hash(previous_content)
+            if previous_hash != content_hash and (
+                last is None or last[1] != previous_hash
+            ):
+                cursor.execute(
+                    """
+                    INSERT INTO revisions (note_id, created_at, depth, size, content_hash, data)
+                    VALUES (?, ?, 0, ?, ?, ?)
+                """,
+                    (
+                        note_id,
+                        now,
+                        len(previous_content),
+                        previous_hash,
+                        RevisionStore.encode(None, previous_content)[1],
+                    ),
+                )
+                last = (0, previous_hash)
+        # A delta needs the previous revision to be the replaced content
+        usable = (
+            last is not None
+            and previous_content is not None
+            and last[0] < RevisionStore.KEYFRAME_INTERVAL - 1
+            and RevisionStore.content_hash(previous_content) == last[1]
+        )
+        is_keyframe, data = RevisionStore.encode(
+            previous_content if usable else None, content
+        )
+        cursor.execute(
+            """
+            INSERT INTO revisions (note_id, created_at, depth, size, content_hash, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            (
+                note_id,
+                now,
+                0 if is_keyframe else last[0] + 1,
+                len(content),
+                content_hash,
+                data,
+            ),
+        )
+        cursor.execute("SELECT COUNT(*) FROM revisions WHERE note_id=?", (note_id,))
+        if cursor.fetchone()[0] % RevisionStore.THIN_EVERY == 0:
+            RevisionStore.thin(cursor, note_id, now)
+
+    @staticmethod
+    def list_revisions(
+        note_id: int, before_id: Optional[int] = None, limit: int = 50
+    ) -> List[tuple]:
+        # (id, created_at, size) newest first, without touching the data
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT id, created_at, size FROM revisions
+                WHERE note_id=? AND id < ?
+                ORDER BY id DESC LIMIT ?
+            """,
+                (note_id, before_id if before_id is not None else sys.maxsize, limit),
+            )
+            revisions = cursor.fetchall()
+        return revisions
+
+    @staticmethod
+    def load_revision(revision_id: int) -> Optional[str]:
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT note_id, depth FROM revisions WHERE id=?", (revision_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            note_id, depth = row
+            # The revision plus the deltas and keyframe it is built on
+            cursor.execute(
+                """
+                SELECT depth, data FROM revisions
+                WHERE note_id=? AND id<=?
+                ORDER BY id DESC LIMIT ?
+            """,
+                (note_id, revision_id, depth + 1),
+            )
+            chain = cursor.fetchall()[::-1]
+        content = None
+        for depth, data in chain:
+            content = RevisionStore.decode(depth, data, content)
+        return content
+
+    @staticmethod
+    def retained(created: List[int], now: int) -> List[bool]:
+        # Everything recent, then the newest per day for a month, then per week
+        keep = []
+        seen_buckets = set()
+        for index in range(len(created) - 1, -1, -1):
+            age = now - created[index]
+            if index == len(created) - 1 or age < RevisionStore.KEEP_ALL_FOR:
+                keep.append(True)
+                continue
+            if age < RevisionStore.KEEP_DAILY_FOR:
+                bucket = ("day", created[index] // 86400)
+            else:
+                bucket = ("week", created[index] // (7 * 86400))
+            keep.append(bucket not in seen_buckets)
+            seen_buckets.add(bucket)
+        return keep[::-1]
+
+    @staticmethod
+    def thin(cursor, note_id: int, now: int) -> int:
+        # Applies the retention policy; returns the number removed
+        cursor.execute(
+            "SELECT id, created_at, depth, data FROM revisions WHERE note_id=? ORDER BY id",
+            (note_id,),
+        )
+        rows = cursor.fetchall()
+        keep = RevisionStore.retained([row[1] for row in rows], now)
+        if all(keep):
+            return 0
+        content = None
+        previous_kept = None
+        depth = 0
+        rewrite = False
+        for (revision_id, _, old_depth, data), kept in zip(rows, keep):
+            content = RevisionStore.decode(old_depth, data, content)
+            if not kept:
+                cursor.execute("DELETE FROM revisions WHERE id=?", (revision_id,))
+                rewrite = True
+                continue
+            if rewrite:
+                usable = (
+                    previous_kept is not None
+                    and depth < RevisionStore.KEYFRAME_INTERVAL - 1
+                )
+                is_keyframe, new_data = RevisionStore.encode(
+                    previous_kept if usable else None, content
+                )
+                depth = 0 if is_keyframe else depth + 1
+                cursor.execute(
+                    "UPDATE revisions SET depth=?, data=? WHERE id=?",
+                    (depth, new_data, revision_id),
+                )
+            else:
+                depth = old_depth
+            previous_kept = content
+        return keep.count(False)
+
+    @staticmethod
+    @retry_on_busy
+    def apply_retention() -> int:
+        # Thins the history of every note; returns revisions removed
+        now = int(time.time())
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT note_id FROM revisions")
+            removed = 0
+            for (note_id,) in cursor.fetchall():
+                removed += RevisionStore.thin(cursor, note_id, now)
+            conn.commit()
+        return removed
+
+
+# ──────────────────────────────────────────────
+# Attachments
+# ──────────────────────────────────────────────
+
+
+class AttachmentStore:
+    # Files are streamed through blob I/O and shared by SHA-256
+    CHUNK_SIZE = 1 << 20
+    HEADER_SIZE = 1 << 16  # bytes read to sniff metadata
+    THUMBNAIL_SIZE = 96
+    THUMBNAIL_SOURCE_LIMIT = 16 << 20  # larger images get no thumbnail
+
+    @staticmethod
+    def format_size(size: int) -> str:
+        for unit in ("B", "KB", "MB"):
+            if size < 1024:
+                return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} GB"
+
+    @staticmethod
+    def describe(metadata: Optional[dict]) -> str:
+        if not metadata:
+            return ""
+        if "width" in metadata:
+            return f"{metadata['width']}×{metadata['height']}"
+        if "entries" in metadata:
+            return f"{metadata['entries']} files"
+        return metadata.get("first_line", "")[:40]
+
+    @staticmethod
+    def file_digest(path: str) -> tuple:
+        # (sha256 hex digest, size) of a file
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray(AttachmentStore.CHUNK_SIZE)
+        view = memoryview(buffer)
+        with open(path, "rb") as source:
+            while count := source.readinto(buffer):
+                digest.update(view[:count])
+                size += count
+        return digest.hexdigest(), size
+
+    @staticmethod
+    @retry_on_busy
+    def add(note_id: int, path: str) -> int:
+        content_hash, size = AttachmentStore.file_digest(path)
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id FROM attachment_blobs WHERE sha256=?", (content_hash,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                try:
+                    cursor.execute(
+                        """
+                        INSERT INTO attachment_blobs (sha256, size, data)
+                        VALUES (?, ?, zeroblob(?))
+                    """,
+                        (content_hash, size, size),
+                    )
+                except sqlite3.IntegrityError:
+                    # Another window stored the same file since the SELECT
+                    cursor.execute(
+                        "SELECT id FROM attachment_blobs WHERE sha256=?",
+                        (content_hash,),
+                    )
+                    row = cursor.fetchone()
+            if row:
+                blob_id = row[0]
+            else:
+                blob_id = cursor.lastrowid
+                digest = hashlib.sha256()
+                buffer = bytearray(AttachmentStore.CHUNK_SIZE)
+                view = memoryview(buffer)
+                written = 0
+                with (
+                    open(path, "rb") as source,
+                    conn.blobopen("attachment_blobs", "data", blob_id) as blob,
+                ):
+                    while written < size and (
+                        count := source.readinto(
+                            view[: min(len(buffer), size - written)]
+                        )
+                    ):
+                        blob.write(view[:count])
+                        digest.update(view[:count])
+                        written += count
+                if written != size or digest.hexdigest() != content_hash:
+                    conn.rollback()
+                    raise ValueError(f"{path} changed while it was being attached")
+            cursor.execute(
+                """
+                INSERT INTO attachments (note_id, blob_id, filename, mime_type, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                (
+                    note_id,
+                    blob_id,
+                    os.path.basename(path),
+                    mimetypes.guess_type(path)[0] or "application/octet-stream",
+                    int(time.time()),
+                ),
+            )
+            attachment_id = cursor.lastrowid
+            conn.commit()
+        return attachment_id
+
+    @staticmethod
+    def list_attachments(note_id: int) -> List[tuple]:
+        # (id, filename, mime_type, size, metadata or None)
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT a.id, a.filename, a.mime_type, b.size, p.metadata
+                FROM attachments a
+                JOIN attachment_blobs b ON b.id = a.blob_id
+                LEFT JOIN attachment_previews p ON p.blob_id = a.blob_id
+                WHERE a.note_id=?
+                ORDER BY a.id
+            """,
+                (note_id,),
+            )
+            rows = cursor.fetchall()
+        return [
+            (row[0], row[1], row[2], row[3], json.loads(row[4]) if row[4] else None)
+            for row in rows
+        ]
+
+    @staticmethod
+    def _blob_id(cursor, attachment_id: int) -> Optional[int]:
+        cursor.execute("SELECT blob_id FROM attachments WHERE id=?", (attachment_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def export(attachment_id: int, path: str):
+        with closing(get_connection()) as conn:
+            blob_id = AttachmentStore._blob_id(conn.cursor(), attachment_id)
+            if blob_id is None:
+                raise ValueError("The attachment was removed in another window")
+            with (
+                conn.blobopen(
+                    "attachment_blobs", "data", blob_id, readonly=True
+                ) as blob,
+                open(path, "wb") as target,
+            ):
+                while chunk := blob.read(AttachmentStore.CHUNK_SIZE):
+                    target.write(chunk)
+
+    @staticmethod
+    @retry_on_busy
+    def remove(attachment_id: int):
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            blob_id = AttachmentStore._blob_id(cursor, attachment_id)
+            cursor.execute("DELETE FROM attachments WHERE id=?", (attachment_id,))
+            AttachmentStore._delete_orphans(cursor, [blob_id])
+            conn.commit()
+
+    @staticmethod
+    def delete_for_notes(cursor, note_ids: List[int]):
+        # Runs inside NotesDB.delete_notes's transaction
+        placeholders = ",".join("?" * len(note_ids))
+        cursor.execute(
+            f"SELECT DISTINCT blob_id FROM attachments WHERE note_id IN ({placeholders})",
+            note_ids,
+        )
+        blob_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            f"DELETE FROM attachments WHERE note_id IN ({placeholders})", note_ids
+        )
+        AttachmentStore._delete_orphans(cursor, blob_ids)
+
+    @staticmethod
+    def _delete_orphans(cursor, blob_ids: List[int]):
+        for blob_id in blob_ids:
+            cursor.execute(
+                """
+                DELETE FROM attachment_blobs WHERE id=?
+                AND NOT EXISTS (SELECT 1 FROM attachments WHERE blob_id=?)
+            """,
+                (blob_id, blob_id),
+            )
+            if cursor.rowcount:
+                cursor.execute(
+                    "DELETE FROM attachment_previews WHERE blob_id=?", (blob_id,)
+                )
+
+    @staticmethod
+    def sniff_metadata(blob, mime_type: str) -> dict:
+        header = blob.read(AttachmentStore.HEADER_SIZE)
+        metadata = {}
+        if header.startswith(b"\x89PNG\r\n\x1a\n") and len(header) >= 24:
+            metadata["width"] = int.from_bytes(header[16:20], "big")
+            metadata["height"] = int.from_bytes(header[20:24], "big")
+        elif header[:6] in (b"GIF87a", b"GIF89a") and len(header) >= 10:
+            metadata["width"] = int.from_bytes(header[6:8], "little")
+            metadata["height"] = int.from_bytes(header[8:10], "little")
+        elif header.startswith(b"\xff\xd8"):
+            # Walk the JPEG segments up to the first start-of-frame marker
+            position = 2
+            while position + 9 < len(header) and header[position] == 0xFF:
+                marker = header[position + 1]
+                length = int.from_bytes(header[position + 2 : position + 4], "big")
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    metadata["height"] = int.from_bytes(
+                        header[position + 5 : position + 7], "big"
+                    )
+                    metadata["width"] = int.from_bytes(
+                        header[position + 7 : position + 9], "big"
+                    )
+                    break
+                position += 2 + length
+        elif header.startswith(b"PK\x03\x04"):
+            blob.seek(0)
+            try:
+                # zipfile only reads the central directory at the end
+                with zipfile.ZipFile(blob) as archive:
+                    metadata["entries"] = len(archive.infolist())
+            except zipfile.BadZipFile:
+                pass
+        elif mime_type.startswith("text/") or (header and b"\x00" not in header[:1024]):
+            first_line = header.split(b"\n", 1)[0][:200]
+            metadata["first_line"] = first_line.decode(errors="replace").strip()
+        return metadata
+
+    @staticmethod
+    @retry_on_busy
+    def metadata(attachment_id: int) -> Optional[dict]:
+        # Sniffed from the start of the blob once, then cached per blob
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT a.blob_id, a.mime_type, p.metadata
+                FROM attachments a
+                LEFT JOIN attachment_previews p ON p.blob_id = a.blob_id
+                WHERE a.id=?
+            """,
+                (attachment_id,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                # Removed by another window since it was listed
+                return None
+            blob_id, mime_type, cached = row
+            if cached is not None:
+                return json.loads(cached)
+            with conn.blobopen(
+                "attachment_blobs", "data", blob_id, readonly=True
+            ) as blob:
+                metadata = AttachmentStore.sniff_metadata(blob, mime_type)
+            cursor.execute(
+                """
+                INSERT INTO attachment_previews (blob_id, metadata) VALUES (?, ?)
+                ON CONFLICT (blob_id) DO UPDATE SET metadata = excluded.metadata
+            """,
+                (blob_id, json.dumps(metadata)),
+            )
+            conn.commit()
+        return metadata
+
+    @staticmethod
+    def load_thumbnail_source(attachment_id: int) -> tuple:
+        # (cached thumbnail, bytes of a small PNG/GIF to build one from)
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT a.blob_id, a.mime_type, b.size, p.thumbnail
+                FROM attachments a
+                JOIN attachment_blobs b ON b.id = a.blob_id
+                LEFT JOIN attachment_previews p ON p.blob_id = a.blob_id
+                WHERE a.id=?
+            """,
+                (attachment_id,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None, None
+            blob_id, mime_type, size, thumbnail = row
+            source = None
+            if (
+                thumbnail is None
+                and mime_type in ("image/png", "image/gif")
+                and size <= AttachmentStore.THUMBNAIL_SOURCE_LIMIT
+            ):
+                with conn.blobopen(
+                    "attachment_blobs", "data", blob_id, readonly=True
+                ) as blob:
+                    source = blob.read()
+        return thumbnail, source
+
+    @staticmethod
+    @retry_on_busy
+    def save_thumbnail(attachment_id: int, thumbnail: bytes):
+        with closing(get_connection()) as conn:
+            cursor = conn.cursor()
+            blob_id = AttachmentStore._blob_id(cursor, attachment_id)
+            if blob_id is None:
+                return
+            cursor.execute(
+                """
+                INSERT INTO attachment_previews (blob_id, thumbnail) VALUES (?, ?)
+                ON CONFLICT (blob_id) DO UPDATE SET thumbnail = excluded.thumbnail
+            """,
+                (blob_id, thumbnail),
+            )
+            conn.commit()
+
+
+# ──────────────────────────────────────────────
+# Backups
+# ──────────────────────────────────────────────
+
+
+class BackupManager:
+    # Online backups in small steps on a worker thread, verified before
+    # rotation
+    PAGES_PER_STEP = 256
+    SNAPSHOT_PREFIX = "notes-"
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(
+            os.path.dirname(os.path.abspath(DB_FILE)), "backups"
+        )
+        # (pages copied, total pages) updates for the UI
+        self.progress = queue.Queue()
+        self.lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.lock.locked()
+
+    def list_snapshots(self) -> List[tuple]:
+        # (path, size, mtime) newest first
+        if not os.path.isdir(self.directory):
+            return []
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if name.startswith(self.SNAPSHOT_PREFIX) and name.endswith(".db"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                snapshots.append((path, stat.st_size, int(stat.st_mtime)))
+        return sorted(
+            snapshots, key=lambda snapshot: (snapshot[2], snapshot[0]), reverse=True
+        )
+
+    def _copy(self, source, target, pages: int = 0, after_first_step=None) -> dict:
+        # after_first_step runs once the target is locked, before any commit
+        steps = []
+        last = time.perf_counter()
+
+        def progress(status, remaining, total):
+            nonlocal last, after_first_step
+            now = time.perf_counter()
+            steps.append(now - last)
+            if after_first_step:
+                after_first_step()
+                after_first_step = None
+                now = time.perf_counter()
+            last = now
+            self.progress.put((total - remaining, total))
+
+        started = time.perf_counter()
+        source.backup(target, pages=pages or self.PAGES_PER_STEP, progress=progress)
+        duration = time.perf_counter() - started
+        return {
+            "steps": len(steps),
+            "pages": source.execute("PRAGMA page_count").fetchone()[0],
+            "step_avg_ms": 1000 * sum(steps) / len(steps) if steps else 0.0,
+            "step_max_ms": 1000 * max(steps) if steps else 0.0,
+            "duration": duration,
+        }
+
+    @staticmethod
+    def verify(path: str) -> bool:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            result = conn.execute("PRAGMA integrity_check").fetchall()
+        except sqlite3.DatabaseError:
+            return False
+        finally:
+            conn.close()
+        return result == [("ok",)]
+
+    def create_snapshot(self, keep: int = 7, label: str = "") -> dict:
+        # Returns the snapshot path, step count, per-step cost and duration
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError("A backup or restore is already running")
+        try:
+            report = self._snapshot(label)
+            self.rotate(keep)
+            return report
+        finally:
+            self.lock.release()
+
+    def _snapshot(self, label: str) -> dict:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.SNAPSHOT_PREFIX}{datetime.now():%Y%m%d-%H%M%S}{label}.db"
+        path = os.path.join(self.directory, name)
+        partial = path + ".partial"
+        source = get_connection()
+        target = sqlite3.connect(partial)
+        try:
+            report = self._copy(source, target)
+            # Back to a rollback journal, so the snapshot stays one file
+            target.execute("PRAGMA journal_mode=DELETE").fetchall()
+        finally:
+            target.close()
+            source.close()
+        started = time.perf_counter()
+        if not self.verify(partial):
+            os.remove(partial)
+            raise sqlite3.DatabaseError("Snapshot failed its integrity check")
+        report["verify_duration"] = time.perf_counter() - started
+        os.replace(partial, path)
+        report["path"] = path
+        return report
+
+    def rotate(self, keep: int):
+        # Safety snapshots taken before a restore are not rotated away
+        scheduled = [
+            snapshot
+            for snapshot in self.list_snapshots()
+            if not snapshot[0].endswith("-pre-restore.db")
+        ]
+        for path, _, _ in scheduled[keep:]:
+            os.remove(path)
+            # Left next to snapshots taken before they were single files
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def restore(self, path: str) -> dict:
+        # The safety snapshot is taken under the restore's write lock, so no
+        # write falls between the two
+        if not self.verify(path):
+            raise sqlite3.DatabaseError("Snapshot failed its integrity check")
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError("A backup or restore is already running")
+        try:
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            target = get_connection()
+            try:
+                page_count = source.execute("PRAGMA page_count").fetchone()[0]
+                if page_count < 2:
+                    raise sqlite3.DatabaseError("Snapshot is empty")
+                safety = {}
+
+                def take_safety_snapshot():
+                    safety.update(self._snapshot("-pre-restore"))
+
+                # At least two steps: the last one commits
+                report = self._copy(
+                    source,
+                    target,
+                    pages=min(self.PAGES_PER_STEP, page_count - 1),
+                    after_first_step=take_safety_snapshot,
+                )
+                report["safety_path"] = safety["path"]
+                report["safety_duration"] = safety["duration"]
+                return report
+            finally:
+                target.close()
+                source.close()
+        finally:
+            self.lock.release()
+
+
+# ──────────────────────────────────────────────
+# Markdown Sync
+# ──────────────────────────────────────────────
+
+
+class MarkdownSync:
+    # Mirrors notes as .md files in a folder on a background thread
+    POLL_INTERVAL = 5.0
+    # More removals than this in one pass wait for the user to confirm
+    MASS_REMOVAL_SHARE = 0.1
+    MASS_REMOVAL_MIN = 3
+    TASK_PATTERN = re.compile(r"^- \[([ xX])\] (.*)$")
+    UNSAFE_NAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_error = None
+        self.manifest = {}  # path -> [note_id, note_modified, mtime_ns, size, hash]
+        self.paths = {}  # note_id -> path
+        self.unsynced = None  # title -> ids of notes without a file
+        self.conn = None
+        # Vanished files whose notes are kept for now; "delete" or "restore"
+        self.held_removals = []
+        self.removal_decision = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Waits for a pass in progress, so the manifest can be reset safely
+        self.stop_event.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=10)
+
+    @staticmethod
+    def reset():
+        # The manifest only describes one folder
+        conn = get_connection()
+        conn.execute("DELETE FROM sync_manifest")
+        conn.commit()
+        conn.close()
+        NotesDB.save_setting("markdown_sync_seq", "0")
+
+    @staticmethod
+    def render(note: Note) -> str:
+        # Front matter values are JSON strings, which YAML reads as well
+        lines = ["---", f"title: {json.dumps(note.title, ensure_ascii=False)}"]
+        if note.category:
+            lines.append(f"category: {json.dumps(note.category, ensure_ascii=False)}")
+        lines.append(f"mode: {note.mode}")
+        lines.append(f"pinned: {'true' if note.pinned else 'false'}")
+        if note.color_tag and note.color_tag != "default":
+            lines.append(f"color: {json.dumps(note.color_tag)}")
+        lines += ["---", "", note.content.rstrip("\n")]
+        # Tasks hidden in Notes mode would be read back as content
+        if note.mode == "task" and note.tasks:
+            lines.append("")
+            for content, done in note.tasks.rows():
+                lines.append(f"- [{'x' if done else ' '}] {content}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def parse(text: str, fallback_title: str) -> Note:
+        text = text.replace("\r\n", "\n")
+        meta = {}
+        body = text
+        if text.startswith("---\n"):
+            end = text.find("\n---", 3)
+            if end != -1:
+                for line in text[4:end].splitlines():
+                    key, _, value = line.partition(":")
+                    value = value.strip()
+                    if value.startswith('"'):
+                        try:
+                            value = json.loads(value)
+                        except ValueError:
+                            value = value.strip('"')
+                    meta[key.strip()] = value
+                body = text[end + 4 :].lstrip("\n")
+        note = Note(
+            title=str(meta.get("title") or fallback_title),
+            category=str(meta.get("category", "")),
+            mode="task" if meta.get("mode") == "task" else "normal",
+            pinned=meta.get("pinned") == "true",
+            color_tag=str(meta.get("color") or "default"),
+        )
+        lines = body.rstrip("\n").split("\n")
+        # Only a task note has a task list; other checkbox lines are content
+        if note.mode == "task":
+            start = len(lines)
+            while start and MarkdownSync.TASK_PATTERN.match(lines[start - 1]):
+                start -= 1
+            if start == 0 or not lines[start - 1]:
+                for line in lines[start:]:
+                    match = MarkdownSync.TASK_PATTERN.match(line)
+                    note.tasks.append(
+                        TaskItem(content=match.group(2), done=match.group(1) != " ")
+                    )
+                del lines[start:]
+        note.content = "\n".join(lines).rstrip("\n")
+        return note
+
+    def file_name(self, title: str) -> str:
+        base = self.UNSAFE_NAME.sub("-", title).strip(" .")[:80] or "Untitled"
+        name = f"{base}.md"
+        counter = 2
+        while name in self.manifest or os.path.exists(os.path.join(self.folder, name)):
+            name = f"{base} ({counter}).md"
+            counter += 1
+        return name
+
+    def run(self):
+        try:
+            self.load_manifest()
+        except sqlite3.Error as error:
+            self.last_error = str(error)
+            return
+        while not self.stop_event.is_set():
+            try:
+                self.import_files()
+                self.export_notes()
+                self.last_error = None
+            except (OSError, sqlite3.Error, NoteConflictError) as error:
+                # Folder unplugged or similar; retried on the next poll
+                self.last_error = str(error)
+            self.stop_event.wait(self.POLL_INTERVAL)
+        self.conn.close()
+
+    def load_manifest(self):
+        # The connection belongs to the sync thread
+        self.conn = get_connection()
+        rows = self.conn.execute(
+            """
+            SELECT path, note_id, note_modified, file_mtime_ns, file_size, content_hash
+            FROM sync_manifest
+        """
+        ).fetchall()
+        self.manifest = {row[0]: list(row[1:]) for row in rows}
+        self.paths = {entry[0]: path for path, entry in self.manifest.items()}
+
+    def remember(self, path: str, note_id: int, note_modified, content_hash: str):
+        stat = os.stat(os.path.join(self.folder, path))
+        entry = [note_id, note_modified, stat.st_mtime_ns, stat.st_size, content_hash]
+        old_path = self.paths.get(note_id)
+        if old_path is not None and old_path != path:
+            self.forget(old_path)
+        previous = self.manifest.get(path)
+        if previous is not None and previous[0] != note_id:
+            self.paths.pop(previous[0], None)
+        self.manifest[path] = entry
+        self.paths[note_id] = path
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO sync_manifest
+            (path, note_id, note_modified, file_mtime_ns, file_size, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            (path, *entry),
+        )
+        self.conn.commit()
+
+    def forget(self, path: str):
+        entry = self.manifest.pop(path, None)
+        if entry is not None and self.paths.get(entry[0]) == path:
+            del self.paths[entry[0]]
+        self.conn.execute("DELETE FROM sync_manifest WHERE path=?", (path,))
+        self.conn.commit()
+
+    def import_files(self):
+        # One directory listing; only files whose mtime or size moved are read
+        self.unsynced = None
+        seen = set()
+        changed = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".md") or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                known = self.manifest.get(entry.name)
+                if not known or known[2:4] != [stat.st_mtime_ns, stat.st_size]:
+                    changed.append((entry.name, known))
+        # A new file with the content of a vanished one was renamed
+        missing = {
+            entry[4]: path for path, entry in self.manifest.items() if path not in seen
+        }
+        for path, known in changed:
+            self.import_file(path, known, missing)
+        removed = list(missing.values())
+        decision, self.removal_decision = self.removal_decision, None
+        if decision == "restore":
+            for path in removed:
+                note_id = self.manifest[path][0]
+                self.forget(path)
+                self.export_note(note_id)
+            removed = []
+        elif decision != "delete" and len(removed) > max(
+            self.MASS_REMOVAL_MIN, self.MASS_REMOVAL_SHARE * len(self.manifest)
+        ):
+            self.held_removals = removed
+            return
+        self.held_removals = []
+        for path in removed:
+            self.file_removed(path)
+
+    def import_file(self, path: str, known: Optional[list], missing: dict):
+        with open(os.path.join(self.folder, path), encoding="utf-8") as file:
+            text = file.read()
+        content_hash = RevisionStore.content_hash(text)
+        if known and known[4] == content_hash:
+            # Touched but unchanged
+            self.remember(path, known[0], known[1], content_hash)
+            return
+        if not known and content_hash in missing:
+            entry = self.manifest[missing.pop(content_hash)]
+            self.remember(path, entry[0], entry[1], content_hash)
+            return
+        note = self.parse(text, os.path.splitext(path)[0])
+        current = NotesDB.load_note(known[0]) if known else None
+        if current is not None and current.modified_at == known[1]:
+            # Edited only on disk: update the note in place
+            note.id = current.id
+            note.created_at = current.created_at
+            note.modified_at = current.modified_at
+            if note.mode != "task":
+                # The file has no task list to take the hidden tasks from
+                note.tasks = current.tasks
+            NotesDB.save_note(note, notify=False)
+            self.remember(path, note.id, note.modified_at, content_hash)
+            return
+        if current is not None:
+            # Edited on both sides: the disk version becomes a new note
+            note.title = f"{note.title} (conflicted copy)"
+            NotesDB.save_note(note, notify=False)
+            self.export_note(current.id)
+            return
+        # A file exported earlier from this library is adopted, not duplicated
+        candidates = self.unsynced_notes().get(note.title, [])
+        for note_id in candidates:
+            candidate = NotesDB.load_note(note_id)
+            if candidate and RevisionStore.content_hash(self.render(candidate)) == (
+                content_hash
+            ):
+                candidates.remove(note_id)
+                self.remember(path, note_id, candidate.modified_at, content_hash)
+                return
+        # A new file, or the file of a note that has since been deleted
+        NotesDB.save_note(note, notify=False)
+        self.remember(path, note.id, note.modified_at, content_hash)
+
+    def unsynced_notes(self) -> dict:
+        if self.unsynced is None:
+            self.unsynced = {}
+            conn = get_connection()
+            for note_id, title in conn.execute("SELECT id, title FROM notes"):
+                if note_id not in self.paths:
+                    self.unsynced.setdefault(title, []).append(note_id)
+            conn.close()
+        return self.unsynced
+
+    def file_removed(self, path: str):
+        note_id, note_modified = self.manifest[path][:2]
+        note = NotesDB.load_note(note_id)
+        self.forget(path)
+        if note is None:
+            return
+        if note.modified_at == note_modified:
+            NotesDB.delete_note(note_id, notify=False)
+        else:
+            # Changed in the app after the file was deleted: keep it
+            self.export_note(note_id)
+
+    def export_notes(self):
+        conn = get_connection()
+        cursor = conn.cursor()
+        last_seq = int(NotesDB.load_setting("markdown_sync_seq", "0"))
+        oldest, newest = cursor.execute(
+            "SELECT MIN(seq), MAX(seq) FROM note_changes"
+        ).fetchone()
+        if newest is None or newest <= last_seq:
+            note_ids = []
+        elif last_seq and oldest <= last_seq + 1:
+            note_ids = [
+                note_id
+                for (note_id,) in cursor.execute(
+                    "SELECT DISTINCT note_id FROM note_changes WHERE seq > ?",
+                    (last_seq,),
+                )
+            ]
+        else:
+            # First run, or the log was pruned past us: compare every note
+            known = {entry[0]: entry[1] for entry in self.manifest.values()}
+            note_ids = [
+                note_id
+                for note_id, modified_at in cursor.execute(
+                    "SELECT id, modified_at FROM notes"
+                )
+                if known.get(note_id, -1) != modified_at
+            ]
+            existing = {
+                note_id for (note_id,) in cursor.execute("SELECT id FROM notes")
+            }
+            note_ids += [note_id for note_id in self.paths if note_id not in existing]
+        conn.close()
+        for note_id in note_ids:
+            self.export_note(note_id)
+        if newest is not None and newest != last_seq:
+            NotesDB.save_setting("markdown_sync_seq", str(newest))
+
+    def export_note(self, note_id: int):
+        note = NotesDB.load_note(note_id)
+        path = self.paths.get(note_id)
+        if note is None:
+            if path is None:
+                return
+            # Deleted in the app; an edited file is kept and imported again
+            known = self.manifest[path]
+            full_path = os.path.join(self.folder, path)
+            try:
+                with open(full_path, encoding="utf-8") as file:
+                    unchanged = RevisionStore.content_hash(file.read()) == known[4]
+                if unchanged:
+                    os.remove(full_path)
+            except FileNotFoundError:
+                pass
+            self.forget(path)
+            return
+        text = self.render(note)
+        content_hash = RevisionStore.content_hash(text)
+        if path is not None and self.manifest[path][4] == content_hash:
+            self.remember(path, note_id, note.modified_at, content_hash)
+            return
+        if path is None:
+            path = self.file_name(note.title)
+        # Written next to the target and renamed; .tmp keeps it out of scans
+        handle, temp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(handle, "w", encoding="utf-8", newline="\n") as file:
+            file.write(text)
+        os.replace(temp_path, os.path.join(self.folder, path))
+        self.remember(path, note_id, note.modified_at, content_hash)
+
+
+# ──────────────────────────────────────────────
+# Idle Maintenance
+# ──────────────────────────────────────────────
+
+
+class MaintenanceScheduler:
+    # Runs generator jobs in small slices while the user is idle
+    IDLE_AFTER = 120  # seconds without input
+    CHECK_INTERVAL = 5000  # ms between idle checks
+    STEP_BUDGET = 0.03  # seconds of work per Tk loop turn
+    VACUUM_PAGES = 256  # pages freed per incremental vacuum step
+    VACUUM_THRESHOLD = 256  # free pages before a vacuum is worth it
+    TASK_GAP = 1e-6  # task positions closer than this get renumbered
+    LOG_LIMIT = 500
+
+    def __init__(self, widget, last_activity):
+        # last_activity() returns the time.monotonic() of the last input
+        self.widget = widget
+        self.last_activity = last_activity
+        self.conn = get_connection()
+        self.jobs = {
+            "checkpoint": (600, self.job_checkpoint),
+            "optimize": (3600, self.job_optimize),
+            "analyze": (86400, self.job_analyze),
+            "fts_merge": (86400, self.job_fts_merge),
+            "revisions": (86400, self.job_revisions),
+            "change_log": (86400, self.job_change_log),
+            "task_positions": (86400, self.job_task_positions),
+            "vacuum": (3600, self.job_vacuum),
+        }
+        self.current = None
+        self.closed = False
+
+    def start(self):
+        self.widget.after(self.CHECK_INTERVAL, self.tick)
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+    def is_idle(self) -> bool:
+        return time.monotonic() - self.last_activity() >= self.IDLE_AFTER
+
+    def tick(self):
+        if self.closed:
+            return
+        busy = self.is_idle() and self.run_slice()
+        self.widget.after(10 if busy else self.CHECK_INTERVAL, self.tick)
+
+    def vacuum_due(self) -> bool:
+        # incremental_vacuum frees nothing until vacuum_database_job has run
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return False
+        free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return free_pages >= self.VACUUM_THRESHOLD
+
+    def file_bytes(self) -> int:
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def next_due_job(self) -> Optional[str]:
+        now = int(time.time())
+        for name, (interval, _) in self.jobs.items():
+            last = int(NotesDB.load_setting(f"maintenance_{name}", "0"))
+            if now - last < interval:
+                continue
+            if name == "vacuum" and not self.vacuum_due():
+                continue
+            return name
+        return None
+
+    def run_slice(self) -> bool:
+        # Returns True while there is more work to do
+        deadline = time.perf_counter() + self.STEP_BUDGET
+        while time.perf_counter() < deadline:
+            if self.current is None:
+                name = self.next_due_job()
+                if name is None:
+                    return False
+                self.current = {
+                    "name": name,
+                    "steps": self.jobs[name][1](),
+                    "count": 0,
+                    "elapsed": 0.0,
+                    "size_before": self.file_bytes(),
+                }
+            job = self.current
+            started = time.perf_counter()
+            try:
+                next(job["steps"])
+                finished = False
+            except StopIteration:
+                finished = True
+            except sqlite3.OperationalError:
+                # Database busy elsewhere; the job is not logged as run and
+                # starts over on the next idle slice
+                job["steps"].close()
+                self.conn.rollback()
+                self.current = None
+                return True
+            job["elapsed"] += time.perf_counter() - started
+            job["count"] += 1
+            if finished:
+                self.finish(job)
+                self.current = None
+        return True
+
+    def finish(self, job: dict):
+        reclaimed = max(0, job["size_before"] - self.file_bytes())
+        NotesDB.save_setting(f"maintenance_{job['name']}", str(int(time.time())))
+        self.conn.execute(
+            """
+            INSERT INTO maintenance_log (job, finished_at, steps, duration_ms, reclaimed_bytes)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            (
+                job["name"],
+                int(time.time()),
+                job["count"],
+                job["elapsed"] * 1000,
+                reclaimed,
+            ),
+        )
+        self.conn.execute(
+            "DELETE FROM maintenance_log WHERE id <= (SELECT MAX(id) FROM maintenance_log) - ?",
+            (self.LOG_LIMIT,),
+        )
+        self.conn.commit()
+
+    def recent_log(self, limit: int = 100) -> List[tuple]:
+        # (job, finished_at, steps, duration_ms, reclaimed_bytes) newest first
+        return self.conn.execute(
+            """
+            SELECT job, finished_at, steps, duration_ms, reclaimed_bytes
+            FROM maintenance_log ORDER BY id DESC LIMIT ?
+        """,
+            (limit,),
+        ).fetchall()
+
+    def job_checkpoint(self):
+        # PASSIVE never waits for readers in other instances
+        self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        yield
+
+    def job_optimize(self):
+        self.conn.execute("PRAGMA analysis_limit=400")
+        self.conn.execute("PRAGMA optimize")
+        yield
+
+    def job_analyze(self):
+        self.conn.execute("PRAGMA analysis_limit=1000")
+        tables = self.conn.execute(
+            """
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+            AND sql NOT LIKE 'CREATE VIRTUAL%' AND name NOT LIKE 'notes_trigram_%'
+        """
+        ).fetchall()
+        for (table,) in tables:
+            self.conn.execute(f'ANALYZE "{table}"')
+            yield
+
+    def job_fts_merge(self):
+        if not FUZZY_SEARCH_AVAILABLE:
+            return
+        while True:
+            before = self.conn.total_changes
+            self.conn.execute(
+                "INSERT INTO notes_trigram (notes_trigram, rank) VALUES ('merge', 64)"
+            )
+            self.conn.commit()
+            # FTS5 signals that nothing is left to merge this way
+            if self.conn.total_changes - before < 2:
+                return
+            yield
+
+    def job_revisions(self):
+        now = int(time.time())
+        cursor = self.conn.cursor()
+        note_ids = cursor.execute("SELECT DISTINCT note_id FROM revisions").fetchall()
+        for (note_id,) in note_ids:
+            RevisionStore.thin(cursor, note_id, now)
+            self.conn.commit()
+            yield
+
+    def job_change_log(self):
+        # Other instances poll note_changes every second; a day is plenty
+        self.conn.execute(
+            "DELETE FROM note_changes WHERE changed_at < ?", (int(time.time()) - 86400,)
+        )
+        self.conn.commit()
+        yield
+
+    def job_task_positions(self):
+        # Renumbers notes whose task position gaps got too small
+        note_ids = self.conn.execute(
+            """
+            SELECT DISTINCT note_id FROM (
+                SELECT note_id, position - LAG(position) OVER (
+                    PARTITION BY note_id ORDER BY position
+                ) AS gap
+                FROM tasks
+            ) WHERE gap < ?
+        """,
+            (self.TASK_GAP,),
+        ).fetchall()
+        for (note_id,) in note_ids:
+            task_ids = self.conn.execute(
+                "SELECT id FROM tasks WHERE note_id=? ORDER BY position, id",
+                (note_id,),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE tasks SET position=? WHERE id=?",
+                [
+                    (float(number), task_id)
+                    for number, (task_id,) in enumerate(task_ids, 1)
+                ],
+            )
+            self.conn.commit()
+            yield
+
+    def job_vacuum(self):
+        free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        while free_pages:
+            # execute() would only step the pragma once and free one page
+            self.conn.executescript(f"PRAGMA incremental_vacuum({self.VACUUM_PAGES})")
+            yield
+            left = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if left >= free_pages:
+                # Nothing was freed, e.g. another instance holds the pages
+                break
+            free_pages = left
+        # Shrinking the WAL makes the reclaimed space visible on disk
+        self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+
+
+# ──────────────────────────────────────────────
+# Duplicate Notes
+# ──────────────────────────────────────────────
+
+
+def _minhash_coefficients(count: int, seed: int) -> tuple:
+    # a < 2**31 and b < 2**32 keep a * h + b inside 64 bits for 32-bit h
+    generator = random.Random(seed)
+    return (
+        [generator.randrange(1, 2**31) for _ in range(count)],
+        [generator.randrange(0, 2**32) for _ in range(count)],
+    )
+
+
+class DuplicateFinder:
+    # Near-duplicate notes by MinHash with locality-sensitive hashing;
+    # signatures are cached per modified_at
+    SHINGLE = 3  # words per shingle
+    PERMUTATIONS = 128
+    BANDS = 16  # of 8 values: pairs at 0.8 similarity meet with p ≈ 0.95
+    THRESHOLD = 0.8
+    PAIRWISE_LIMIT = 32  # members of larger buckets are compared to the first
+    CHUNK = 4096  # shingles hashed at once with numpy
+    PRIME = 4294967311  # first prime above 2**32
+    WORD = re.compile(r"\w+")
+    # Fixed seed: cached signatures stay comparable between runs
+    A, B = _minhash_coefficients(PERMUTATIONS, 1049)
+    if np is not None:
+        A_ARRAY = np.array(A, dtype=np.uint64)[:, None]
+        B_ARRAY = np.array(B, dtype=np.uint64)[:, None]
+
+    @classmethod
+    def shingle_hashes(cls, content: str) -> List[int]:
+        words = cls.WORD.findall(content.lower())
+        count = max(1, len(words) - cls.SHINGLE + 1)
+        return list(
+            {
+                zlib.crc32(" ".join(words[i : i + cls.SHINGLE]).encode())
+                for i in range(count)
+            }
+            if words
+            else ()
+        )
+
+    @classmethod
+    def signature(cls, hashes: List[int]) -> bytes:
+        # Packed uint32 minimums; numpy and plain Python give the same bytes
+        if np is not None:
+            minimums = np.full(cls.PERMUTATIONS, cls.PRIME, dtype=np.uint64)
+            for start in range(0, len(hashes), cls.CHUNK):
+                values = np.array(hashes[start : start + cls.CHUNK], dtype=np.uint64)
+                np.minimum(
+                    minimums,
+                    ((cls.A_ARRAY * values + cls.B_ARRAY) % cls.PRIME).min(axis=1),
+                    out=minimums,
+                )
+            return (minimums & 0xFFFFFFFF).astype("<u4").tobytes()
+        minimums = array(
+            "I",
+            (
+                min((a * h + b) % cls.PRIME for h in hashes) & 0xFFFFFFFF
+                for a, b in zip(cls.A, cls.B)
+            ),
+        )
+        if sys.byteorder == "big":
+            minimums.byteswap()
+        return minimums.tobytes()
+
+    @staticmethod
+    def similarity(first: bytes, second: bytes) -> float:
+        # Share of equal minimums estimates the Jaccard similarity
+        a, b = memoryview(first).cast("I"), memoryview(second).cast("I")
+        return sum(map(operator.eq, a, b)) / len(a)
+
+    @classmethod
+    def refresh_signatures(cls, conn, context=None) -> int:
+        # Returns how many signatures were recomputed
+        conn.execute(
+            "DELETE FROM minhash_signatures WHERE note_id NOT IN (SELECT id FROM notes)"
+        )
+        conn.commit()
+        stale = [
+            row[0]
+            for row in conn.execute("""
+                SELECT notes.id FROM notes
+                LEFT JOIN minhash_signatures ON minhash_signatures.note_id = notes.id
+                WHERE minhash_signatures.modified_at IS NOT notes.modified_at
+            """)
+        ]
+        for start in range(0, len(stale), JobRunner.BATCH_SIZE):
+            if context and context.cancelled():
+                break
+            chunk = stale[start : start + JobRunner.BATCH_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = []
+            for note_id, content, modified_at in conn.execute(
+                f"SELECT id, content, modified_at FROM notes WHERE id IN ({placeholders})",
+                chunk,
+            ).fetchall():
+                hashes = cls.shingle_hashes(content or "")
+                # Empty notes get no signature and are never duplicates
+                rows.append(
+                    (note_id, modified_at, cls.signature(hashes) if hashes else None)
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO minhash_signatures VALUES (?, ?, ?)", rows
+            )
+            conn.commit()
+            if context:
+                context.report(start + len(chunk), len(stale))
+        return len(stale)
+
+    @classmethod
+    def find_clusters(cls, conn, context=None) -> Optional[List[list]]:
+        # Groups of [(note_id, similarity), ...]; None when cancelled
+        note_ids, signatures = [], []
+        for note_id, signature in conn.execute(
+            "SELECT note_id, signature FROM minhash_signatures "
+            "WHERE signature IS NOT NULL ORDER BY note_id"
+        ):
+            note_ids.append(note_id)
+            signatures.append(signature)
+        parent = list(range(len(note_ids)))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        best = {}  # index -> best similarity to another member
+        compared = set()
+        width = cls.PERMUTATIONS // cls.BANDS * 4
+        for band in range(cls.BANDS):
+            if context and context.cancelled():
+                return None
+            buckets = {}
+            for index, signature in enumerate(signatures):
+                key = signature[band * width : (band + 1) * width]
+                buckets.setdefault(key, []).append(index)
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                if len(members) <= cls.PAIRWISE_LIMIT:
+                    pairs = itertools.combinations(members, 2)
+                else:
+                    pairs = ((members[0], other) for other in members[1:])
+                for pair in pairs:
+                    if pair in compared:
+                        continue
+                    compared.add(pair)
+                    score = cls.similarity(signatures[pair[0]], signatures[pair[1]])
+                    if score < cls.THRESHOLD:
+                        continue
+                    for index in pair:
+                        best[index] = max(best.get(index, 0.0), score)
+                    parent[find(pair[0])] = find(pair[1])
+            if context:
+                context.report(band + 1, cls.BANDS)
+        groups = {}
+        for index in best:
+            groups.setdefault(find(index), []).append(
+                (note_ids[index], round(best[index], 3))
+            )
+        clusters = [
+            sorted(members, key=lambda member: -member[1])
+            for members in groups.values()
+        ]
+        clusters.sort(key=lambda members: (-len(members), -members[0][1]))
+        return clusters
+
+    @staticmethod
+    def merge(keeper: Note, others: List[Note]):
+        # Adds the lines and tasks of others that keeper does not have yet
+        lines = keeper.content.split("\n")
+        seen = set(lines)
+        for other in others:
+            for line in other.content.split("\n"):
+                if line.strip() and line not in seen:
+                    lines.append(line)
+                    seen.add(line)
+        keeper.content = "\n".join(lines)
+        known = {task.content for task in keeper.tasks}
+        for other in others:
+            for content, done in other.tasks.rows():
+                if content not in known:
+                    keeper.tasks.append(TaskItem(content=content, done=done))
+                    known.add(content)
+        keeper.pinned = keeper.pinned or any(other.pinned for other in others)
+
+
+# ──────────────────────────────────────────────
+# Background Jobs
+# ──────────────────────────────────────────────
+
+# Set in each worker process by _init_job_worker
+_job_progress = None
+_job_cancel_flags = None
+
+
+def _init_job_worker(progress, cancel_flags, db_file):
+    global _job_progress, _job_cancel_flags, DB_FILE
+    _job_progress = progress
+    _job_cancel_flags = cancel_flags
+    DB_FILE = db_file
+
+
+class JobContext:
+    # Handed to a job function inside the worker process
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.slot = job_id % JobRunner.MAX_JOBS
+
+    def report(self, done: int, total: int):
+        _job_progress.put((self.job_id, done, total))
+
+    def cancelled(self) -> bool:
+        return bool(_job_cancel_flags[self.slot])
+
+
+def _run_job(job_id: int, function, args: tuple):
+    return function(JobContext(job_id), *args)
+
+
+def vacuum_database_job(context: JobContext) -> str:
+    # The full VACUUM left pending by the version 2 migration
+    conn = get_connection()
+    try:
+        size_before = os.path.getsize(DB_FILE)
+        started = time.perf_counter()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        duration = time.perf_counter() - started
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        reclaimed = max(0, size_before - os.path.getsize(DB_FILE))
+        conn.execute("DELETE FROM settings WHERE key = 'vacuum_pending'")
+        conn.execute(
+            """
+            INSERT INTO maintenance_log (job, finished_at, steps, duration_ms, reclaimed_bytes)
+            VALUES ('full_vacuum', ?, 1, ?, ?)
+        """,
+            (int(time.time()), duration * 1000, reclaimed),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    context.report(1, 1)
+    return f"Database compacted, {AttachmentStore.format_size(reclaimed)} reclaimed"
+
+
+def verify_attachments_job(context: JobContext) -> str:
+    # Re-hashes every stored attachment and names the ones that are damaged
+    conn = get_connection()
+    blobs = conn.execute("SELECT id, sha256 FROM attachment_blobs").fetchall()
+    damaged = []
+    for done, (blob_id, expected) in enumerate(blobs, 1):
+        if context.cancelled():
+            break
+        digest = hashlib.sha256()
+        with conn.blobopen("attachment_blobs", "data", blob_id, readonly=True) as blob:
+            while chunk := blob.read(AttachmentStore.CHUNK_SIZE):
+                digest.update(chunk)
+        context.report(done, len(blobs))
+        if digest.hexdigest() != expected:
+            damaged.extend(
+                filename
+                for (filename,) in conn.execute(
+                    "SELECT filename FROM attachments WHERE blob_id=?", (blob_id,)
+                )
+            )
+    conn.close()
+    if damaged:
+        return "Damaged: " + ", ".join(damaged)
+    return f"{len(blobs)} attachments intact"
+
+
+def find_duplicates_job(context: JobContext):
+    # Refreshes MinHash signatures, then groups near copies
+    conn = get_connection()
+    try:
+        refreshed = DuplicateFinder.refresh_signatures(conn, context)
+        clusters = DuplicateFinder.find_clusters(conn, context)
+    finally:
+        conn.close()
+    if clusters is None:
+        return f"{refreshed} signatures updated"
+    notes = sum(len(members) for members in clusters)
+    return (
+        f"{len(clusters)} groups of near-duplicates ({notes} notes), "
+        f"{refreshed} signatures updated",
+        clusters,
+    )
+
+
+def reindex_search_job(context: JobContext) -> str:
+    # Rebuilds the full-text index, then the related-notes vector of every note
+    conn = get_connection()
+    try:
+        # FUZZY_SEARCH_AVAILABLE is only set in the app process
+        if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'notes_trigram'"
+        ).fetchone():
+            conn.execute("INSERT INTO notes_trigram (notes_trigram) VALUES ('rebuild')")
+            conn.commit()
+        note_ids = [row[0] for row in conn.execute("SELECT id FROM notes ORDER BY id")]
+        if np is None:
+            context.report(1, 1)
+            return "Search index rebuilt"
+        related = RelatedNotes()
+        related.vocabulary = dict(conn.execute("SELECT term, id FROM vector_terms"))
+        done = 0
+        for start in range(0, len(note_ids), JobRunner.BATCH_SIZE):
+            if context.cancelled():
+                break
+            batch = note_ids[start : start + JobRunner.BATCH_SIZE]
+            related.store(conn.cursor(), batch)
+            conn.commit()
+            done += len(batch)
+            context.report(done, len(note_ids))
+    finally:
+        conn.close()
+    return f"Search index rebuilt, {done} notes re-vectorized"
+
+
+def export_markdown_job(context: JobContext, folder: str) -> str:
+    # Writes every note to folder as a .md file; existing files are kept
+    names = MarkdownSync(folder)  # only used to pick free file names
+    written = 0
+    with closing(get_connection()) as conn:
+        note_ids = [row[0] for row in conn.execute("SELECT id FROM notes ORDER BY id")]
+        for chunk, placeholders in NotesDB.id_chunks(note_ids):
+            if context.cancelled():
+                break
+            tasks = {}
+            for note_id, content, done in conn.execute(
+                f"SELECT note_id, content, done FROM tasks WHERE note_id IN ({placeholders}) "
+                "ORDER BY position, id",
+                chunk,
+            ):
+                tasks.setdefault(note_id, []).append(
+                    TaskItem(content=content, done=bool(done))
+                )
+            rows = conn.execute(
+                f"""
+                SELECT id, title, content, mode, {NotesDB.CATEGORY_NAME}, pinned, color_tag
+                FROM notes WHERE id IN ({placeholders})
+            """,
+                chunk,
+            ).fetchall()
+            for note_id, title, content, mode, category, pinned, color_tag in rows:
+                note = Note(
+                    title=title,
+                    content=content or "",
+                    tasks=tasks.get(note_id),
+                    mode=mode,
+                    category=category,
+                    pinned=bool(pinned),
+                    color_tag=color_tag,
+                )
+                path = os.path.join(folder, names.file_name(title))
+                with open(path, "w", encoding="utf-8", newline="\n") as file:
+                    file.write(MarkdownSync.render(note))
+                written += 1
+            context.report(written, len(note_ids))
+    return f"{written} notes exported"
+
+
+def import_markdown_job(context: JobContext, folder: str) -> str:
+    # Adds every .md file in folder as a new note, one transaction per batch
+    paths = sorted(
+        name
+        for name in os.listdir(folder)
+        if name.endswith(".md") and os.path.isfile(os.path.join(folder, name))
+    )
+    imported = 0
+    with closing(get_connection()) as conn:
+        for start in range(0, len(paths), JobRunner.BATCH_SIZE):
+            if context.cancelled():
+                break
+            notes = []
+            for name in paths[start : start + JobRunner.BATCH_SIZE]:
+                with open(os.path.join(folder, name), encoding="utf-8") as file:
+                    text = file.read()
+                notes.append(MarkdownSync.parse(text, os.path.splitext(name)[0]))
+            NotesDB.insert_notes(conn.cursor(), notes)
+            conn.commit()
+            imported += len(notes)
+            context.report(imported, len(paths))
+    return f"{imported} notes imported"
+
+
+@dataclass
+class Job:
+    id: int
+    name: str
+    future: object
+    started: float
+    done: int = 0
+    total: int = 0
+    state: str = "running"  # running, done, cancelled or failed
+    message: str = ""
+    result: object = None  # data a job returned along with its message
+    on_done: object = None  # called with the job once it is done
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> Optional[float]:
+        rate = self.rate()
+        if not rate or not self.total:
+            return None
+        return (self.total - self.done) / rate
+
+
+class JobRunner:
+    # Runs CPU-heavy jobs in a process pool, with progress and cancelling
+    # polled from the Tk loop
+    MAX_JOBS = 16  # cancel flag slots
+    BATCH_SIZE = 200
+    POLL_INTERVAL = 200  # ms
+    # Offered in the jobs panel: label -> job function
+    JOBS = {
+        "Verify attachments": verify_attachments_job,
+        "Find duplicate notes": find_duplicates_job,
+        "Rebuild search index": reindex_search_job,
+        "Export notes as Markdown": export_markdown_job,
+        "Import Markdown files": import_markdown_job,
+    }
+    # Jobs that take a folder chosen when they are started
+    FOLDER_JOBS = (export_markdown_job, import_markdown_job)
+
+    def __init__(self, widget, on_change):
+        self.widget = widget
+        self.on_change = on_change  # called after any job update
+        # spawn behaves the same on every platform and never forks Tk
+        self.context = multiprocessing.get_context("spawn")
+        self.progress = self.context.Queue()
+        self.cancel_flags = self.context.Array("b", self.MAX_JOBS, lock=False)
+        self.executor = None
+        self.jobs = []
+        self.next_id = 1
+        self.polling = False
+
+    def submit(self, name: str, function, *args, on_done=None) -> Job:
+        if self.executor is None:
+            # Workers are only started once the first job is submitted
+            self.executor = ProcessPoolExecutor(
+                max_workers=max(1, (os.cpu_count() or 2) - 1),
+                mp_context=self.context,
+                initializer=_init_job_worker,
+                initargs=(self.progress, self.cancel_flags, os.path.abspath(DB_FILE)),
+            )
+        job_id = self.next_id
+        self.next_id += 1
+        self.cancel_flags[job_id % self.MAX_JOBS] = 0
+        future = self.executor.submit(_run_job, job_id, function, args)
+        job = Job(job_id, name, future, time.monotonic(), on_done=on_done)
+        self.jobs.append(job)
+        # Keep finished jobs around for a while, but not forever
+        finished = [job for job in self.jobs if job.state != "running"]
+        for old in finished[: max(0, len(finished) - 5)]:
+            self.jobs.remove(old)
+        if not self.polling:
+            self.polling = True
+            self.widget.after(self.POLL_INTERVAL, self.poll)
+        self.on_change()
+        return job
+
+    def cancel(self, job: Job):
+        self.cancel_flags[job.id % self.MAX_JOBS] = 1
+        # A job still waiting for a worker never starts
+        if job.future.cancel():
+            job.state = "cancelled"
+            self.on_change()
+
+    def running(self) -> List[Job]:
+        return [job for job in self.jobs if job.state == "running"]
+
+    def poll(self):
+        jobs = {job.id: job for job in self.jobs}
+        try:
+            while True:
+                job_id, done, total = self.progress.get_nowait()
+                if job_id in jobs:
+                    jobs[job_id].done = done
+                    jobs[job_id].total = total
+        except queue.Empty:
+            pass
+        for job in self.running():
+            if not job.future.done():
+                continue
+            error = job.future.exception()
+            if error is not None:
+                job.state = "failed"
+                job.message = str(error)
+            elif self.cancel_flags[job.id % self.MAX_JOBS]:
+                job.state = "cancelled"
+                result = job.future.result()
+                job.message = result[0] if isinstance(result, tuple) else result
+            else:
+                job.state = "done"
+                # Jobs return a message, or (message, data)
+                result = job.future.result()
+                if isinstance(result, tuple):
+                    job.message, job.result = result
+                else:
+                    job.message = result
+                if job.on_done:
+                    job.on_done(job)
+        self.on_change()
+        if self.running():
+            self.widget.after(self.POLL_INTERVAL, self.poll)
+        else:
+            self.polling = False
+
+    def shutdown(self):
+        for job in self.running():
+            self.cancel_flags[job.id % self.MAX_JOBS] = 1
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ──────────────────────────────────────────────
+# Scripting Server
+# ──────────────────────────────────────────────
+
+
+class RpcError(Exception):
+    # A JSON-RPC error object: {"code": code, "message": str(self)}
+    def __init__(self, code: int, message: str):
+        self.code = code
+        super().__init__(message)
+
+
+class RpcServer:
+    # Optional JSON-RPC 2.0 server for scripts on localhost or a Unix socket,
+    # one message per line. Calls run on one worker thread; every request
+    # needs the token written to DB_FILE + "-rpc-token".
+    MAX_LINE = 16 * 1024 * 1024  # bytes in one request or batch
+    MAX_PENDING = 256  # pipelined requests per connection awaiting a reply
+    LOOPBACK = ("127.0.0.1", "localhost", "::1")
+    PARSE_ERROR = -32700
+    INVALID_REQUEST = -32600
+    METHOD_NOT_FOUND = -32601
+    INVALID_PARAMS = -32602
+    INTERNAL_ERROR = -32603
+    UNAUTHORIZED = -32001
+    NOT_FOUND = -32004
+    CONFLICT = -32009
+    METADATA_FIELDS = (
+        "id",
+        "title",
+        "category",
+        "created_at",
+        "modified_at",
+        "mode",
+        "pinned",
+        "color_tag",
+        "task_total",
+        "task_done",
+        "preview",
+    )
+    NOTE_FIELDS = ("title", "content", "mode", "category", "pinned", "color_tag")
+
+    def __init__(self, address: str):
+        self.address = address
+        self.thread = None
+        self.loop = None
+        self.stopping = None
+        self.ready = threading.Event()
+        self.last_error = None
+        self.token = None
+        self.token_path = DB_FILE + "-rpc-token"
+        self.socket_path = None
+        self.worker = None
+        self.clients = {}  # handler task -> writer, per open connection
+        self.methods = {
+            "list": self.list_notes,
+            "search": self.search,
+            "get": self.get,
+            "create": self.create,
+            "update": self.update,
+            "toggle_task": self.toggle_task,
+        }
+
+    def start(self):
+        # Returns once the socket is bound, or with last_error set
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait(timeout=5)
+
+    def stop(self):
+        if self.loop and self.stopping:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+
+    def run(self):
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rpc")
+        try:
+            asyncio.run(self.serve())
+        except Exception as error:
+            self.last_error = str(error)
+            if self.token and os.path.exists(self.token_path):
+                os.remove(self.token_path)
+        finally:
+            self.worker.shutdown(wait=True)
+            self.ready.set()
+
+    def write_token(self):
+        self.token = secrets.token_urlsafe(32)
+        try:
+            os.remove(self.token_path)
+        except FileNotFoundError:
+            pass
+        # O_EXCL on a fresh file, so the mode is 0600 from the start
+        fd = os.open(self.token_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as file:
+            file.write(self.token + "\n")
+
+    @staticmethod
+    def is_socket(path: str) -> bool:
+        try:
+            return stat.S_ISSOCK(os.lstat(path).st_mode)
+        except FileNotFoundError:
+            return False
+
+    def bind_unix(self, path: str) -> socket.socket:
+        if os.path.lexists(path):
+            if not self.is_socket(path):
+                raise ValueError(f"{path} exists and is not a socket")
+            os.remove(path)  # left behind by an instance that crashed
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Created 0600, so only this user may ever connect
+        previous_umask = os.umask(0o177)
+        try:
+            sock.bind(path)
+        except OSError:
+            sock.close()
+            raise
+        finally:
+            os.umask(previous_umask)
+        self.socket_path = path
+        return sock
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.write_token()
+        if self.address.startswith("unix:"):
+            sock = self.bind_unix(self.address[len("unix:") :])
+            server = await asyncio.start_unix_server(
+                self.handle, sock=sock, limit=self.MAX_LINE
+            )
+        else:
+            host, _, port = self.address.rpartition(":")
+            host = host.strip("[]") or "127.0.0.1"
+            if host not in self.LOOPBACK:
+                raise ValueError(f"Only localhost can be served, not {host}")
+            server = await asyncio.start_server(
+                self.handle, host, int(port), limit=self.MAX_LINE
+            )
+        self.ready.set()
+        async with server:
+            await self.stopping.wait()
+            # Let each handler see its connection end and finish cleanly
+            for writer in self.clients.values():
+                writer.close()
+            await asyncio.gather(*self.clients, return_exceptions=True)
+        if self.socket_path and self.is_socket(self.socket_path):
+            os.remove(self.socket_path)
+        if os.path.exists(self.token_path):
+            os.remove(self.token_path)
+
+    async def handle(self, reader, writer):
+        pending = asyncio.Semaphore(self.MAX_PENDING)
+        tasks = set()
+        self.clients[asyncio.current_task()] = writer
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_LINE; the stream cannot be resynced
+                    self.send(writer, self.error(None, self.PARSE_ERROR, "Too long"))
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    # Not a JSON-RPC client, e.g. a browser's HTTP request
+                    self.send(
+                        writer, self.error(None, self.PARSE_ERROR, "Invalid JSON")
+                    )
+                    break
+                await pending.acquire()
+                task = asyncio.create_task(self.respond(message, writer, pending))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def respond(self, message, writer, pending):
+        try:
+            # One worker, so replies leave in the order requests arrived
+            reply = await self.loop.run_in_executor(self.worker, self.dispatch, message)
+            if reply is not None and not writer.is_closing():
+                self.send(writer, reply)
+                await writer.drain()
+        finally:
+            pending.release()
+
+    @staticmethod
+    def send(writer, reply):
+        writer.write(json.dumps(reply, ensure_ascii=False).encode() + b"\n")
+
+    @staticmethod
+    def error(request_id, code: int, message: str) -> dict:
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "error": {"code": code, "message": message},
+        }
+
+    def dispatch(self, message):
+        if isinstance(message, list):
+            if not message:
+                return self.error(None, self.INVALID_REQUEST, "Empty batch")
+            replies = [self.call(request) for request in message]
+            # Notifications get no reply, and an all-notification batch none at all
+            return [reply for reply in replies if reply is not None] or None
+        return self.call(message)
+
+    def call(self, request) -> Optional[dict]:
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return self.error(None, self.INVALID_REQUEST, "Expected a method")
+        request_id = request.get("id")
+        token = request.get("token")
+        if not isinstance(token, str) or not hmac.compare_digest(
+            token.encode(), self.token.encode()
+        ):
+            # Answered even for notifications, so the caller learns why
+            return self.error(request_id, self.UNAUTHORIZED, "Missing or wrong token")
+        params = request.get("params", {})
+        try:
+            method = self.methods.get(request["method"])
+            if method is None:
+                raise RpcError(
+                    self.METHOD_NOT_FOUND, f"No method {request['method']!r}"
+                )
+            if isinstance(params, dict):
+                result = method(**params)
+            elif isinstance(params, list):
+                result = method(*params)
+            else:
+                raise RpcError(self.INVALID_PARAMS, "params must be an object or array")
+        except RpcError as error:
+            reply = self.error(request_id, error.code, str(error))
+        except NoteConflictError as error:
+            reply = self.error(request_id, self.CONFLICT, str(error))
+        except (TypeError, ValueError) as error:
+            # Includes QueryError and unexpected or missing params
+            reply = self.error(request_id, self.INVALID_PARAMS, str(error))
+        except Exception as error:
+            reply = self.error(request_id, self.INTERNAL_ERROR, str(error))
+        else:
+            reply = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        return reply if "id" in request else None
+
+    # Methods
+
+    @staticmethod
+    def summaries(rows: List[tuple]) -> List[dict]:
+        # Pinned first, then newest, like the notes grid
+        rows.sort(key=lambda row: (not row[6], -to_epoch(row[4]), row[0]))
+        return [dict(zip(RpcServer.METADATA_FIELDS, row)) for row in rows]
+
+    def list_notes(
+        self, category: Optional[str] = None, limit: int = 0, offset: int = 0
+    ):
+        query = SearchQuery("")
+        ids = query.note_ids(category) if category is not None else None
+        rows = self.summaries(NotesDB.load_note_metadata(ids))
+        return rows[offset : offset + limit if limit else None]
+
+    def search(self, query: str, category: Optional[str] = None, limit: int = 0):
+        ids = SearchQuery(query).note_ids(category)
+        rows = self.summaries(NotesDB.load_note_metadata(ids))
+        return rows[:limit] if limit else rows
+
+    def load(self, note_id: int) -> Note:
+        note = NotesDB.load_note(note_id)
+        if note is None:
+            raise RpcError(self.NOT_FOUND, f"No note {note_id}")
+        return note
+
+    @staticmethod
+    def describe(note: Note) -> dict:
+        return {
+            "id": note.id,
+            "title": note.title,
+            "content": note.content,
+            "mode": note.mode,
+            "category": note.category,
+            "pinned": note.pinned,
+            "color_tag": note.color_tag,
+            "created_at": note.created_at,
+            "modified_at": note.modified_at,
+            "tasks": [
+                {"content": content, "done": bool(done)}
+                for content, done in note.tasks.rows()
+            ],
+        }
+
+    def get(self, id: int):
+        return self.describe(self.load(id))
+
+    @staticmethod
+    def task_items(tasks) -> List[TaskItem]:
+        # Each task is a string or {"content": ..., "done": ...}
+        items = []
+        for task in tasks:
+            if isinstance(task, str):
+                items.append(TaskItem(content=task))
+            elif isinstance(task, dict) and isinstance(task.get("content"), str):
+                items.append(
+                    TaskItem(content=task["content"], done=bool(task.get("done")))
+                )
+            else:
+                raise ValueError(f"Not a task: {task!r}")
+        return items
+
+    def apply_fields(self, note: Note, fields: dict):
+        for key, value in fields.items():
+            if key == "tasks":
+                note.tasks = self.task_items(value)
+            elif key not in self.NOTE_FIELDS:
+                raise ValueError(f"Unknown field {key!r}")
+            elif key == "pinned":
+                note.pinned = bool(value)
+            elif not isinstance(value, str):
+                raise ValueError(f"{key} must be a string")
+            elif key == "mode" and value not in ("normal", "task"):
+                raise ValueError("mode must be 'normal' or 'task'")
+            else:
+                setattr(note, key, value)
+
+    def create(self, title: str, **fields):
+        note = Note(title=title)
+        self.apply_fields(note, fields)
+        NotesDB.save_note(note, notify=False)
+        return {"id": note.id, "modified_at": note.modified_at}
+
+    def update(self, id: int, modified_at: Optional[int] = None, **fields):
+        # With modified_at a later save is a conflict; without it, it wins
+        note = self.load(id)
+        if modified_at is not None:
+            note.modified_at = modified_at
+        self.apply_fields(note, fields)
+        NotesDB.save_note(note, force=modified_at is None, notify=False)
+        return {"id": note.id, "modified_at": note.modified_at}
+
+    def toggle_task(self, id: int, index: int, done: Optional[bool] = None):
+        note = self.load(id)
+        if not 0 <= index < len(note.tasks):
+            raise RpcError(self.NOT_FOUND, f"Note {id} has no task {index}")
+        task = note.tasks[index]
+        task.done = not task.done if done is None else bool(done)
+        # Fails rather than overwriting a save made after the load
+        NotesDB.save_note(note, notify=False)
+        return {"id": note.id, "done": task.done, "modified_at": note.modified_at}
+
+
+# ──────────────────────────────────────────────
+# In-Memory Note Index
+# ──────────────────────────────────────────────
+
+
+def to_epoch(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    # Rows written by external tools with the old CURRENT_TIMESTAMP default
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return 0
+
+
+class NoteIndex:
+    # Note metadata in parallel arrays, one slot per note
+    ORDERS = ("pinned", "title", "created")
+    FLAG_PINNED = 1
+    FLAG_TASK = 2
+    # Matches scored per pattern, the most recently modified ones
+    MATCH_CANDIDATES = 400
+    # Events touching more notes re-sort the orders once
+    BULK_EVENT = 64
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ids = array("q")
+        self.created = array("q")
+        self.modified = array("q")
+        self.flags = array("B")
+        self.category_refs = array("I")
+        self.color_refs = array("I")
+        self.task_totals = array("I")
+        self.task_done = array("I")
+        self.titles = []
+        self.previews = []
+        self.row_of = {}
+        # Interned category and colour strings, referenced by position
+        self.strings = []
+        self.string_refs = {}
+        self.category_counts = {}
+        self.sort_keys = {
+            "pinned": self._pinned_key,
+            "title": self._title_key,
+            "created": self._created_key,
+        }
+        self.orders = {name: [] for name in self.ORDERS}
+        self.title_blob = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, note_id):
+        return note_id in self.row_of
+
+    def _pinned_key(self, note_id):
+        row = self.row_of[note_id]
+        return (-(self.flags[row] & self.FLAG_PINNED), -self.modified[row], -note_id)
+
+    def _title_key(self, note_id):
+        return (self.titles[self.row_of[note_id]].casefold(), note_id)
+
+    def _created_key(self, note_id):
+        return (-self.created[self.row_of[note_id]], -note_id)
+
+    def _intern(self, value: str) -> int:
+        ref = self.string_refs.get(value)
+        if ref is None:
+            ref = len(self.strings)
+            self.strings.append(sys.intern(value))
+            self.string_refs[value] = ref
+        return ref
+
+    def _count_category(self, ref: int, delta: int):
+        count = self.category_counts.get(ref, 0) + delta
+        if count:
+            self.category_counts[ref] = count
+        else:
+            self.category_counts.pop(ref, None)
+
+    def _columns(self):
+        return (
+            self.ids,
+            self.created,
+            self.modified,
+            self.flags,
+            self.category_refs,
+            self.color_refs,
+            self.task_totals,
+            self.task_done,
+            self.titles,
+            self.previews,
+        )
+
+    def _append_slot(self, note_id: int) -> int:
+        for column in self._columns():
+            column.append(0)
+        self.titles[-1] = ""
+        self.previews[-1] = ""
+        self.ids[-1] = note_id
+        row = len(self.ids) - 1
+        self.row_of[note_id] = row
+        return row
+
+    def _write_row(self, row, values):
+        (
+            note_id,
+            title,
+            category,
+            created_at,
+            modified_at,
+            mode,
+            pinned,
+            color_tag,
+            task_total,
+            task_done,
+            preview,
+        ) = values
+        flags = (self.FLAG_PINNED if pinned else 0) | (
+            self.FLAG_TASK if mode == "task" else 0
+        )
+        category_ref = self._intern(category or "")
+        self.created[row] = to_epoch(created_at)
+        self.modified[row] = to_epoch(modified_at)
+        self.flags[row] = flags
+        self.category_refs[row] = category_ref
+        self.color_refs[row] = self._intern(color_tag or "default")
+        self.task_totals[row] = task_total
+        self.task_done[row] = task_done
+        self.titles[row] = title
+        self.previews[row] = preview
+        self._count_category(category_ref, 1)
+
+    def load(self, rows: List[tuple]):
+        self.clear()
+        for values in rows:
+            self._write_row(self._append_slot(values[0]), values)
+        for name, key in self.sort_keys.items():
+            self.orders[name] = sorted(self.ids, key=key)
+
+    def upsert(self, values: tuple, relink: bool = True):
+        # relink=False leaves the sort orders to _resort()
+        note_id = values[0]
+        row = self.row_of.get(note_id)
+        if row is None:
+            row = self._append_slot(note_id)
+        else:
+            if relink:
+                self._unlink(note_id)
+            self._count_category(self.category_refs[row], -1)
+        self._write_row(row, values)
+        if relink:
+            for name, key in self.sort_keys.items():
+                insort(self.orders[name], note_id, key=key)
+        self.title_blob = None
+
+    def _unlink(self, note_id: int):
+        # Must run while the row still holds the values it was sorted by
+        for name, key in self.sort_keys.items():
+            order = self.orders[name]
+            position = bisect_left(order, key(note_id), key=key)
+            if position < len(order) and order[position] == note_id:
+                del order[position]
+
+    def remove(self, note_id: int, relink: bool = True):
+        row = self.row_of.get(note_id)
+        if row is None:
+            return
+        if relink:
+            self._unlink(note_id)
+        self._count_category(self.category_refs[row], -1)
+        last = len(self.ids) - 1
+        if row != last:
+            self.row_of[self.ids[last]] = row
+            for column in self._columns():
+                column[row] = column[last]
+        for column in self._columns():
+            column.pop()
+        del self.row_of[note_id]
+        self.title_blob = None
+
+    def _resort(self, note_ids: set):
+        # Re-sorts the given notes into every order
+        for name, key in self.sort_keys.items():
+            order = [
+                note_id for note_id in self.orders[name] if note_id not in note_ids
+            ]
+            order.extend(note_id for note_id in note_ids if note_id in self.row_of)
+            order.sort(key=key)
+            self.orders[name] = order
+
+    def apply_event(self, event: str, note_ids: List[int]):
+        relink = len(note_ids) <= self.BULK_EVENT
+        if event == "delete":
+            for note_id in note_ids:
+                self.remove(note_id, relink)
+        else:
+            rows = NotesDB.load_note_metadata(note_ids)
+            for values in rows:
+                self.upsert(values, relink)
+            # Ids that no longer exist were deleted behind our back
+            found = {values[0] for values in rows}
+            for note_id in note_ids:
+                if note_id not in found:
+                    self.remove(note_id, relink)
+        if not relink:
+            self._resort(set(note_ids))
+
+    def metadata(self, note_id: int) -> Optional[tuple]:
+        # Same shape as NotesDB.load_note_metadata
+        row = self.row_of.get(note_id)
+        if row is None:
+            return None
+        flags = self.flags[row]
+        return (
+            note_id,
+            self.titles[row],
+            self.strings[self.category_refs[row]],
+            self.created[row],
+            self.modified[row],
+            "task" if flags & self.FLAG_TASK else "normal",
+            flags & self.FLAG_PINNED,
+            self.strings[self.color_refs[row]],
+            self.task_totals[row],
+            self.task_done[row],
+            self.previews[row],
+        )
+
+    def is_current(self, values: tuple) -> bool:
+        # True if a load_note_metadata row matches what the index holds
+        (
+            note_id,
+            title,
+            category,
+            created_at,
+            modified_at,
+            mode,
+            pinned,
+            color_tag,
+            task_total,
+            task_done,
+            preview,
+        ) = values
+        return self.metadata(note_id) == (
+            note_id,
+            title,
+            category or "",
+            to_epoch(created_at),
+            to_epoch(modified_at),
+            "task" if mode == "task" else "normal",
+            self.FLAG_PINNED if pinned else 0,
+            color_tag or "default",
+            task_total,
+            task_done,
+            preview,
+        )
+
+    def row(self, note_id: int) -> tuple:
+        # Same shape as NotesDB.load_all_notes
+        row = self.row_of[note_id]
+        flags = self.flags[row]
+        return (
+            note_id,
+            self.titles[row],
+            self.strings[self.category_refs[row]],
+            self.modified[row],
+            "task" if flags & self.FLAG_TASK else "normal",
+            flags & self.FLAG_PINNED,
+            self.strings[self.color_refs[row]],
+            self.task_totals[row],
+            self.task_done[row],
+            self.previews[row],
+        )
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        order: Optional[str] = "pinned",
+        note_ids: Optional[List[int]] = None,
+    ) -> List[tuple]:
+        # order=None keeps the order of note_ids, e.g. search relevance
+        if order is None:
+            ids = [note_id for note_id in note_ids if note_id in self.row_of]
+        elif note_ids is not None:
+            wanted = set(note_ids)
+            ids = [note_id for note_id in self.orders[order] if note_id in wanted]
+        else:
+            ids = self.orders[order]
+        if category is not None:
+            category_ref = self.string_refs.get(category)
+            if category_ref is None:
+                return []
+            refs = self.category_refs
+            row_of = self.row_of
+            ids = [note_id for note_id in ids if refs[row_of[note_id]] == category_ref]
+        return [self.row(note_id) for note_id in ids]
+
+    def categories(self) -> List[str]:
+        return sorted(
+            self.strings[ref] for ref in self.category_counts if self.strings[ref]
+        )
+
+    def _build_title_blob(self):
+        # Casefolded titles, one per line, most recently modified first
+        rows = sorted(range(len(self.ids)), key=self.modified.__getitem__, reverse=True)
+        titles = [self.titles[row].casefold().replace("\n", " ") for row in rows]
+        # Leading newline: every title starts right after a "\n"
+        offsets = array(
+            "q", accumulate((len(title) + 1 for title in titles), initial=1)
+        )
+        offsets.pop()
+        ids = array("q", [self.ids[row] for row in rows])
+        self.title_blob = ("\n" + "\n".join(titles), offsets, ids)
+
+    def match_titles(self, query: str, limit: int = 50) -> List[int]:
+        # Fuzzy subsequence match of titles, best and most recent first
+        query = query.casefold().replace("\n", "")
+        if self.title_blob is None:
+            self._build_title_blob()
+        blob, offsets, ids = self.title_blob
+        if not query:
+            return list(ids[:limit])
+        # Titles starting with the query come first
+        subsequence = re.escape(query[0]) + "".join(
+            f"[^\\n{re.escape(char)}]*{re.escape(char)}" for char in query[1:]
+        )
+        patterns = (
+            re.compile(f"\\n({re.escape(query)})"),
+            re.compile(f"({subsequence})[^\\n]*"),
+        )
+        now = time.time()
+        scores = {}
+        for pattern in patterns:
+            found = 0
+            for match in pattern.finditer(blob):
+                start, end = match.span(1)
+                line = bisect_right(offsets, start) - 1
+                if line in scores:
+                    continue
+                score = 2.0 * len(query) / (end - start)
+                if start == offsets[line]:
+                    score += 1.0
+                elif blob[start - 1] in " -_/.":
+                    score += 0.5
+                age_weeks = (now - self.modified[self.row_of[ids[line]]]) / 604800
+                scores[line] = score + 0.5 / (1.0 + max(age_weeks, 0.0))
+                found += 1
+                if found >= self.MATCH_CANDIDATES:
+                    break
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [ids[line] for line, score in best]
+
+    def memory_footprint(self) -> int:
+        size = sum(map(sys.getsizeof, self._columns()))
+        size += sum(map(sys.getsizeof, self.titles))
+        size += sum(map(sys.getsizeof, self.previews))
+        # Keys are shared with the sort orders, so they are counted once here
+        size += sys.getsizeof(self.row_of) + sum(map(sys.getsizeof, self.row_of))
+        size += sum(sys.getsizeof(order) for order in self.orders.values())
+        size += sys.getsizeof(self.strings) + sum(map(sys.getsizeof, self.strings))
+        size += sys.getsizeof(self.string_refs) + sys.getsizeof(self.category_counts)
+        return size
+
+    def bytes_per_note(self) -> float:
+        return self.memory_footprint() / len(self.ids) if self.ids else 0.0
+
+
+# ──────────────────────────────────────────────
+# Related Notes
+# ──────────────────────────────────────────────
+
+RELATED_NOTES_AVAILABLE = np is not None
+
+
+class RelatedNotes:
+    # Related notes by TF-IDF cosine similarity over an inverted index,
+    # kept up to date by a background thread
+    WORD = re.compile(r"[^\W\d_]{3,40}")
+    STOP_WORDS = frozenset(
+        """
+        about after again all also and any are back because been before but
+        can could did does each even first for from get had has have her here
+        him his how into its just know like make many more most much must new
+        not now only other our out over said same see she should some still
+        such take than that the their them then there these they this those
+        through too under use very want was way well were what when where
+        which while who why will with would you your
+        """.split()
+    )
+    TITLE_WEIGHT = 3
+    QUERY_TERMS = 32  # strongest terms of the open note that are looked up
+    MIN_SCORE = 0.05
+    BATCH_SIZE = 200  # notes vectorized per commit
+    REBUILD_AFTER = 1000  # overlay notes before the index is rebuilt
+
+    def __init__(self):
+        self.pending = queue.Queue()  # lists of note ids saved or deleted
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_error = None
+        self.vocabulary = {}  # term -> id; only used on the thread
+        self.lock = threading.Lock()
+        # Swapped in by the thread under the lock
+        self.index = None
+        self.overlay = {}  # note_id -> (terms, weights), or None if deleted
+        self.overlay_arrays = None
+
+    @property
+    def ready(self) -> bool:
+        return self.index is not None
+
+    @property
+    def failed(self) -> bool:
+        # The thread stopped before the index was built; see last_error
+        return (
+            self.index is None
+            and self.thread is not None
+            and not self.thread.is_alive()
+            and not self.stop_event.is_set()
+        )
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=10)
+
+    def on_notes_written(self, event, note_ids):
+        # NotesDB listener on the Tk thread; the work happens on the thread
+        self.pending.put(list(note_ids))
+
+    # Vectors
+
+    @classmethod
+    def term_counts(cls, title: str, content: str) -> Counter:
+        counts = Counter()
+        for text, weight in ((title, cls.TITLE_WEIGHT), (content, 1)):
+            for match in cls.WORD.finditer(text.lower()):
+                word = match.group()
+                if word not in cls.STOP_WORDS:
+                    counts[word] += weight
+        return counts
+
+    def vectorize(self, cursor, title: str, content: str) -> tuple:
+        # (terms, weights) as numpy arrays sorted by term id
+        weights = {}
+        for term, count in self.term_counts(title, content).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                # Another instance may have added the term already
+                cursor.execute(
+                    "INSERT OR IGNORE INTO vector_terms (term) VALUES (?)", (term,)
+                )
+                term_id = cursor.execute(
+                    "SELECT id FROM vector_terms WHERE term=?", (term,)
+                ).fetchone()[0]
+                self.vocabulary[term] = term_id
+            weights[term_id] = 1.0 + math.log(count)
+        terms = np.fromiter(sorted(weights), dtype=np.uint32, count=len(weights))
+        return terms, np.array([weights[t] for t in terms.tolist()], dtype=np.float32)
+
+    def store(self, cursor, note_ids) -> dict:
+        # Returns note_id -> (terms, weights), or None for deleted notes
+        vectors = dict.fromkeys(note_ids)
+        for chunk, placeholders in NotesDB.id_chunks(list(note_ids)):
+            rows = cursor.execute(
+                f"SELECT id, title, content, modified_at FROM notes WHERE id IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            for note_id, title, content, modified_at in rows:
+                terms, weights = self.vectorize(cursor, title, content or "")
+                cursor.execute(
+                    "INSERT OR REPLACE INTO note_vectors VALUES (?, ?, ?, ?)",
+                    (
+                        note_id,
+                        modified_at,
+                        terms.astype("<u4").tobytes(),
+                        weights.astype("<f4").tobytes(),
+                    ),
+                )
+                vectors[note_id] = (terms, weights)
+        missing = [(note_id,) for note_id, vector in vectors.items() if vector is None]
+        cursor.executemany("DELETE FROM note_vectors WHERE note_id=?", missing)
+        return vectors
+
+    # Thread
+
+    def run(self):
+        conn = get_connection()
+        try:
+            self.catch_up(conn)
+            self.rebuild(conn)
+            while not self.stop_event.is_set():
+                try:
+                    note_ids = set(self.pending.get(timeout=0.5))
+                except queue.Empty:
+                    continue
+                while not self.pending.empty():
+                    note_ids.update(self.pending.get_nowait())
+                try:
+                    vectors = self.store(conn.cursor(), note_ids)
+                    conn.commit()
+                except sqlite3.OperationalError as error:
+                    message = str(error)
+                    if "locked" not in message and "busy" not in message:
+                        raise
+                    # Another writer held the database; try the batch again
+                    conn.rollback()
+                    self.pending.put(list(note_ids))
+                    self.stop_event.wait(1)
+                    continue
+                with self.lock:
+                    self.overlay.update(vectors)
+                    self.overlay_arrays = None
+                    self.hide_rows(vectors)
+                if len(self.overlay) > self.REBUILD_AFTER:
+                    self.rebuild(conn)
+        except Exception as error:
+            # Anything else ends the thread; the panel shows the reason
+            self.last_error = str(error) or type(error).__name__
+        finally:
+            conn.close()
+
+    def catch_up(self, conn):
+        # Vectorizes notes written while the app was closed
+        cursor = conn.cursor()
+        self.vocabulary = dict(cursor.execute("SELECT term, id FROM vector_terms"))
+        cursor.execute(
+            "DELETE FROM note_vectors WHERE note_id NOT IN (SELECT id FROM notes)"
+        )
+        conn.commit()
+        stale = [
+            row[0]
+            for row in cursor.execute("""
+                SELECT notes.id FROM notes
+                LEFT JOIN note_vectors ON note_vectors.note_id = notes.id
+                WHERE note_vectors.modified_at IS NOT notes.modified_at
+            """)
+        ]
+        for start in range(0, len(stale), self.BATCH_SIZE):
+            if self.stop_event.is_set():
+                return
+            self.store(cursor, stale[start : start + self.BATCH_SIZE])
+            conn.commit()
+
+    def rebuild(self, conn):
+        # Reads every stored vector into a fresh inverted index
+        note_ids, term_blobs, weight_blobs = [], [], []
+        for note_id, terms, weights in conn.execute(
+            "SELECT note_id, terms, weights FROM note_vectors ORDER BY note_id"
+        ):
+            note_ids.append(note_id)
+            term_blobs.append(terms)
+            weight_blobs.append(weights)
+        count = len(note_ids)
+        lengths = np.fromiter(map(len, term_blobs), dtype=np.int64, count=count) // 4
+        terms = np.frombuffer(b"".join(term_blobs), dtype="<u4").astype(np.int64)
+        weights = np.frombuffer(b"".join(weight_blobs), dtype="<f4")
+        rows = np.repeat(np.arange(count, dtype=np.int32), lengths)
+        size = int(terms.max()) + 1 if len(terms) else 1
+        document_frequency = np.bincount(terms, minlength=size)
+        idf = (np.log((count + 1) / (document_frequency + 1)) + 1).astype(np.float32)
+        weights = weights * idf[terms]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=count))
+        weights = weights / np.maximum(norms, 1e-12)[rows]
+        order = np.argsort(terms, kind="stable")
+        index = {
+            "note_ids": np.array(note_ids, dtype=np.int64),
+            "live": np.ones(count, dtype=np.float32),
+            "idf": idf,
+            # A note that never existed when idf was computed is rarest
+            "max_idf": np.float32(np.log(count + 1) + 1),
+            "term_starts": np.concatenate(([0], np.cumsum(document_frequency))),
+            "rows": rows[order],
+            "weights": weights[order].astype(np.float32),
+        }
+        with self.lock:
+            self.index = index
+            self.overlay = {}
+            self.overlay_arrays = None
+
+    def hide_rows(self, note_ids):
+        # Index rows replaced by the overlay stop counting; call with the lock
+        if self.index is None:
+            return
+        index_ids = self.index["note_ids"]
+        ids = np.fromiter(note_ids, dtype=np.int64)
+        positions = np.searchsorted(index_ids, ids)
+        found = positions < len(index_ids)
+        found[found] = index_ids[positions[found]] == ids[found]
+        self.index["live"][positions[found]] = 0
+
+    # Queries
+
+    def idf_of(self, terms):
+        idf = self.index["idf"]
+        known = terms < len(idf)
+        return np.where(
+            known, idf[np.minimum(terms, len(idf) - 1)], self.index["max_idf"]
+        )
+
+    def tfidf(self, terms, weights):
+        values = weights * self.idf_of(terms)
+        norm = float(np.sqrt(np.dot(values, values)))
+        return values / norm if norm else values
+
+    def build_overlay(self):
+        note_ids, lengths, terms, weights = [], [], [], []
+        for note_id, vector in self.overlay.items():
+            if vector is not None and len(vector[0]):
+                note_ids.append(note_id)
+                lengths.append(len(vector[0]))
+                terms.append(vector[0].astype(np.int64))
+                weights.append(self.tfidf(vector[0].astype(np.int64), vector[1]))
+        if not note_ids:
+            return None
+        return (
+            np.array(note_ids, dtype=np.int64),
+            np.repeat(np.arange(len(note_ids)), lengths),
+            np.concatenate(terms),
+            np.concatenate(weights),
         )
-        conn.commit()
-        conn.close()
 
-    @staticmethod
-    def load_setting(key: str, default: str = "") -> str:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM settings WHERE key=?", (key,))
-        row = cursor.fetchone()
+    def vector(self, note_id: int) -> Optional[tuple]:
+        if note_id in self.overlay:
+            return self.overlay[note_id]
+        conn = get_connection()
+        row = conn.execute(
+            "SELECT terms, weights FROM note_vectors WHERE note_id=?", (note_id,)
+        ).fetchone()
         conn.close()
-        return row[0] if row else default
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype="<u4"), np.frombuffer(row[1], dtype="<f4")
+
+    def related(self, note_id: int, limit: int = 8) -> List[tuple]:
+        # (note_id, score) of the most similar notes, best first
+        with self.lock:
+            if self.index is None:
+                return []
+            vector = self.vector(note_id)
+            if vector is None or not len(vector[0]):
+                return []
+            terms = vector[0].astype(np.int64)
+            query = self.tfidf(terms, vector[1])
+            if len(terms) > self.QUERY_TERMS:
+                strongest = np.argpartition(query, -self.QUERY_TERMS)[
+                    -self.QUERY_TERMS :
+                ]
+                terms, query = terms[strongest], query[strongest]
+            candidates = []
+            index = self.index
+            known = terms < len(index["idf"])
+            starts = index["term_starts"][terms[known]]
+            lengths = index["term_starts"][terms[known] + 1] - starts
+            if lengths.sum():
+                # Positions of every posting of every query term at once
+                offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+                postings = offsets + np.arange(lengths.sum())
+                scores = np.bincount(
+                    index["rows"][postings],
+                    weights=index["weights"][postings]
+                    * np.repeat(query[known], lengths),
+                    minlength=len(index["note_ids"]),
+                )
+                scores *= index["live"]
+                best = np.argpartition(scores, -min(limit + 1, len(scores)))[
+                    -(limit + 1) :
+                ]
+                candidates += zip(
+                    index["note_ids"][best].tolist(), scores[best].tolist()
+                )
+            if self.overlay:
+                if self.overlay_arrays is None:
+                    self.overlay_arrays = self.build_overlay()
+                if self.overlay_arrays is not None:
+                    note_ids, rows, overlay_terms, overlay_weights = self.overlay_arrays
+                    order = np.argsort(terms)
+                    sorted_terms, sorted_query = terms[order], query[order]
+                    found = np.minimum(
+                        np.searchsorted(sorted_terms, overlay_terms), len(terms) - 1
+                    )
+                    matches = sorted_terms[found] == overlay_terms
+                    scores = np.bincount(
+                        rows,
+                        weights=np.where(matches, sorted_query[found], 0)
+                        * overlay_weights,
+                        minlength=len(note_ids),
+                    )
+                    candidates += zip(note_ids.tolist(), scores.tolist())
+        candidates = [
+            (other_id, score)
+            for other_id, score in candidates
+            if other_id != note_id and score >= self.MIN_SCORE
+        ]
+        return heapq.nlargest(limit, candidates, key=lambda item: item[1])
 
 
 # ──────────────────────────────────────────────
@@ -601,11 +5524,203 @@ class NotesDB:
 # ──────────────────────────────────────────────
 
 
+class MarkdownHighlighter:
+    # Live Markdown styling, restyling dirty lines in idle slices
+    SLICE_BUDGET = 0.008  # seconds
+    TAGS = (
+        "md_h1",
+        "md_h2",
+        "md_h3",
+        "md_quote",
+        "md_list",
+        "md_code",
+        "md_bold",
+        "md_italic",
+        "md_link",
+        "md_wikilink",
+    )
+    HEADING = re.compile(r"^(#{1,6})\s")
+    QUOTE = re.compile(r"^\s*>")
+    LIST_MARKER = re.compile(r"^\s*(?:- \[[ xX]\]|[-*+]|\d+[.)])\s")
+    CODE = re.compile(r"`[^`]+`")
+    BOLD = re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1")
+    ITALIC = re.compile(r"(?<![*_\w])([*_])(?=[^\s*_])(.+?)(?<=[^\s*_])\1(?![*_\w])")
+    LINK = re.compile(r"\[[^\]]+\]\([^)\s]+\)|https?://[^\s)>\]]*[^\s)>\].,;:!?]")
+
+    WIKI_LINK = NotesDB.WIKI_LINK
+
+    def __init__(self, text: tk.Text, on_wiki_link=None):
+        self.text = text
+        self.on_wiki_link = on_wiki_link  # called with the linked title
+        self.dirty = set()
+        self.scanning = False
+        self.pending = None
+        self.last_line = 1
+        self.configure_tags()
+        # Runs before the Text class bindings, with the cursor not yet moved
+        text.bind("<KeyPress>", self.remember_cursor, add="+")
+        text.bind("<ButtonPress>", self.remember_cursor, add="+")
+        text.bind("<<Modified>>", self.on_modified, add="+")
+        text.bind("<Destroy>", self.cancel, add="+")
+        text.tag_bind("md_link", "<Control-Button-1>", self.open_link)
+        text.tag_bind("md_wikilink", "<Control-Button-1>", self.open_wiki_link)
+        text.edit_modified(False)
+
+    def configure_tags(self):
+        text = self.text
+        text.tag_configure("md_h1", font=("Segoe UI", 18, "bold"))
+        text.tag_configure("md_h2", font=("Segoe UI", 15, "bold"))
+        text.tag_configure("md_h3", font=("Segoe UI", 13, "bold"))
+        text.tag_configure("md_quote", foreground=theme.get_color("text_secondary"))
+        text.tag_configure("md_list", foreground=theme.get_color("primary"))
+        text.tag_configure(
+            "md_code",
+            font=("Consolas", 10, "normal"),
+            background=theme.get_color("surface_variant"),
+        )
+        text.tag_configure("md_bold", font=("Segoe UI", 11, "bold"))
+        text.tag_configure("md_italic", font=("Segoe UI", 11, "italic"))
+        text.tag_configure(
+            "md_link", foreground=theme.get_color("secondary"), underline=True
+        )
+        text.tag_configure(
+            "md_wikilink", foreground=theme.get_color("primary"), underline=True
+        )
+        # Later tags win: headings keep their size over inline styles
+        for tag in ("md_h3", "md_h2", "md_h1"):
+            text.tag_raise(tag)
+
+    def highlight_all(self):
+        # Visible lines right away, the rest in the background
+        first = self.line_of("@0,0")
+        last = self.line_of(f"@0,{self.text.winfo_height()}")
+        self.dirty.update(range(first, last + 1))
+        self.text.mark_set("md_scan", "1.0")
+        self.text.mark_gravity("md_scan", tk.LEFT)
+        self.scanning = True
+        self.schedule()
+
+    def line_of(self, index: str) -> int:
+        return int(self.text.index(index).split(".")[0])
+
+    def remember_cursor(self, event=None):
+        self.last_line = self.line_of(tk.INSERT)
+
+    def mark_dirty(self, first: int, last: int):
+        self.dirty.update(range(min(first, last), max(first, last) + 1))
+        self.schedule()
+
+    def on_modified(self, event=None):
+        # Resetting the flag below fires <<Modified>> once more
+        if not self.text.edit_modified():
+            return
+        self.text.edit_modified(False)
+        line = self.line_of(tk.INSERT)
+        self.mark_dirty(self.last_line, line)
+        self.last_line = line
+
+    def restart(self):
+        # For a buffer whose whole text was just replaced
+        self.cancel()
+        self.text.edit_modified(False)
+        self.last_line = 1
+        # The visible range is only known once the widget is laid out
+        self.text.after_idle(self.highlight_all)
+
+    def cancel(self, event=None):
+        if self.pending is not None:
+            self.text.after_cancel(self.pending)
+            self.pending = None
+        self.dirty.clear()
+        self.scanning = False
+
+    def schedule(self):
+        if self.pending is None:
+            self.pending = self.text.after_idle(self.process)
+
+    def process(self):
+        self.pending = None
+        deadline = time.perf_counter() + self.SLICE_BUDGET
+        last_line = self.line_of("end-1c")
+        while self.dirty and time.perf_counter() < deadline:
+            line = self.dirty.pop()
+            if line <= last_line:
+                self.highlight_line(line)
+        while self.scanning and not self.dirty and time.perf_counter() < deadline:
+            line = self.line_of("md_scan")
+            self.highlight_line(line)
+            if line >= last_line:
+                self.scanning = False
+            else:
+                self.text.mark_set("md_scan", f"{line + 1}.0")
+        if self.dirty or self.scanning:
+            # after(1) rather than after_idle lets pending key events in
+            self.pending = self.text.after(1, self.process)
+
+    def highlight_line(self, line: int):
+        text = self.text
+        start = f"{line}.0"
+        end = f"{line}.end"
+        for tag in self.TAGS:
+            text.tag_remove(tag, start, end)
+        content = text.get(start, end)
+        if not content.strip():
+            return
+        heading = self.HEADING.match(content)
+        if heading:
+            level = min(len(heading.group(1)), 3)
+            text.tag_add(f"md_h{level}", start, end)
+        elif self.QUOTE.match(content):
+            text.tag_add("md_quote", start, end)
+        marker = self.LIST_MARKER.match(content)
+        if marker:
+            text.tag_add("md_list", start, f"{line}.{marker.end()}")
+        # Emphasis and links are not styled inside code spans
+        code_spans = []
+        for match in self.CODE.finditer(content):
+            code_spans.append(match.span())
+            text.tag_add("md_code", f"{line}.{match.start()}", f"{line}.{match.end()}")
+        for pattern, tag in (
+            (self.BOLD, "md_bold"),
+            (self.ITALIC, "md_italic"),
+            (self.LINK, "md_link"),
+            (self.WIKI_LINK, "md_wikilink"),
+        ):
+            for match in pattern.finditer(content):
+                begin, finish = match.span()
+                if any(a < finish and begin < b for a, b in code_spans):
+                    continue
+                text.tag_add(tag, f"{line}.{begin}", f"{line}.{finish}")
+
+    def open_wiki_link(self, event):
+        index = self.text.index(f"@{event.x},{event.y}")
+        line, column = (int(part) for part in index.split("."))
+        content = self.text.get(f"{line}.0", f"{line}.end")
+        for match in self.WIKI_LINK.finditer(content):
+            if match.start() <= column < match.end():
+                if self.on_wiki_link:
+                    self.on_wiki_link(match.group(1).strip())
+                return "break"
+
+    def open_link(self, event):
+        index = self.text.index(f"@{event.x},{event.y}")
+        line, column = (int(part) for part in index.split("."))
+        content = self.text.get(f"{line}.0", f"{line}.end")
+        for match in self.LINK.finditer(content):
+            if match.start() <= column < match.end():
+                url = match.group()
+                if url.startswith("["):
+                    url = url[url.index("](") + 2 : -1]
+                webbrowser.open(url)
+                break
+
+
 class ModernNoteView(ModernFrame):
-    def __init__(self, master, note):
+    # Built once per editor; show_note() swaps in another note's text
+    def __init__(self, master, on_wiki_link=None):
         super().__init__(master)
-        self.note = note
-        # Toolbar for formatting
+        self.note = None
+        # Buttons insert Markdown markers, so formatting is saved with the text
         toolbar = tk.Frame(self, bg=theme.get_color("surface"))
         toolbar.pack(fill=tk.X, padx=10, pady=5)
 
@@ -629,6 +5744,16 @@ class ModernNoteView(ModernFrame):
         )
         italic_btn.pack(side=tk.LEFT, padx=2)
 
+        code_btn = ModernButton(
+            toolbar,
+            text="</>",
+            style="secondary",
+            font=("Consolas", 10, "normal"),
+            command=self.toggle_code,
+            width=3,
+        )
+        code_btn.pack(side=tk.LEFT, padx=2)
+
         # Text area
         container = GlassyFrame(self)
         container.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -639,48 +5764,69 @@ class ModernNoteView(ModernFrame):
         self.text.configure(yscrollcommand=scrollbar.set)
         self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.text.insert("1.0", self.note.content)
 
-        # Configure tags for formatting
-        self.text.tag_configure("bold", font=("Segoe UI", 11, "bold"))
-        self.text.tag_configure("italic", font=("Segoe UI", 11, "italic"))
+        self.highlighter = MarkdownHighlighter(self.text, on_wiki_link)
+
+    def show_note(self, note):
+        self.note = note
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", note.content)
+        self.text.mark_set(tk.INSERT, "1.0")
+        self.text.yview_moveto(0)
+        self.highlighter.restart()
 
     def toggle_bold(self):
-        try:
-            current_tags = self.text.tag_names("sel.first")
-            if "bold" in current_tags:
-                self.text.tag_remove("bold", "sel.first", "sel.last")
-            else:
-                self.text.tag_add("bold", "sel.first", "sel.last")
-        except tk.TclError:
-            pass
+        self.toggle_marker("**")
 
     def toggle_italic(self):
+        self.toggle_marker("*")
+
+    def toggle_code(self):
+        self.toggle_marker("`")
+
+    def toggle_marker(self, marker: str):
+        # Wraps the selection in the marker, or unwraps it if already wrapped
         try:
-            current_tags = self.text.tag_names("sel.first")
-            if "italic" in current_tags:
-                self.text.tag_remove("italic", "sel.first", "sel.last")
-            else:
-                self.text.tag_add("italic", "sel.first", "sel.last")
+            start = self.text.index("sel.first")
+            end = self.text.index("sel.last")
         except tk.TclError:
-            pass
+            return
+        size = len(marker)
+        if (
+            self.text.get(f"{start}-{size}c", start) == marker
+            and self.text.get(end, f"{end}+{size}c") == marker
+        ):
+            self.text.delete(end, f"{end}+{size}c")
+            self.text.delete(f"{start}-{size}c", start)
+        else:
+            self.text.insert(end, marker)
+            self.text.insert(start, marker)
+        self.highlighter.mark_dirty(
+            self.highlighter.line_of(start), self.highlighter.line_of(end)
+        )
 
     def update_note(self):
         self.note.content = self.text.get("1.0", tk.END).strip()
 
 
 class ModernTaskView(ModernFrame):
-    def __init__(self, master, note):
+    # Task rows are reused when switching notes
+    ROW_PACK = {"fill": tk.X, "padx": 10, "pady": 3}
+    SCROLL_MARGIN = 20  # px from the edge where dragging scrolls
+
+    def __init__(self, master):
         super().__init__(master)
-        self.note = note
+        self.note = None
         self.entries = []
+        self.rows = []
+        self.drag_source = None
         main_container = GlassyFrame(self)
         main_container.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         header = ModernFrame(main_container)
         header.pack(fill=tk.X, padx=10, pady=5)
         title_label = ModernLabel(header, style="subtitle", text="📋 Task List")
         title_label.pack(side=tk.LEFT)
-        canvas = tk.Canvas(
+        self.canvas = canvas = tk.Canvas(
             main_container, bg=theme.get_color("surface"), highlightthickness=0
         )
         scrollbar = ttk.Scrollbar(
@@ -699,46 +5845,10 @@ class ModernTaskView(ModernFrame):
             canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
 
         canvas.bind("<MouseWheel>", _on_mousewheel)
-        self.render_tasks()
 
-    def render_tasks(self):
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        self.entries = []
-        for i, task in enumerate(self.note.tasks):
-            task_container = GlassyFrame(self.scrollable_frame)
-            task_container.pack(fill=tk.X, padx=10, pady=3)
-            task_frame = ModernFrame(task_container)
-            task_frame.pack(fill=tk.X, padx=5, pady=5)
-            var = tk.BooleanVar(value=task.done)
-            cb = tk.Checkbutton(
-                task_frame,
-                text=task.content,
-                variable=var,
-                command=self.update_task_states,
-                wraplength=300,
-                justify=tk.LEFT,
-                bg=theme.get_color("surface"),
-                fg="gray" if task.done else theme.get_color("text"),
-                selectcolor=theme.get_color("primary"),
-                activebackground=theme.get_color("surface"),
-                activeforeground=theme.get_color("text"),
-                font=("Segoe UI", 10, "overstrike" if task.done else "normal"),
-                relief="flat",
-                bd=0,
-                highlightthickness=0,
-            )
-            cb.pack(side=tk.LEFT, fill=tk.X, expand=True)
-            del_btn = ModernButton(
-                task_frame,
-                text="×",
-                command=lambda idx=i: self.delete_task(idx),
-                style="danger",
-                width=2,
-                font=("Segoe UI", 10, "bold"),
-            )
-            del_btn.pack(side=tk.RIGHT, padx=3)
-            self.entries.append((task, var))
+        self.rows_frame = ModernFrame(self.scrollable_frame)
+        self.rows_frame.pack(fill=tk.X)
+        self.drop_marker = tk.Frame(self.rows_frame, height=3)
         add_container = GlassyFrame(self.scrollable_frame)
         add_container.pack(fill=tk.X, padx=10, pady=5)
         add_frame = ModernFrame(add_container)
@@ -755,6 +5865,66 @@ class ModernTaskView(ModernFrame):
         )
         add_btn.pack(side=tk.RIGHT)
 
+    def show_note(self, note):
+        self.note = note
+        self.new_entry.delete(0, tk.END)
+        self.render_tasks()
+        self.canvas.yview_moveto(0)
+
+    def make_row(self) -> tuple:
+        task_container = GlassyFrame(self.rows_frame)
+        task_frame = ModernFrame(task_container)
+        task_frame.pack(fill=tk.X, padx=5, pady=5)
+        handle = ModernLabel(task_frame, text="⋮⋮", cursor="fleur")
+        handle.pack(side=tk.LEFT, padx=(0, 3))
+        handle.bind("<ButtonPress-1>", lambda e: self.start_drag(task_container))
+        handle.bind("<B1-Motion>", self.drag)
+        handle.bind("<ButtonRelease-1>", self.drop)
+        var = tk.BooleanVar()
+        cb = tk.Checkbutton(
+            task_frame,
+            variable=var,
+            command=self.update_task_states,
+            wraplength=300,
+            justify=tk.LEFT,
+            relief="flat",
+            bd=0,
+            highlightthickness=0,
+        )
+        cb.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        del_btn = ModernButton(
+            task_frame,
+            text="×",
+            command=lambda: self.delete_task(self.row_index(task_container)),
+            style="danger",
+            width=2,
+            font=("Segoe UI", 10, "bold"),
+        )
+        del_btn.pack(side=tk.RIGHT, padx=3)
+        return task_container, cb, var
+
+    def render_tasks(self):
+        self.entries = []
+        for i, task in enumerate(self.note.tasks):
+            if i == len(self.rows):
+                self.rows.append(self.make_row())
+            task_container, cb, var = self.rows[i]
+            var.set(task.done)
+            cb.configure(
+                text=task.content,
+                bg=theme.get_color("surface"),
+                fg="gray" if task.done else theme.get_color("text"),
+                selectcolor=theme.get_color("primary"),
+                activebackground=theme.get_color("surface"),
+                activeforeground=theme.get_color("text"),
+                font=("Segoe UI", 10, "overstrike" if task.done else "normal"),
+            )
+            if not task_container.winfo_manager():
+                task_container.pack(**self.ROW_PACK)
+            self.entries.append((task, var))
+        for task_container, cb, var in self.rows[len(self.entries) :]:
+            task_container.pack_forget()
+
     def add_task(self, event=None):
         content = self.new_entry.get().strip()
         if content:
@@ -772,6 +5942,728 @@ class ModernTaskView(ModernFrame):
             task.done = var.get()
         self.render_tasks()
 
+    def row_index(self, task_container) -> int:
+        for index, row in enumerate(self.rows):
+            if row[0] is task_container:
+                return index
+        return -1
+
+    def drop_index(self, y: int) -> int:
+        # Row tops are in order, so a binary search finds the row
+        low, high = 0, len(self.entries)
+        while low < high:
+            middle = (low + high) // 2
+            row = self.rows[middle][0]
+            if y < row.winfo_y() + row.winfo_height() // 2:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def start_drag(self, task_container):
+        self.drag_source = self.row_index(task_container)
+        self.drop_marker.configure(bg=theme.get_color("primary"))
+
+    def drag(self, event):
+        if self.drag_source is None:
+            return
+        canvas_y = event.y_root - self.canvas.winfo_rooty()
+        if canvas_y < self.SCROLL_MARGIN:
+            self.canvas.yview_scroll(-1, "units")
+        elif canvas_y > self.canvas.winfo_height() - self.SCROLL_MARGIN:
+            self.canvas.yview_scroll(1, "units")
+        index = self.drop_index(event.y_root - self.rows_frame.winfo_rooty())
+        if index < len(self.entries):
+            y = self.rows[index][0].winfo_y() - 2
+        else:
+            last = self.rows[len(self.entries) - 1][0]
+            y = last.winfo_y() + last.winfo_height()
+        self.drop_marker.place(x=10, y=y, relwidth=1.0, width=-20)
+        self.drop_marker.lift()
+
+    def drop(self, event):
+        source, self.drag_source = self.drag_source, None
+        self.drop_marker.place_forget()
+        if source is None or source < 0:
+            return
+        index = self.drop_index(event.y_root - self.rows_frame.winfo_rooty())
+        target = index - 1 if index > source else index
+        if target == source:
+            return
+        self.note.tasks.move(source, target)
+        # Move just this row's widget and keep rows/entries in task order
+        row = self.rows.pop(source)
+        self.rows.insert(target, row)
+        self.entries.insert(target, self.entries.pop(source))
+        if target + 1 < len(self.entries):
+            row[0].pack(before=self.rows[target + 1][0], **self.ROW_PACK)
+        else:
+            row[0].pack(after=self.rows[target - 1][0], **self.ROW_PACK)
+
+
+class RevisionHistoryDialog(tk.Toplevel):
+    # Revisions are listed page by page; only the selected one is rebuilt
+    PAGE_SIZE = 50
+
+    def __init__(self, master, note, on_restore):
+        super().__init__(master)
+        self.title(f"🕘 History - {note.title}")
+        self.geometry("760x480")
+        self.configure(bg=theme.get_color("surface"))
+        self.transient(master)
+        self.note_id = note.id
+        self.on_restore = on_restore
+        self.revisions = []
+        self.exhausted = False
+        self.selected_content = None
+
+        body = ModernFrame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        list_frame = GlassyFrame(body)
+        list_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
+        self.listbox = tk.Listbox(
+            list_frame,
+            width=32,
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectbackground=theme.get_color("primary"),
+            selectforeground="white",
+            font=("Segoe UI", 10, "normal"),
+            relief="flat",
+            highlightthickness=0,
+            activestyle="none",
+        )
+        scrollbar = ttk.Scrollbar(
+            list_frame, orient=tk.VERTICAL, command=self.listbox.yview
+        )
+        self.listbox.configure(
+            yscrollcommand=lambda *args: self._on_scroll(scrollbar, *args)
+        )
+        self.listbox.pack(side=tk.LEFT, fill=tk.Y)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+
+        preview_frame = ModernFrame(body)
+        preview_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.preview = ModernText(preview_frame, state=tk.DISABLED)
+        self.preview.pack(fill=tk.BOTH, expand=True)
+        self.restore_btn = ModernButton(
+            preview_frame,
+            text="↩️ Restore this version",
+            command=self.restore,
+            style="primary",
+            state=tk.DISABLED,
+        )
+        self.restore_btn.pack(anchor=tk.E, pady=(10, 0))
+
+        self.load_more()
+
+    def _on_scroll(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        # Fetch the next page once the end of the list comes into view
+        if float(last) >= 1.0 and not self.exhausted and self.revisions:
+            self.after_idle(self.load_more)
+
+    def load_more(self):
+        if self.exhausted:
+            return
+        before = self.revisions[-1][0] if self.revisions else None
+        page = RevisionStore.list_revisions(self.note_id, before, self.PAGE_SIZE)
+        for revision_id, created_at, size in page:
+            self.listbox.insert(
+                tk.END,
+                f"{time_formatter.absolute(created_at, '%m/%d/%Y %H:%M')} • {size} chars",
+            )
+        self.revisions.extend(page)
+        if len(page) < self.PAGE_SIZE:
+            self.exhausted = True
+
+    def on_select(self, event=None):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        revision_id = self.revisions[selection[0]][0]
+        self.selected_content = RevisionStore.load_revision(revision_id)
+        self.preview.configure(state=tk.NORMAL)
+        self.preview.delete("1.0", tk.END)
+        self.preview.insert("1.0", self.selected_content or "")
+        self.preview.configure(state=tk.DISABLED)
+        self.restore_btn.configure(state=tk.NORMAL)
+
+    def restore(self):
+        if self.selected_content is None:
+            return
+        self.on_restore(self.selected_content)
+        self.destroy()
+
+
+class OpenTasksDialog(tk.Toplevel):
+    # Every unchecked task, fetched page by page; double-click opens the note
+    PAGE_SIZE = 100
+
+    def __init__(self, master, on_open):
+        super().__init__(master)
+        self.title("☑️ All open tasks")
+        self.geometry("560x480")
+        self.configure(bg=theme.get_color("surface"))
+        self.transient(master)
+        self.on_open = on_open
+        # One entry per listbox line: a note id for headers, else a task row
+        self.lines = []
+        self.last = None
+        self.exhausted = False
+
+        body = GlassyFrame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.listbox = tk.Listbox(
+            body,
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectbackground=theme.get_color("primary"),
+            selectforeground="white",
+            font=("Segoe UI", 10, "normal"),
+            relief="flat",
+            highlightthickness=0,
+            activestyle="none",
+        )
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.listbox.yview)
+        self.listbox.configure(
+            yscrollcommand=lambda *args: self._on_scroll(scrollbar, *args)
+        )
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.bind("<Double-Button-1>", self.open_selected)
+
+        self.load_more()
+        if not self.lines:
+            self.listbox.insert(tk.END, "No open tasks 🎉")
+
+    def _on_scroll(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        if float(last) >= 1.0 and not self.exhausted and self.lines:
+            self.after_idle(self.load_more)
+
+    def load_more(self):
+        if self.exhausted:
+            return
+        page = NotesDB.list_open_tasks(self.last, self.PAGE_SIZE)
+        for task_id, note_id, title, content, position in page:
+            if self.last is None or self.last[0] != note_id:
+                self.listbox.insert(tk.END, f"📋 {title}")
+                self.listbox.itemconfigure(tk.END, fg=theme.get_color("secondary"))
+                self.lines.append(note_id)
+            self.listbox.insert(tk.END, f"    ☐ {content}")
+            self.lines.append((task_id, note_id))
+            self.last = (note_id, position, task_id)
+        if len(page) < self.PAGE_SIZE:
+            self.exhausted = True
+
+    def open_selected(self, event=None):
+        selection = self.listbox.curselection()
+        if not selection or selection[0] >= len(self.lines):
+            return
+        line = self.lines[selection[0]]
+        self.on_open(line if isinstance(line, int) else line[1])
+
+
+class DuplicatesDialog(tk.Toplevel):
+    # Groups of near-duplicate notes to merge or delete
+    def __init__(self, master, clusters: List[list], on_open, on_change):
+        # on_change(note_ids) runs before (False cancels) and after changes
+        super().__init__(master)
+        self.title("🧬 Duplicate notes")
+        self.geometry("760x480")
+        self.configure(bg=theme.get_color("surface"))
+        self.transient(master)
+        self.on_open = on_open
+        self.on_change = on_change
+        note_ids = [note_id for members in clusters for note_id, _ in members]
+        # Notes deleted since the job ran drop out here
+        self.metadata = {row[0]: row for row in NotesDB.load_note_metadata(note_ids)}
+        self.clusters = []
+        for members in clusters:
+            members = [member for member in members if member[0] in self.metadata]
+            if len(members) > 1:
+                self.clusters.append(members)
+
+        body = GlassyFrame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        lists = ModernFrame(body)
+        lists.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.group_list = self.make_listbox(lists, width=32)
+        self.group_list.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 5))
+        self.group_list.bind("<<ListboxSelect>>", lambda e: self.show_members())
+        self.member_list = self.make_listbox(lists)
+        self.member_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.member_list.bind("<Double-Button-1>", self.open_selected)
+
+        buttons = ModernFrame(body)
+        buttons.pack(fill=tk.X, padx=5, pady=(0, 5))
+        for text, command, style in (
+            ("🔀 Merge into selected", self.merge_group, "primary"),
+            ("🗑️ Delete others", self.delete_others, "danger"),
+            ("🧹 Keep newest in every group", self.keep_newest, "secondary"),
+        ):
+            ModernButton(buttons, text=text, command=command, style=style).pack(
+                side=tk.LEFT, padx=(0, 5)
+            )
+        self.hint = ModernLabel(
+            buttons, style="caption", text="Double-click a note to open it"
+        )
+        self.hint.pack(side=tk.RIGHT)
+        self.show_groups()
+
+    @staticmethod
+    def make_listbox(master, **options) -> tk.Listbox:
+        return tk.Listbox(
+            master,
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectbackground=theme.get_color("primary"),
+            selectforeground="white",
+            font=("Segoe UI", 10, "normal"),
+            relief="flat",
+            highlightthickness=0,
+            activestyle="none",
+            exportselection=False,
+            **options,
+        )
+
+    def show_groups(self):
+        self.group_list.delete(0, tk.END)
+        for members in self.clusters:
+            title = self.metadata[members[0][0]][1]
+            self.group_list.insert(
+                tk.END, f"{len(members)} × {title}  ·  {members[0][1]:.0%}"
+            )
+        if self.clusters:
+            self.group_list.selection_set(0)
+        else:
+            self.group_list.insert(tk.END, "No near-duplicates left 🎉")
+        self.show_members()
+
+    def selected_group(self) -> Optional[list]:
+        selection = self.group_list.curselection()
+        if not selection or selection[0] >= len(self.clusters):
+            return None
+        return self.clusters[selection[0]]
+
+    def show_members(self):
+        self.member_list.delete(0, tk.END)
+        members = self.selected_group() or []
+        for note_id, score in members:
+            row = self.metadata[note_id]
+            self.member_list.insert(
+                tk.END,
+                f"{row[1]}  ·  {row[2] or 'No category'}  ·  "
+                f"{time_formatter.relative(row[4])}  ·  {score:.0%}",
+            )
+        if members:
+            self.member_list.selection_set(0)
+
+    def keeper(self) -> Optional[tuple]:
+        # (keeper_id, other_ids) for the selected group
+        members = self.selected_group()
+        if not members:
+            return None
+        selection = self.member_list.curselection()
+        keeper_id = members[selection[0] if selection else 0][0]
+        return keeper_id, [note_id for note_id, _ in members if note_id != keeper_id]
+
+    def open_selected(self, event=None):
+        members = self.selected_group()
+        selection = self.member_list.curselection()
+        if members and selection:
+            self.on_open(members[selection[0]][0])
+
+    def forget(self, note_ids):
+        removed = set(note_ids)
+        self.clusters = [
+            members
+            for members in (
+                [member for member in group if member[0] not in removed]
+                for group in self.clusters
+            )
+            if len(members) > 1
+        ]
+        self.show_groups()
+
+    def merge_group(self):
+        chosen = self.keeper()
+        if not chosen:
+            return
+        keeper_id, others = chosen
+        title = self.metadata[keeper_id][1]
+        if not messagebox.askyesno(
+            "🔀 Merge",
+            f"Add what {len(others)} other note(s) have to '{title}' and delete them?",
+            parent=self,
+        ) or not self.on_change(None):
+            return
+        keeper = NotesDB.load_note(keeper_id)
+        copies = [note for note in map(NotesDB.load_note, others) if note]
+        if keeper is None:
+            return
+        DuplicateFinder.merge(keeper, copies)
+        try:
+            NotesDB.save_note(keeper)
+        except NoteConflictError as error:
+            messagebox.showerror("🔀 Merge", str(error), parent=self)
+            return
+        NotesDB.delete_notes(others, merge_into=keeper_id)
+        self.on_change([keeper_id, *others])
+        self.forget(others)
+
+    def delete_others(self):
+        chosen = self.keeper()
+        if not chosen:
+            return
+        keeper_id, others = chosen
+        if not messagebox.askyesno(
+            "🗑️ Delete",
+            f"Keep '{self.metadata[keeper_id][1]}' and delete {len(others)} other note(s)?",
+            parent=self,
+        ) or not self.on_change(None):
+            return
+        NotesDB.delete_notes(others)
+        self.on_change(others)
+        self.forget(others)
+
+    def keep_newest(self):
+        doomed = []
+        for members in self.clusters:
+            newest = max(
+                members, key=lambda member: to_epoch(self.metadata[member[0]][4])
+            )
+            doomed += [note_id for note_id, _ in members if note_id != newest[0]]
+        if (
+            not doomed
+            or not messagebox.askyesno(
+                "🧹 Keep newest",
+                f"Delete {len(doomed)} older copies across {len(self.clusters)} groups?",
+                parent=self,
+            )
+            or not self.on_change(None)
+        ):
+            return
+        NotesDB.delete_notes(doomed)
+        self.on_change(doomed)
+        self.forget(doomed)
+
+
+class QuickSwitcher(tk.Toplevel):
+    # Ctrl+P popup ranking note titles from the in-memory index
+    RESULTS = 12
+
+    def __init__(self, master, note_index, on_open):
+        super().__init__(master)
+        self.overrideredirect(True)
+        self.configure(bg=theme.get_color("border"))
+        self.transient(master)
+        self.note_index = note_index
+        self.on_open = on_open
+        self.results = []
+        width = 480
+        x = master.winfo_rootx() + (master.winfo_width() - width) // 2
+        y = master.winfo_rooty() + 80
+        self.geometry(f"{width}x320+{max(x, 0)}+{max(y, 0)}")
+
+        body = ModernFrame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=1, pady=1)
+        self.query_var = tk.StringVar()
+        self.query_var.trace_add("write", lambda *args: self.update_results())
+        entry = ModernEntry(body, textvariable=self.query_var)
+        entry.pack(fill=tk.X, padx=10, pady=10)
+        self.listbox = tk.Listbox(
+            body,
+            height=self.RESULTS,
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectbackground=theme.get_color("primary"),
+            selectforeground="white",
+            font=("Segoe UI", 10, "normal"),
+            relief="flat",
+            highlightthickness=0,
+            activestyle="none",
+        )
+        self.listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.listbox.bind("<Double-Button-1>", self.open_selected)
+
+        entry.bind("<Down>", lambda e: self.move(1))
+        entry.bind("<Up>", lambda e: self.move(-1))
+        entry.bind("<Return>", self.open_selected)
+        entry.bind("<Escape>", lambda e: self.destroy())
+        entry.bind("<FocusOut>", self.on_focus_out)
+        self.update_results()
+        entry.focus_force()
+
+    def update_results(self):
+        self.results = self.note_index.match_titles(
+            self.query_var.get().strip(), self.RESULTS
+        )
+        self.listbox.delete(0, tk.END)
+        for note_id in self.results:
+            _, title, category, modified_at, mode, *_ = self.note_index.row(note_id)
+            mode_icon = "📋" if mode == "task" else "📝"
+            details = " • ".join(
+                part
+                for part in (category, time_formatter.relative(modified_at))
+                if part
+            )
+            self.listbox.insert(tk.END, f"{mode_icon} {title}   {details}")
+        if self.results:
+            self.listbox.selection_set(0)
+
+    def move(self, step: int):
+        if not self.results:
+            return "break"
+        selection = self.listbox.curselection()
+        index = (selection[0] if selection else -1) + step
+        index = max(0, min(index, len(self.results) - 1))
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+        return "break"
+
+    def open_selected(self, event=None):
+        selection = self.listbox.curselection()
+        if not selection:
+            return "break"
+        note_id = self.results[selection[0]]
+        self.destroy()
+        self.on_open(note_id)
+        return "break"
+
+    def on_focus_out(self, event=None):
+        # Clicking a result moves focus to the listbox; anything else closes
+        self.after(100, self.close_if_unfocused)
+
+    def close_if_unfocused(self):
+        if not self.winfo_exists():
+            return
+        focus = self.focus_get()
+        if focus is None or focus.winfo_toplevel() is not self:
+            self.destroy()
+
+
+class MaintenanceLogDialog(tk.Toplevel):
+    def __init__(self, master, maintenance):
+        super().__init__(master)
+        self.title("🧹 Maintenance log")
+        self.geometry("560x360")
+        self.configure(bg=theme.get_color("surface"))
+        self.transient(master)
+
+        body = ModernFrame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        ModernLabel(
+            body,
+            style="caption",
+            text=f"Runs after {maintenance.IDLE_AFTER // 60} minutes without input",
+        ).pack(anchor=tk.W, pady=(0, 5))
+
+        listbox = tk.Listbox(
+            body,
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectbackground=theme.get_color("primary"),
+            selectforeground="white",
+            font=("Segoe UI", 10, "normal"),
+            relief="flat",
+            highlightthickness=0,
+            activestyle="none",
+        )
+        listbox.pack(fill=tk.BOTH, expand=True)
+        entries = maintenance.recent_log()
+        for job, finished_at, steps, duration_ms, reclaimed in entries:
+            line = (
+                f"{time_formatter.absolute(finished_at, '%m/%d/%Y %H:%M')} • {job} • "
+                f"{steps} steps • {duration_ms:.0f} ms"
+            )
+            if reclaimed:
+                line += f" • {AttachmentStore.format_size(reclaimed)} reclaimed"
+            listbox.insert(tk.END, line)
+        if not entries:
+            listbox.insert(tk.END, "Nothing has run yet")
+
+
+class BackupDialog(tk.Toplevel):
+    def __init__(self, master, backups, on_restored):
+        super().__init__(master)
+        self.title("🗄️ Backups")
+        self.geometry("640x420")
+        self.configure(bg=theme.get_color("surface"))
+        self.transient(master)
+        self.app = master
+        self.backups = backups
+        self.on_restored = on_restored
+        self.snapshots = []
+        self.busy = False
+
+        body = ModernFrame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        settings_frame = ModernFrame(body)
+        settings_frame.pack(fill=tk.X, pady=(0, 10))
+        ModernLabel(settings_frame, text="Every (hours):").pack(side=tk.LEFT)
+        self.interval_entry = ModernEntry(settings_frame, width=5)
+        self.interval_entry.insert(
+            0, NotesDB.load_setting("backup_interval_hours", "24")
+        )
+        self.interval_entry.pack(side=tk.LEFT, padx=5)
+        ModernLabel(settings_frame, text="Keep:").pack(side=tk.LEFT)
+        self.keep_entry = ModernEntry(settings_frame, width=5)
+        self.keep_entry.insert(0, NotesDB.load_setting("backup_keep", "7"))
+        self.keep_entry.pack(side=tk.LEFT, padx=5)
+        ModernButton(
+            settings_frame,
+            text="Apply",
+            command=self.save_settings,
+            style="secondary",
+        ).pack(side=tk.LEFT)
+
+        self.listbox = tk.Listbox(
+            body,
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectbackground=theme.get_color("primary"),
+            selectforeground="white",
+            font=("Segoe UI", 10, "normal"),
+            relief="flat",
+            highlightthickness=0,
+            activestyle="none",
+        )
+        self.listbox.pack(fill=tk.BOTH, expand=True)
+
+        controls = ModernFrame(body)
+        controls.pack(fill=tk.X, pady=(10, 0))
+        self.status_label = ModernLabel(controls, style="caption", text="")
+        self.status_label.pack(side=tk.LEFT)
+        ModernButton(
+            controls, text="↩️ Restore", command=self.restore, style="danger"
+        ).pack(side=tk.RIGHT)
+        ModernButton(
+            controls, text="✔️ Verify", command=self.verify, style="secondary"
+        ).pack(side=tk.RIGHT, padx=5)
+        ModernButton(
+            controls, text="💾 Back up now", command=self.backup_now, style="primary"
+        ).pack(side=tk.RIGHT)
+
+        self.refresh_list()
+
+    def refresh_list(self):
+        self.snapshots = self.backups.list_snapshots()
+        self.listbox.delete(0, tk.END)
+        for path, size, mtime in self.snapshots:
+            self.listbox.insert(
+                tk.END,
+                f"{os.path.basename(path)} • {AttachmentStore.format_size(size)} • "
+                f"{time_formatter.absolute(mtime, '%m/%d/%Y %H:%M')}",
+            )
+
+    def selected_path(self) -> Optional[str]:
+        selection = self.listbox.curselection()
+        return self.snapshots[selection[0]][0] if selection else None
+
+    def save_settings(self):
+        try:
+            interval = float(self.interval_entry.get())
+            keep = int(self.keep_entry.get())
+        except ValueError:
+            messagebox.showerror("❌ Error", "Please enter numbers.", parent=self)
+            return
+        NotesDB.save_setting("backup_interval_hours", str(interval))
+        NotesDB.save_setting("backup_keep", str(max(1, keep)))
+
+    def watch_progress(self):
+        # Drains progress updates from the worker thread while it runs
+        latest = None
+        while not self.backups.progress.empty():
+            latest = self.backups.progress.get_nowait()
+        if latest and self.winfo_exists():
+            copied, total = latest
+            self.status_label.config(text=f"⏳ {copied}/{total} pages")
+        if self.busy and self.winfo_exists():
+            self.after(100, self.watch_progress)
+
+    def report(self, report: dict) -> str:
+        return (
+            f"{report['pages']} pages in {report['steps']} steps • "
+            f"{report['step_avg_ms']:.1f} ms/step (max {report['step_max_ms']:.1f}) • "
+            f"{report['duration']:.2f} s total"
+        )
+
+    def backup_now(self):
+        keep = int(NotesDB.load_setting("backup_keep", "7"))
+
+        def done(report, error):
+            self.busy = False
+            if not self.winfo_exists():
+                return
+            if error:
+                self.status_label.config(text=f"❌ {error}")
+                return
+            NotesDB.save_setting("last_backup_at", str(int(time.time())))
+            self.status_label.config(text=f"✅ {self.report(report)}")
+            self.refresh_list()
+
+        self.busy = True
+        self.app.run_in_background(lambda: self.backups.create_snapshot(keep), done)
+        self.after(100, self.watch_progress)
+
+    def verify(self):
+        path = self.selected_path()
+        if not path:
+            return
+        self.status_label.config(text="⏳ Verifying…")
+
+        def done(ok, error):
+            if self.winfo_exists():
+                self.status_label.config(
+                    text="✅ Snapshot is intact" if ok else "❌ Snapshot is damaged"
+                )
+
+        self.app.run_in_background(lambda: self.backups.verify(path), done)
+
+    def restore(self):
+        path = self.selected_path()
+        if not path:
+            return
+        if self.app.jobs.running():
+            messagebox.showwarning(
+                "↩️ Restore Backup",
+                "Wait for the running jobs to finish or cancel them first.",
+                parent=self,
+            )
+            return
+        if not messagebox.askyesno(
+            "↩️ Restore Backup",
+            f"Replace all notes with {os.path.basename(path)}?\n"
+            "A snapshot of the current notes is taken first.",
+            parent=self,
+        ):
+            return
+
+        def done(report, error):
+            self.busy = False
+            self.on_restored(error is None)
+            if not self.winfo_exists():
+                return
+            if error:
+                self.status_label.config(text=f"❌ {error}")
+                return
+            self.status_label.config(
+                text=f"✅ Restored • {self.report(report)} • "
+                f"safety snapshot {report['safety_duration']:.2f} s"
+            )
+            self.refresh_list()
+
+        self.app.pause_for_restore()
+        self.busy = True
+        self.app.run_in_background(lambda: self.backups.restore(path), done)
+        self.after(100, self.watch_progress)
+
 
 # ──────────────────────────────────────────────
 # Main Modern Application (Updated Sidebar Fix)
@@ -779,6 +6671,15 @@ class ModernTaskView(ModernFrame):
 
 
 class ModernNoteApp(tk.Tk):
+    SORT_ORDERS = {
+        "Pinned & recent": "pinned",
+        "Title": "title",
+        "Created": "created",
+    }
+    COLOR_TAGS = ["default", "#ff9999", "#99ff99", "#9999ff"]
+    CONTROL_MASK = 0x0004
+    SHIFT_MASK = 0x0001
+
     def __init__(self):
         super().__init__()
         self.title("✨ Modern Notes - Advanced Note Taking")
@@ -790,13 +6691,300 @@ class ModernNoteApp(tk.Tk):
         self.current_note = None
         self.current_view = None
         self.notes_data = []
+        self.note_index = NoteIndex()
+        self.note_index.load(NotesDB.load_note_metadata())
+        NotesDB.add_listener(self.note_index.apply_event)
+        NotesDB.add_listener(self.on_notes_written)
+        self.search_cache = (None, None)
+        self.note_cards = []
+        self.selected_notes = set()
+        self.selection_anchor = None
+        self.rubber_band = None
+        self.grid_renderer = NotesDB.load_setting("grid_renderer", "widgets")
         self.sidebar_visible = False
         self.editor_visible = False
         self.top_bar_height = 0  # To store the height of the top bar
         self.setup_style()
         self.create_modern_ui()
         self.apply_theme()
+        if self.grid_renderer == "canvas":
+            self.card_canvas.attach()
         self.refresh_notes_grid()
+        self.after(60000, self.refresh_relative_times)
+        self.change_watcher = ChangeWatcher()
+        self.restoring = False
+        self.after(1000, self.poll_external_changes)
+        self.backups = BackupManager()
+        self.after(5000, self.run_scheduled_backup)
+        self.last_activity = time.monotonic()
+        for sequence in ("<Key>", "<Button>", "<Motion>", "<MouseWheel>"):
+            self.bind_all(sequence, self.record_activity, add="+")
+        self.maintenance = MaintenanceScheduler(self, lambda: self.last_activity)
+        self.maintenance.start()
+        self.markdown_sync = None
+        self.asked_sync_removals = frozenset()
+        self.start_markdown_sync()
+        self.rpc_server = None
+        self.start_rpc_server()
+        self.related = None
+        self.start_related_notes()
+        self.jobs = JobRunner(self, self.refresh_jobs_panel)
+        self.after(MaintenanceScheduler.CHECK_INTERVAL, self.run_pending_vacuum)
+        self.bind("<Escape>", lambda e: self.clear_selection(), add="+")
+        self.bind_all("<Control-p>", self.show_quick_switcher)
+        # Text widgets move the cursor up a line on Ctrl+P by default
+        self.bind_class("Text", "<Control-p>", self.show_quick_switcher)
+
+    def record_activity(self, event=None):
+        self.last_activity = time.monotonic()
+
+    def run_scheduled_backup(self):
+        # A snapshot is taken once the configured interval has passed
+        interval = float(NotesDB.load_setting("backup_interval_hours", "24")) * 3600
+        last = int(NotesDB.load_setting("last_backup_at", "0"))
+        if interval > 0 and time.time() - last >= interval and not self.backups.running:
+            keep = int(NotesDB.load_setting("backup_keep", "7"))
+
+            def done(report, error):
+                if not error:
+                    NotesDB.save_setting("last_backup_at", str(int(time.time())))
+
+            self.run_in_background(lambda: self.backups.create_snapshot(keep), done)
+        self.after(600000, self.run_scheduled_backup)
+
+    def run_pending_vacuum(self):
+        # The pending full VACUUM runs in a worker once the user is idle
+        name = "Compact database"
+        if (
+            NotesDB.load_setting("vacuum_pending", "") == "1"
+            and not self.restoring
+            and self.maintenance.is_idle()
+            and not any(job.name == name for job in self.jobs.running())
+        ):
+            self.jobs.submit(name, vacuum_database_job)
+        self.after(60000, self.run_pending_vacuum)
+
+    def show_backups(self):
+        BackupDialog(self, self.backups, self.on_database_restored)
+
+    def start_markdown_sync(self):
+        if self.markdown_sync:
+            self.markdown_sync.stop()
+            self.markdown_sync = None
+        folder = NotesDB.load_setting("markdown_sync_folder", "")
+        if folder and os.path.isdir(folder):
+            self.markdown_sync = MarkdownSync(folder)
+            self.markdown_sync.start()
+
+    def configure_markdown_sync(self):
+        current = NotesDB.load_setting("markdown_sync_folder", "")
+        folder = filedialog.askdirectory(
+            title="Choose a folder to mirror notes as Markdown",
+            initialdir=current or os.path.expanduser("~"),
+            parent=self,
+        )
+        if not folder:
+            if current and messagebox.askyesno(
+                "📁 Markdown Sync", f"Stop syncing with {current}?", parent=self
+            ):
+                NotesDB.save_setting("markdown_sync_folder", "")
+                self.start_markdown_sync()
+            return
+        if folder != current:
+            if self.markdown_sync:
+                self.markdown_sync.stop()
+                self.markdown_sync = None
+            MarkdownSync.reset()
+            NotesDB.save_setting("markdown_sync_folder", folder)
+        self.start_markdown_sync()
+        messagebox.showinfo(
+            "📁 Markdown Sync",
+            f"Notes are mirrored to {folder}.\nEdits made there are imported "
+            f"within {MarkdownSync.POLL_INTERVAL:.0f} seconds.",
+            parent=self,
+        )
+
+    def start_rpc_server(self) -> Optional[str]:
+        # Returns why the server could not start, if it could not
+        if self.rpc_server:
+            self.rpc_server.stop()
+            self.rpc_server = None
+        address = NotesDB.load_setting("rpc_address", "")
+        if not address:
+            return None
+        server = RpcServer(address)
+        server.start()
+        if server.last_error:
+            return server.last_error
+        self.rpc_server = server
+        return None
+
+    def configure_rpc_server(self):
+        current = NotesDB.load_setting("rpc_address", "")
+        address = simpledialog.askstring(
+            "🔌 Scripting Server",
+            "Serve JSON-RPC for scripts on host:port or unix:/path/to/socket.\n"
+            "Leave empty to turn the server off.",
+            initialvalue=current or "127.0.0.1:8765",
+            parent=self,
+        )
+        if address is None:
+            return
+        NotesDB.save_setting("rpc_address", address.strip())
+        error = self.start_rpc_server()
+        if error:
+            messagebox.showerror(
+                "🔌 Scripting Server",
+                f"Could not serve {address}: {error}",
+                parent=self,
+            )
+        elif self.rpc_server:
+            messagebox.showinfo(
+                "🔌 Scripting Server",
+                f"Listening on {self.rpc_server.address}.\nMethods: "
+                + ", ".join(self.rpc_server.methods)
+                + "\n\nEvery request needs the token stored in\n"
+                + os.path.abspath(self.rpc_server.token_path),
+                parent=self,
+            )
+
+    def show_quick_switcher(self, event=None):
+        QuickSwitcher(self, self.note_index, self.load_note)
+        return "break"
+
+    def show_open_tasks(self):
+        OpenTasksDialog(self, self.load_note)
+
+    def show_maintenance_log(self):
+        MaintenanceLogDialog(self, self.maintenance)
+
+    def run_selected_job(self):
+        name = self.job_choice.get()
+        if any(job.name == name for job in self.jobs.running()):
+            messagebox.showinfo("Background jobs", f"{name} is already running.")
+            return
+        function = JobRunner.JOBS[name]
+        args = ()
+        if function in JobRunner.FOLDER_JOBS:
+            folder = filedialog.askdirectory(
+                title=name, initialdir=os.path.expanduser("~"), parent=self
+            )
+            if not folder:
+                return
+            args = (folder,)
+        on_done = self.show_duplicates if function is find_duplicates_job else None
+        self.jobs.submit(name, function, *args, on_done=on_done)
+
+    def show_duplicates(self, job: Job):
+        if not job.result:
+            messagebox.showinfo("🧬 Duplicate notes", "No near-duplicate notes found.")
+            return
+        DuplicatesDialog(
+            self, job.result, self.open_duplicate, self.on_duplicates_changed
+        )
+
+    def open_duplicate(self, note_id: int):
+        if self.commit_current_note():
+            self.load_note(note_id)
+
+    def on_duplicates_changed(self, note_ids) -> bool:
+        # None before a change: the open note is saved first
+        if note_ids is None:
+            return self.commit_current_note()
+        if self.current_note and self.current_note.id in note_ids:
+            if NotesDB.load_note(self.current_note.id):
+                self.load_note(self.current_note.id)
+            else:
+                self.hide_editor()
+        self.refresh_changed_notes(note_ids)
+        return True
+
+    def refresh_jobs_panel(self):
+        # Rows are reused between polls so the labels don't flicker
+        jobs = {job.id: job for job in self.jobs.jobs}
+        for job_id in list(self.job_rows):
+            if job_id not in jobs:
+                self.job_rows.pop(job_id)[0].destroy()
+        for job in self.jobs.jobs:
+            if job.id not in self.job_rows:
+                row = ModernFrame(self.jobs_frame)
+                row.pack(fill=tk.X, pady=(0, 2))
+                label = ModernLabel(
+                    row, style="caption", text="", justify=tk.LEFT, wraplength=180
+                )
+                label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+                cancel_btn = ModernButton(
+                    row,
+                    text="✖",
+                    style="secondary",
+                    font=("Segoe UI", 8),
+                    command=lambda job=job: self.jobs.cancel(job),
+                    width=2,
+                )
+                cancel_btn.pack(side=tk.RIGHT)
+                self.job_rows[job.id] = (row, label, cancel_btn)
+            row, label, cancel_btn = self.job_rows[job.id]
+            if job.state == "running":
+                text = f"{job.name}: {job.done:,}/{job.total:,}"
+                if job.done:
+                    text += f" • {job.rate():,.0f}/s"
+                eta = job.eta()
+                if eta is not None:
+                    text += f" • ETA {eta:.0f}s"
+            else:
+                text = f"{job.name}: {job.state}"
+                if job.message:
+                    text += f" — {job.message}"
+                cancel_btn.pack_forget()
+            label.configure(text=text)
+
+    def pause_for_restore(self):
+        # Closes this instance's other connections before a restore
+        self.restoring = True
+        self.change_watcher.close()
+        self.maintenance.close()
+        if self.markdown_sync:
+            self.markdown_sync.stop()
+        if self.rpc_server:
+            self.rpc_server.stop()
+            self.rpc_server = None
+        if self.related:
+            NotesDB.remove_listener(self.related.on_notes_written)
+            self.related.stop()
+            self.related = None
+
+    def on_database_restored(self, restored: bool = True):
+        # Restarts what pause_for_restore stopped
+        if restored:
+            # The whole database changed underneath us
+            self.hide_editor()
+            # Snapshots taken by older versions are brought up to date
+            init_database()
+        folder = self.markdown_sync.folder if self.markdown_sync else ""
+        self.markdown_sync = None
+        if folder and restored:
+            # Files that still match a note are adopted on the next pass
+            MarkdownSync.reset()
+            NotesDB.save_setting("markdown_sync_folder", folder)
+        self.start_markdown_sync()
+        self.change_watcher = ChangeWatcher()
+        self.maintenance = MaintenanceScheduler(self, lambda: self.last_activity)
+        self.maintenance.start()
+        self.start_rpc_server()
+        self.start_related_notes()
+        self.restoring = False
+        if restored:
+            self.note_index.load(NotesDB.load_note_metadata())
+            self.search_cache = (None, None)
+            self.refresh_notes_grid()
+
+    def refresh_relative_times(self):
+        # One shared timer keeps every card's "5 min ago" text current
+        time_formatter.tick()
+        for card in self.note_cards:
+            card.time_label.config(text=time_formatter.relative(card.modified_at))
+        self.card_canvas.refresh_times()
+        self.after(60000, self.refresh_relative_times)
 
     def setup_style(self):
         style = ttk.Style()
@@ -881,7 +7069,9 @@ class ModernNoteApp(tk.Tk):
                 scrollregion=self.notes_canvas.bbox("all")
             ),
         )
-        self.notes_canvas.create_window((0, 0), window=self.notes_frame, anchor="nw")
+        self.notes_window = self.notes_canvas.create_window(
+            (0, 0), window=self.notes_frame, anchor="nw"
+        )
         self.notes_canvas.configure(yscrollcommand=scrollbar.set)
         self.notes_canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
@@ -890,6 +7080,55 @@ class ModernNoteApp(tk.Tk):
             self.notes_canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
 
         self.notes_canvas.bind("<MouseWheel>", _on_mousewheel)
+        self.card_canvas = CanvasCardGrid(
+            self.notes_canvas,
+            self.on_card_click,
+            self.toggle_pin,
+            self.start_rubber_band,
+        )
+        # Rubber-band selection starts on empty space around the cards
+        self.notes_canvas.bind("<Button-1>", self.start_rubber_band)
+        self.notes_frame.bind("<Button-1>", self.start_rubber_band)
+        for widget in (self.notes_canvas, self.notes_frame):
+            widget.bind("<B1-Motion>", self.drag_rubber_band)
+            widget.bind("<ButtonRelease-1>", self.end_rubber_band)
+
+        # Actions for the selected notes
+        self.selection_bar = ModernFrame(self.main_container)
+        self.selection_label = ModernLabel(self.selection_bar, text="")
+        self.selection_label.pack(side=tk.LEFT, padx=(0, 10))
+        for text, command, style in (
+            ("📌 Pin", lambda: self.pin_selected(True), "secondary"),
+            ("📍 Unpin", lambda: self.pin_selected(False), "secondary"),
+            ("🏷️ Category", self.categorize_selected, "secondary"),
+            ("🗑️ Delete", self.delete_selected, "danger"),
+        ):
+            ModernButton(
+                self.selection_bar, text=text, command=command, style=style
+            ).pack(side=tk.LEFT, padx=(0, 5))
+        color_menu = tk.Menu(self, tearoff=0)
+        for color_tag in self.COLOR_TAGS:
+            color_menu.add_command(
+                label=color_tag,
+                command=lambda color_tag=color_tag: self.color_selected(color_tag),
+            )
+        color_btn = ModernButton(
+            self.selection_bar, text="🎨 Colour", style="secondary"
+        )
+        color_btn.configure(
+            command=lambda: color_menu.tk_popup(
+                color_btn.winfo_rootx(),
+                color_btn.winfo_rooty() + color_btn.winfo_height(),
+            )
+        )
+        color_btn.pack(side=tk.LEFT, padx=(0, 5))
+        ModernButton(
+            self.selection_bar,
+            text="✖",
+            style="secondary",
+            command=self.clear_selection,
+            width=2,
+        ).pack(side=tk.RIGHT)
 
         # Floating editor panel (larger size)
         self.editor_panel = ModernFrame(self)
@@ -997,16 +7236,140 @@ class ModernNoteApp(tk.Tk):
         self.search_var.trace("w", self.on_search)
         self.search_entry = ModernEntry(search_frame, textvariable=self.search_var)
         self.search_entry.pack(fill=tk.X, pady=(0, 5))
+        # Shows query syntax errors
+        self.search_hint = ModernLabel(
+            search_frame, style="caption", text="", wraplength=180, justify=tk.LEFT
+        )
+        self.search_hint.pack(anchor=tk.W)
+
+        self.fuzzy_search_var = tk.BooleanVar(value=False)
+        fuzzy_check = ModernCheckbutton(
+            search_frame,
+            text="〰️ Typo-tolerant",
+            variable=self.fuzzy_search_var,
+            command=self.on_search,
+            state=tk.NORMAL if FUZZY_SEARCH_AVAILABLE else tk.DISABLED,
+        )
+        fuzzy_check.pack(anchor=tk.W, pady=(0, 5))
 
         # Category filter
         category_label = ModernLabel(search_frame, text="🏷️ Category:")
         category_label.pack(anchor=tk.W, pady=(0, 3))
 
+        category_row = ModernFrame(search_frame)
+        category_row.pack(fill=tk.X)
         self.category_filter = ttk.Combobox(
-            search_frame, style="Modern.TCombobox", width=15
+            category_row, style="Modern.TCombobox", width=15
         )
-        self.category_filter.pack(fill=tk.X)
+        self.category_filter.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.category_filter.bind("<<ComboboxSelected>>", self.on_category_filter)
+        # Combobox entry text -> category name, the entries carry note counts
+        self.category_choices = {}
+        rename_category_btn = ModernButton(
+            category_row,
+            text="✏️",
+            command=self.rename_category,
+            style="secondary",
+            width=2,
+        )
+        rename_category_btn.pack(side=tk.LEFT, padx=(5, 0))
+
+        # Sort order
+        sort_label = ModernLabel(search_frame, text="↕️ Sort:")
+        sort_label.pack(anchor=tk.W, pady=(5, 3))
+
+        self.sort_filter = ttk.Combobox(
+            search_frame,
+            style="Modern.TCombobox",
+            width=15,
+            values=list(self.SORT_ORDERS),
+            state="readonly",
+        )
+        self.sort_filter.set("Pinned & recent")
+        self.sort_filter.pack(fill=tk.X)
+        self.sort_filter.bind("<<ComboboxSelected>>", self.on_sort_change)
+
+        # Card renderer
+        self.canvas_cards_var = tk.BooleanVar(value=self.grid_renderer == "canvas")
+        canvas_cards_check = ModernCheckbutton(
+            search_frame,
+            text="⚡ Lightweight cards",
+            variable=self.canvas_cards_var,
+            command=self.toggle_grid_renderer,
+        )
+        canvas_cards_check.pack(anchor=tk.W, pady=(5, 0))
+
+        self.index_label = ModernLabel(search_frame, style="caption", text="")
+        self.index_label.pack(anchor=tk.W, pady=(5, 0))
+
+        open_tasks_btn = ModernButton(
+            search_frame,
+            text="☑️ All open tasks",
+            command=self.show_open_tasks,
+            style="secondary",
+        )
+        open_tasks_btn.pack(fill=tk.X, pady=(10, 0))
+
+        markdown_sync_btn = ModernButton(
+            search_frame,
+            text="📁 Markdown sync",
+            command=self.configure_markdown_sync,
+            style="secondary",
+        )
+        markdown_sync_btn.pack(fill=tk.X, pady=(5, 0))
+
+        rpc_btn = ModernButton(
+            search_frame,
+            text="🔌 Scripting server",
+            command=self.configure_rpc_server,
+            style="secondary",
+        )
+        rpc_btn.pack(fill=tk.X, pady=(5, 0))
+
+        backups_btn = ModernButton(
+            search_frame,
+            text="🗄️ Backups",
+            command=self.show_backups,
+            style="secondary",
+        )
+        backups_btn.pack(fill=tk.X, pady=(5, 0))
+
+        maintenance_btn = ModernButton(
+            search_frame,
+            text="🧹 Maintenance log",
+            command=self.show_maintenance_log,
+            style="secondary",
+        )
+        maintenance_btn.pack(fill=tk.X, pady=(5, 0))
+
+        # Background jobs
+        jobs_label = ModernLabel(search_frame, text="⚙️ Background jobs:")
+        jobs_label.pack(anchor=tk.W, pady=(10, 3))
+
+        jobs_row = ModernFrame(search_frame)
+        jobs_row.pack(fill=tk.X)
+        self.job_choice = ttk.Combobox(
+            jobs_row,
+            style="Modern.TCombobox",
+            width=15,
+            values=list(JobRunner.JOBS),
+            state="readonly",
+        )
+        self.job_choice.set(next(iter(JobRunner.JOBS)))
+        self.job_choice.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        run_job_btn = ModernButton(
+            jobs_row,
+            text="▶",
+            style="secondary",
+            font=("Segoe UI", 10),
+            command=self.run_selected_job,
+            width=2,
+        )
+        run_job_btn.pack(side=tk.LEFT, padx=(5, 0))
+
+        self.jobs_frame = ModernFrame(search_frame)
+        self.jobs_frame.pack(fill=tk.X, pady=(5, 0))
+        self.job_rows = {}
 
     def create_editor_panel(self):
         # Editor header
@@ -1048,9 +7411,8 @@ class ModernNoteApp(tk.Tk):
         color_label = ModernLabel(form_frame, text="🎨 Color Tag:")
         color_label.pack(anchor=tk.W, pady=(0, 3))
         self.color_var = tk.StringVar(value="default")
-        color_options = ["default", "#ff9999", "#99ff99", "#9999ff"]
         self.color_menu = ttk.OptionMenu(
-            form_frame, self.color_var, "default", *color_options
+            form_frame, self.color_var, "default", *self.COLOR_TAGS
         )
         self.color_menu.pack(fill=tk.X)
 
@@ -1076,12 +7438,106 @@ class ModernNoteApp(tk.Tk):
         )
         delete_btn.pack(side=tk.LEFT, padx=5)
 
+        history_btn = ModernButton(
+            controls_frame,
+            text="🕘 History",
+            command=self.show_history,
+            style="secondary",
+        )
+        history_btn.pack(side=tk.LEFT)
+
         self.timestamp_label = ModernLabel(controls_frame, style="caption", text="")
         self.timestamp_label.pack(side=tk.RIGHT)
 
+        # Attachments
+        attachments_frame = ModernFrame(editor_header)
+        attachments_frame.pack(fill=tk.X, pady=5)
+
+        self.attachment_preview = ModernLabel(attachments_frame, text="📎")
+        self.attachment_preview.pack(side=tk.LEFT, padx=(0, 5))
+
+        self.attachment_list = tk.Listbox(
+            attachments_frame,
+            height=3,
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectbackground=theme.get_color("primary"),
+            selectforeground="white",
+            font=("Segoe UI", 9, "normal"),
+            relief="flat",
+            highlightthickness=0,
+            activestyle="none",
+        )
+        self.attachment_list.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.attachment_list.bind("<<ListboxSelect>>", self.on_attachment_select)
+        self.attachment_list.bind("<Double-Button-1>", lambda e: self.open_attachment())
+        self.attachments = []
+
+        for text, command in (
+            ("✖", self.remove_attachment),
+            ("💾", self.export_attachment),
+            ("📂", self.open_attachment),
+            ("➕ Attach", self.add_attachment),
+        ):
+            ModernButton(
+                attachments_frame, text=text, command=command, style="secondary"
+            ).pack(side=tk.RIGHT, padx=(5, 0))
+
+        # Backlinks
+        backlinks_frame = ModernFrame(editor_header)
+        backlinks_frame.pack(fill=tk.X)
+
+        backlinks_label = ModernLabel(backlinks_frame, text="🔗 Linked from:")
+        backlinks_label.pack(side=tk.LEFT, anchor=tk.N, padx=(0, 5))
+
+        self.backlink_list = tk.Listbox(
+            backlinks_frame,
+            height=2,
+            bg=theme.get_color("surface"),
+            fg=theme.get_color("text"),
+            selectbackground=theme.get_color("primary"),
+            selectforeground="white",
+            font=("Segoe UI", 9, "normal"),
+            relief="flat",
+            highlightthickness=0,
+            activestyle="none",
+        )
+        self.backlink_list.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.backlink_list.bind("<Double-Button-1>", self.open_backlink)
+        self.backlinks = []
+
+        # Related notes, when numpy is available
+        self.related_list = None
+        self.related_notes = []
+        self.related_retry = None
+        if RELATED_NOTES_AVAILABLE:
+            related_frame = ModernFrame(editor_header)
+            related_frame.pack(fill=tk.X, pady=(5, 0))
+
+            related_label = ModernLabel(related_frame, text="🧭 Related:")
+            related_label.pack(side=tk.LEFT, anchor=tk.N, padx=(0, 5))
+
+            self.related_list = tk.Listbox(
+                related_frame,
+                height=3,
+                bg=theme.get_color("surface"),
+                fg=theme.get_color("text"),
+                selectbackground=theme.get_color("primary"),
+                selectforeground="white",
+                font=("Segoe UI", 9, "normal"),
+                relief="flat",
+                highlightthickness=0,
+                activestyle="none",
+            )
+            self.related_list.pack(side=tk.LEFT, fill=tk.X, expand=True)
+            self.related_list.bind("<Double-Button-1>", self.open_related)
+
         # Content area
         self.content_frame = ModernFrame(self.editor_panel)
         self.content_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        # One view of each kind, reused for every note that is opened
+        self.note_view = ModernNoteView(self.content_frame, self.open_wiki_link)
+        self.task_view = ModernTaskView(self.content_frame)
 
     def show_editor(self):
         self.editor_panel.lift()
@@ -1117,53 +7573,407 @@ class ModernNoteApp(tk.Tk):
 
         fade()
 
-    def refresh_notes_grid(self):
-        for widget in self.notes_frame.winfo_children():
-            widget.destroy()
+    def selected_category(self) -> Optional[str]:
+        selected = self.category_filter.get()
+        if not selected or selected == "All":
+            return None
+        return self.category_choices.get(selected, selected)
+
+    def query_visible_notes(self) -> List[tuple]:
         search_query = self.search_var.get().strip()
-        selected_category = self.category_filter.get()
+        fuzzy = bool(search_query) and self.fuzzy_search_var.get()
+        category = self.selected_category()
+        note_ids = None
         if search_query:
-            notes = NotesDB.search_notes(search_query)
+            # Sorting comes from the in-memory index
+            cached_query, note_ids = self.search_cache
+            if cached_query != (search_query, fuzzy, category):
+                error = ""
+                if fuzzy:
+                    note_ids = NotesDB.fuzzy_search_note_ids(search_query)
+                else:
+                    try:
+                        note_ids = SearchQuery(search_query).note_ids(category)
+                    except QueryError as query_error:
+                        note_ids = []
+                        error = f"⚠️ {query_error}"
+                self.search_hint.config(text=error)
+                self.search_cache = ((search_query, fuzzy, category), note_ids)
+            if not fuzzy:
+                category = None
         else:
-            notes = NotesDB.load_all_notes()
+            self.search_hint.config(text="")
+        return self.note_index.query(
+            category=category,
+            # Fuzzy results are shown best match first
+            order=None if fuzzy else self.SORT_ORDERS[self.sort_filter.get()],
+            note_ids=note_ids,
+        )
+
+    def refresh_notes_grid(self):
+        for widget in self.notes_frame.winfo_children():
+            widget.destroy()
+        notes = self.query_visible_notes()
         self.notes_data = notes
-        if selected_category and selected_category != "All":
-            notes = [note for note in notes if note[2] == selected_category]
-            self.notes_data = notes
+        self.note_cards = []
+        time_formatter.tick()
+        if self.grid_renderer == "canvas":
+            self.notes_canvas.itemconfigure(self.notes_window, state="hidden")
+            self.card_canvas.render(notes)
+        else:
+            self.notes_canvas.itemconfigure(self.notes_window, state="normal")
+            self.render_note_cards(notes)
+        self.refresh_categories()
+        self.show_selection()
+
+    def refresh_categories(self):
+        selected = self.selected_category()
+        self.category_choices = {
+            f"{name} ({count})": name for name, count in NotesDB.list_categories()
+        }
+        self.category_filter["values"] = ["All"] + list(self.category_choices)
+        if selected is None:
+            self.category_filter.set("All")
+        else:
+            # Keep the selection when its note count changes
+            for choice, name in self.category_choices.items():
+                if name == selected:
+                    self.category_filter.set(choice)
+                    break
+        self.index_label.config(
+            text=f"{len(self.note_index)} notes • "
+            f"{self.note_index.bytes_per_note():.0f} B/note in memory"
+        )
+
+    def make_note_card(self, note: tuple) -> NoteCard:
+        (
+            note_id,
+            title,
+            category,
+            modified_at,
+            mode,
+            pinned,
+            color_tag,
+            task_total,
+            task_done,
+            preview,
+        ) = note
+        return NoteCard(
+            self.notes_frame,
+            note_id,
+            title,
+            category,
+            modified_at,
+            mode,
+            color_tag,
+            pinned,
+            self.load_note,
+            self.toggle_pin,
+            task_total,
+            task_done,
+            preview,
+        )
+
+    def render_note_cards(self, notes: List[tuple]):
         row = 0
         col = 0
-        for note_id, title, category, modified_at, mode, pinned, color_tag in notes:
-            card = NoteCard(
-                self.notes_frame,
-                note_id,
-                title,
-                category,
-                modified_at,
-                mode,
-                color_tag,
-                pinned,
-                self.load_note,
-                self.toggle_pin,
-            )
+        for note in notes:
+            card = self.make_note_card(note)
             card.grid(row=row, column=col, padx=5, pady=5)
+            self.note_cards.append(card)
             col += 1
             if col >= 4:  # 4 cards per row
                 col = 0
                 row += 1
-        categories = ["All"] + NotesDB.get_categories()
-        self.category_filter["values"] = categories
-        if not self.category_filter.get():
-            self.category_filter.set("All")
+
+    def refresh_changed_notes(self, note_ids: List[int]):
+        # Redraws only the given cards and those that came into view
+        notes = self.query_visible_notes()
+        changed = set(note_ids)
+        visible = {note[0] for note in notes}
+        if self.grid_renderer == "canvas":
+            grid = self.card_canvas
+            for note_id in set(grid.positions) - visible:
+                grid.remove_card(note_id)
+            for position, note in enumerate(notes):
+                if note[0] in changed or note[0] not in grid.positions:
+                    grid.update_card(position, note)
+                elif grid.positions[note[0]] != position:
+                    grid.move_card(note[0], position)
+            grid.resize(len(notes))
+        else:
+            cards = {
+                card.note_id: (position, card)
+                for position, card in enumerate(self.note_cards)
+            }
+            for note_id in cards.keys() - visible:
+                cards[note_id][1].destroy()
+            self.note_cards = []
+            for position, note in enumerate(notes):
+                old_position, card = cards.get(note[0], (None, None))
+                if card is None or note[0] in changed:
+                    if card is not None:
+                        card.destroy()
+                    card = self.make_note_card(note)
+                    old_position = None
+                if old_position != position:
+                    card.grid(row=position // 4, column=position % 4, padx=5, pady=5)
+                self.note_cards.append(card)
+        self.notes_data = notes
+        self.refresh_categories()
+        self.show_selection()
+
+    def show_selection(self):
+        # Notes that left the grid drop out of the selection
+        self.selected_notes &= {note[0] for note in self.notes_data}
+        if self.grid_renderer == "canvas":
+            self.card_canvas.set_selected(self.selected_notes)
+        else:
+            for card in self.note_cards:
+                card.set_selected(card.note_id in self.selected_notes)
+        if self.selected_notes:
+            self.selection_label.config(text=f"{len(self.selected_notes):,} selected")
+            if not self.selection_bar.winfo_manager():
+                self.selection_bar.pack(
+                    fill=tk.X, padx=15, pady=(5, 0), before=self.grid_container
+                )
+        else:
+            self.selection_bar.pack_forget()
+
+    def clear_selection(self):
+        self.selected_notes = set()
+        self.selection_anchor = None
+        self.show_selection()
+
+    def on_card_click(self, note_id: int, event):
+        if event.state & self.CONTROL_MASK:
+            self.selected_notes ^= {note_id}
+            self.selection_anchor = note_id
+        elif event.state & self.SHIFT_MASK:
+            visible = [note[0] for note in self.notes_data]
+            if self.selection_anchor in visible:
+                first, last = sorted(
+                    (visible.index(self.selection_anchor), visible.index(note_id))
+                )
+                self.selected_notes |= set(visible[first : last + 1])
+            else:
+                self.selected_notes = {note_id}
+                self.selection_anchor = note_id
+        else:
+            self.clear_selection()
+            self.load_note(note_id)
+            return
+        self.show_selection()
+
+    def grid_point(self, event) -> tuple:
+        # Canvas coordinates of an event on the canvas or the card frame
+        canvas = self.notes_canvas
+        return (
+            canvas.canvasx(event.x_root - canvas.winfo_rootx()),
+            canvas.canvasy(event.y_root - canvas.winfo_rooty()),
+        )
+
+    def cards_in(self, x0, y0, x1, y1) -> List[int]:
+        if self.grid_renderer == "canvas":
+            return self.card_canvas.cards_in(x0, y0, x1, y1)
+        # The card frame sits at the canvas origin
+        return [
+            card.note_id
+            for card in self.note_cards
+            if card.winfo_x() < x1
+            and card.winfo_x() + card.winfo_width() > x0
+            and card.winfo_y() < y1
+            and card.winfo_y() + card.winfo_height() > y0
+        ]
+
+    def start_rubber_band(self, event):
+        # Ctrl adds to the current selection
+        base = set(self.selected_notes) if event.state & self.CONTROL_MASK else set()
+        self.rubber_band = (*self.grid_point(event), base)
+        self.selected_notes = set(base)
+        self.show_selection()
+
+    def drag_rubber_band(self, event):
+        if self.rubber_band is None:
+            return
+        x0, y0, base = self.rubber_band
+        x1, y1 = self.grid_point(event)
+        box = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+        # In widget mode only the card highlights show the band
+        self.notes_canvas.delete("band")
+        self.notes_canvas.create_rectangle(
+            *box, outline=theme.get_color("primary"), dash=(4, 2), tags=("band",)
+        )
+        self.selected_notes = base | set(self.cards_in(*box))
+        self.show_selection()
+
+    def end_rubber_band(self, event):
+        self.rubber_band = None
+        self.notes_canvas.delete("band")
+
+    def update_open_note(self, stamps: dict, field: str, value):
+        # A batch change to the note open in the editor: take the new value
+        # and modified_at, or its next save would be a conflict
+        note = self.current_note
+        if not note or note.id not in stamps:
+            return
+        setattr(note, field, value)
+        note.modified_at = stamps[note.id]
+        if field == "category":
+            self.category_entry.delete(0, tk.END)
+            self.category_entry.insert(0, value)
+        elif field == "color_tag":
+            self.color_var.set(value)
+        self.show_timestamps()
+
+    def pin_selected(self, pinned: bool):
+        note_ids = list(self.selected_notes)
+        stamps = NotesDB.set_pinned(note_ids, pinned)
+        self.update_open_note(stamps, "pinned", pinned)
+        self.refresh_changed_notes(note_ids)
+
+    def color_selected(self, color_tag: str):
+        note_ids = list(self.selected_notes)
+        stamps = NotesDB.set_color(note_ids, color_tag)
+        self.update_open_note(stamps, "color_tag", color_tag)
+        self.refresh_changed_notes(note_ids)
+
+    def categorize_selected(self):
+        note_ids = list(self.selected_notes)
+        category = simpledialog.askstring(
+            "🏷️ Set Category",
+            f"Category for {len(note_ids):,} notes (empty to clear):",
+            parent=self,
+        )
+        if category is None:
+            return
+        stamps = NotesDB.set_category(note_ids, category.strip())
+        self.update_open_note(stamps, "category", category.strip())
+        self.refresh_changed_notes(note_ids)
+
+    def delete_selected(self):
+        note_ids = list(self.selected_notes)
+        if not messagebox.askyesno(
+            "🗑️ Confirm Delete",
+            f"Delete {len(note_ids):,} notes?\nThis action cannot be undone.",
+            parent=self,
+        ):
+            return
+        NotesDB.delete_notes(note_ids)
+        if self.current_note and self.current_note.id in self.selected_notes:
+            self.hide_editor()
+        self.clear_selection()
+        self.refresh_changed_notes(note_ids)
+
+    def poll_external_changes(self):
+        if self.restoring:
+            self.after(1000, self.poll_external_changes)
+            return
+        note_ids = self.change_watcher.poll()
+        if note_ids:
+            rows = {
+                values[0]: values for values in NotesDB.load_note_metadata(note_ids)
+            }
+            # Our own writes already reached the index through NotesDB.notify
+            saved = [
+                note_id
+                for note_id in note_ids
+                if note_id in rows and not self.note_index.is_current(rows[note_id])
+            ]
+            deleted = [
+                note_id
+                for note_id in note_ids
+                if note_id not in rows and note_id in self.note_index
+            ]
+            if deleted:
+                NotesDB.notify("delete", deleted)
+            if saved:
+                NotesDB.notify("save", saved)
+            if saved or deleted:
+                self.refresh_changed_notes(saved + deleted)
+                if self.current_note and self.current_note.id in saved + deleted:
+                    self.timestamp_label.config(
+                        text="⚠️ This note was changed in another window"
+                    )
+        self.check_sync_removals()
+        self.after(1000, self.poll_external_changes)
+
+    def check_sync_removals(self):
+        # Asks once per set of vanished files before their notes are deleted
+        sync = self.markdown_sync
+        held = frozenset(sync.held_removals) if sync else frozenset()
+        if not held or held == self.asked_sync_removals:
+            return
+        self.asked_sync_removals = held
+        answer = messagebox.askyesnocancel(
+            "📁 Markdown Sync",
+            f"{len(held)} Markdown files disappeared from {sync.folder} at once.\n\n"
+            "Yes deletes their notes, including history and attachments.\n"
+            "No writes the files back from the notes.\n"
+            "Cancel keeps the notes and asks again if more files change.",
+            parent=self,
+        )
+        if answer is not None:
+            sync.removal_decision = "delete" if answer else "restore"
+
+    def toggle_grid_renderer(self):
+        self.grid_renderer = "canvas" if self.canvas_cards_var.get() else "widgets"
+        NotesDB.save_setting("grid_renderer", self.grid_renderer)
+        if self.grid_renderer == "canvas":
+            self.card_canvas.attach()
+        else:
+            self.card_canvas.detach()
+            self.notes_canvas.bind("<Button-1>", self.start_rubber_band)
+        self.refresh_notes_grid()
+
+    def on_notes_written(self, event, note_ids):
+        # Any write can change which notes match the current search
+        self.search_cache = (None, None)
 
     def on_search(self, *args):
         self.refresh_notes_grid()
 
+    def on_sort_change(self, event=None):
+        self.refresh_notes_grid()
+
     def on_category_filter(self, event=None):
         self.refresh_notes_grid()
 
+    def rename_category(self):
+        old_name = self.selected_category()
+        if old_name is None:
+            messagebox.showinfo(
+                "🏷️ Rename Category", "Select a category to rename first.", parent=self
+            )
+            return
+        new_name = simpledialog.askstring(
+            "🏷️ Rename Category",
+            f"New name for '{old_name}':",
+            initialvalue=old_name,
+            parent=self,
+        )
+        new_name = (new_name or "").strip()
+        if not new_name or new_name == old_name:
+            return
+        if new_name in self.category_choices.values() and not messagebox.askyesno(
+            "🏷️ Merge Categories",
+            f"'{new_name}' already exists. Move all notes from '{old_name}' into it?",
+            parent=self,
+        ):
+            return
+        NotesDB.rename_category(old_name, new_name)
+        if self.current_note and self.current_note.category == old_name:
+            self.current_note.category = new_name
+            self.category_entry.delete(0, tk.END)
+            self.category_entry.insert(0, new_name)
+        self.category_filter.set(new_name)
+        self.refresh_notes_grid()
+
     def load_note(self, note_id: int):
         note = NotesDB.load_note(note_id)
         if note:
+            # Loaded up front, so a forced save over a deletion keeps the tasks
+            note.tasks
             self.current_note = note
             self.color_var.set(note.color_tag)
             self.load_current_note()
@@ -1194,38 +8004,138 @@ class ModernNoteApp(tk.Tk):
             self.refresh_notes_grid()
 
     def toggle_pin(self, note_id: int):
-        note = NotesDB.load_note(note_id)
-        if note:
-            note.pinned = not note.pinned
-            NotesDB.save_note(note)
-            self.refresh_notes_grid()
+        metadata = self.note_index.metadata(note_id)
+        if metadata:
+            stamps = NotesDB.set_pinned([note_id], not metadata[6])
+            self.update_open_note(stamps, "pinned", not metadata[6])
+            self.refresh_changed_notes([note_id])
 
     def load_current_note(self):
         if not self.current_note:
             return
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
         self.title_entry.delete(0, tk.END)
         self.title_entry.insert(0, self.current_note.title)
         self.category_entry.delete(0, tk.END)
         self.category_entry.insert(0, self.current_note.category)
         self.color_var.set(self.current_note.color_tag)
+        self.refresh_attachments()
+        self.refresh_backlinks()
+        self.refresh_related()
+        self.show_timestamps()
+        self.show_current_view()
+
+    def show_timestamps(self):
         if self.current_note.created_at:
-            try:
-                created = datetime.fromisoformat(self.current_note.created_at)
-                modified = datetime.fromisoformat(self.current_note.modified_at)
-                timestamp_text = f"Created: {created.strftime('%m/%d/%Y %H:%M')} • Modified: {modified.strftime('%m/%d/%Y %H:%M')}"
-                self.timestamp_label.config(text=timestamp_text)
-            except:
-                self.timestamp_label.config(text="")
+            created = time_formatter.absolute(
+                self.current_note.created_at, "%m/%d/%Y %H:%M"
+            )
+            modified = time_formatter.absolute(
+                self.current_note.modified_at or self.current_note.created_at,
+                "%m/%d/%Y %H:%M",
+            )
+            self.timestamp_label.config(
+                text=f"Created: {created} • Modified: {modified}"
+            )
+        else:
+            self.timestamp_label.config(text="")
+
+    def refresh_backlinks(self):
+        note_id = self.current_note.id if self.current_note else None
+        self.backlinks = NotesDB.list_backlinks(note_id) if note_id else []
+        self.backlink_list.delete(0, tk.END)
+        for backlink_id, title in self.backlinks:
+            self.backlink_list.insert(tk.END, title)
+
+    def open_backlink(self, event=None):
+        selection = self.backlink_list.curselection()
+        if selection and self.commit_current_note():
+            self.load_note(self.backlinks[selection[0]][0])
+
+    def refresh_related(self):
+        if self.related_list is None:
+            return
+        if self.related_retry:
+            self.after_cancel(self.related_retry)
+            self.related_retry = None
+        self.related_list.delete(0, tk.END)
+        self.related_notes = []
+        note_id = self.current_note.id if self.current_note else None
+        if note_id is None or not self.related:
+            return
+        if self.related.failed:
+            self.related_list.insert(
+                tk.END, f"⚠️ Indexing failed: {self.related.last_error}"
+            )
+            return
+        if not self.related.ready:
+            self.related_list.insert(tk.END, "Indexing notes…")
+            self.related_retry = self.after(1000, self.refresh_related)
+            return
+        for other_id, score in self.related.related(note_id):
+            if other_id in self.note_index:
+                self.related_notes.append(other_id)
+                title = self.note_index.row(other_id)[1]
+                self.related_list.insert(tk.END, f"{title}  ·  {score:.0%}")
+
+    def open_related(self, event=None):
+        selection = self.related_list.curselection()
+        if selection and selection[0] < len(self.related_notes):
+            if self.commit_current_note():
+                self.load_note(self.related_notes[selection[0]])
+
+    def start_related_notes(self):
+        if self.related:
+            NotesDB.remove_listener(self.related.on_notes_written)
+            self.related.stop()
+            self.related = None
+        if RELATED_NOTES_AVAILABLE:
+            self.related = RelatedNotes()
+            NotesDB.add_listener(self.related.on_notes_written)
+            self.related.start()
+
+    def open_wiki_link(self, title: str):
+        note_id = NotesDB.resolve_link(
+            self.current_note.id if self.current_note else None, title
+        )
+        if note_id is None and not messagebox.askyesno(
+            "🔗 New Note",
+            f"No note is titled '{title}'. Create it?",
+            parent=self,
+        ):
+            return
+        if not self.commit_current_note():
+            return
+        if note_id is None:
+            note_id = NotesDB.save_note(Note(title=title))
+        self.load_note(note_id)
+        self.refresh_notes_grid()
+
+    def commit_current_note(self) -> bool:
+        # False when the user chose to keep editing after a conflict
+        if not self.current_note:
+            return True
+        self.current_note.title = self.title_entry.get().strip()
+        self.current_note.category = self.category_entry.get().strip()
+        self.current_note.color_tag = self.color_var.get()
+        if self.current_view and hasattr(self.current_view, "update_note"):
+            self.current_view.update_note()
+        return not self.current_note.title or self.save_or_resolve_conflict(
+            self.current_note
+        )
+
+    def show_current_view(self):
+        # Rebinds the matching view to the current note; no widgets are built
         if self.current_note.mode == "normal":
-            self.current_view = ModernNoteView(self.content_frame, self.current_note)
+            view, other = self.note_view, self.task_view
             self.mode_button.config(text="📋 Switch to Tasks")
         else:
-            self.current_view = ModernTaskView(self.content_frame, self.current_note)
+            view, other = self.task_view, self.note_view
             self.mode_button.config(text="📝 Switch to Notes")
-        self.current_view.pack(fill=tk.BOTH, expand=True)
-        self.update_widget_theme(self.current_view)
+        other.pack_forget()
+        view.show_note(self.current_note)
+        if not view.winfo_manager():
+            view.pack(fill=tk.BOTH, expand=True)
+        self.current_view = view
 
     def toggle_mode(self):
         if not self.current_note:
@@ -1235,7 +8145,7 @@ class ModernNoteApp(tk.Tk):
         self.current_note.mode = (
             "task" if self.current_note.mode == "normal" else "normal"
         )
-        self.load_current_note()
+        self.show_current_view()
 
     def save_note(self):
         if not self.current_note:
@@ -1251,15 +8161,217 @@ class ModernNoteApp(tk.Tk):
             return
         if self.current_view and hasattr(self.current_view, "update_note"):
             self.current_view.update_note()
-        NotesDB.save_note(self.current_note)
+        if not self.save_or_resolve_conflict(self.current_note):
+            return
         self.refresh_notes_grid()
-        self.load_current_note()
+        self.show_timestamps()
+        if self.related_list is not None and not self.related_retry:
+            # The note's new vector is stored by the related-notes thread
+            self.related_retry = self.after(1000, self.refresh_related)
         messagebox.showinfo("✅ Success", "Note saved successfully!", parent=self)
 
+    def save_or_resolve_conflict(self, note: Note) -> bool:
+        try:
+            NotesDB.save_note(note)
+            return True
+        except NoteConflictError as error:
+            deleted = error.deleted
+            answer = messagebox.askyesnocancel(
+                "⚠️ Conflict",
+                f"This note was {'deleted' if deleted else 'changed'} "
+                "in another window.\n\n"
+                "Yes: keep your version and overwrite\n"
+                "No: discard your changes and reload\n"
+                "Cancel: keep editing",
+                parent=self,
+            )
+        if answer:
+            NotesDB.save_note(note, force=True)
+            return True
+        if answer is False:
+            if deleted:
+                self.hide_editor()
+            else:
+                self.load_note(note.id)
+        return False
+
+    def run_in_background(self, work, on_done=None):
+        # Runs work() on a thread, then on_done(result, error) on the Tk thread
+        results = queue.Queue()
+
+        def target():
+            try:
+                results.put((work(), None))
+            except Exception as error:
+                results.put((None, error))
+
+        def check():
+            try:
+                result, error = results.get_nowait()
+            except queue.Empty:
+                self.after(100, check)
+                return
+            if on_done:
+                on_done(result, error)
+
+        threading.Thread(target=target, daemon=True).start()
+        self.after(100, check)
+
+    def refresh_attachments(self):
+        # Lists names and sizes only; blob bodies are read on demand
+        self.attachment_list.delete(0, tk.END)
+        self.attachment_preview.configure(image="", text="📎")
+        self.attachment_image = None
+        if not self.current_note or self.current_note.id is None:
+            self.attachments = []
+            return
+        self.attachments = AttachmentStore.list_attachments(self.current_note.id)
+        for _, filename, _, size, metadata in self.attachments:
+            details = AttachmentStore.describe(metadata)
+            self.attachment_list.insert(
+                tk.END,
+                f"{filename} • {AttachmentStore.format_size(size)}"
+                + (f" • {details}" if details else ""),
+            )
+
+    def selected_attachment(self) -> Optional[tuple]:
+        selection = self.attachment_list.curselection()
+        return self.attachments[selection[0]] if selection else None
+
+    def on_attachment_select(self, event=None):
+        attachment = self.selected_attachment()
+        if not attachment:
+            return
+        attachment_id, filename, _, size, metadata = attachment
+        if metadata is None:
+            metadata = AttachmentStore.metadata(attachment_id)
+            if metadata is None:
+                # Removed in another window meanwhile
+                self.refresh_attachments()
+                return
+            index = self.attachment_list.curselection()[0]
+            self.attachments[index] = attachment[:4] + (metadata,)
+            details = AttachmentStore.describe(metadata)
+            if details:
+                self.attachment_list.delete(index)
+                self.attachment_list.insert(
+                    index,
+                    f"{filename} • {AttachmentStore.format_size(size)} • {details}",
+                )
+                self.attachment_list.selection_set(index)
+        image = self.attachment_thumbnail(attachment_id)
+        self.attachment_image = image
+        if image:
+            self.attachment_preview.configure(image=image, text="")
+        else:
+            self.attachment_preview.configure(image="", text="📎")
+
+    def attachment_thumbnail(self, attachment_id: int) -> Optional[tk.PhotoImage]:
+        thumbnail, source = AttachmentStore.load_thumbnail_source(attachment_id)
+        try:
+            if thumbnail is not None:
+                return tk.PhotoImage(data=thumbnail)
+            if source is None:
+                return None
+            image = tk.PhotoImage(data=source)
+        except tk.TclError:
+            return None
+        longest = max(image.width(), image.height())
+        factor = max(1, -(-longest // AttachmentStore.THUMBNAIL_SIZE))
+        image = image.subsample(factor)
+        data = image.tk.call(image.name, "data", "-format", "png")
+        AttachmentStore.save_thumbnail(attachment_id, str(data).encode())
+        return image
+
+    def add_attachment(self):
+        if not self.current_note or self.current_note.id is None:
+            return
+        path = filedialog.askopenfilename(parent=self, title="📎 Attach file")
+        if not path:
+            return
+        note_id = self.current_note.id
+        self.attachment_preview.configure(image="", text="⏳")
+
+        def done(result, error):
+            if error:
+                messagebox.showerror(
+                    "❌ Error", f"Could not attach file:\n{error}", parent=self
+                )
+            if self.current_note and self.current_note.id == note_id:
+                self.refresh_attachments()
+
+        self.run_in_background(lambda: AttachmentStore.add(note_id, path), done)
+
+    def export_attachment(self):
+        attachment = self.selected_attachment()
+        if not attachment:
+            return
+        path = filedialog.asksaveasfilename(
+            parent=self, title="💾 Save attachment", initialfile=attachment[1]
+        )
+        if not path:
+            return
+
+        def done(result, error):
+            if error:
+                messagebox.showerror("❌ Error", str(error), parent=self)
+
+        self.run_in_background(
+            lambda: AttachmentStore.export(attachment[0], path), done
+        )
+
+    def open_attachment(self):
+        attachment = self.selected_attachment()
+        if not attachment:
+            return
+        folder = tempfile.mkdtemp(prefix="modern-notes-")
+        path = os.path.join(folder, attachment[1])
+
+        def done(result, error):
+            if error:
+                messagebox.showerror("❌ Error", str(error), parent=self)
+            elif hasattr(os, "startfile"):
+                os.startfile(path)
+            else:
+                webbrowser.open(f"file://{path}")
+
+        self.run_in_background(
+            lambda: AttachmentStore.export(attachment[0], path), done
+        )
+
+    def remove_attachment(self):
+        attachment = self.selected_attachment()
+        if attachment and messagebox.askyesno(
+            "🗑️ Remove Attachment",
+            f"Remove {attachment[1]} from this note?",
+            parent=self,
+        ):
+            AttachmentStore.remove(attachment[0])
+            self.refresh_attachments()
+
+    def show_history(self):
+        if not self.current_note or self.current_note.id is None:
+            return
+        RevisionHistoryDialog(self, self.current_note, self.restore_revision)
+
+    def restore_revision(self, content: str):
+        # Becomes a new revision once the note is saved
+        self.current_note.content = content
+        if self.current_view is self.note_view:
+            self.note_view.show_note(self.current_note)
+        else:
+            messagebox.showinfo(
+                "↩️ Restored",
+                "The restored text is shown when you switch back to Notes mode.",
+                parent=self,
+            )
+
     def toggle_theme(self):
         theme.toggle_theme()
         NotesDB.save_setting("theme", theme.current_theme)
         self.apply_theme()
+        self.note_view.highlighter.configure_tags()
+        self.refresh_notes_grid()
 
     def apply_theme(self):
         self.configure(bg=theme.get_color("bg"))
@@ -1284,8 +8396,9 @@ class ModernNoteApp(tk.Tk):
             activeforeground="white",
         )
         self.update_widget_theme(self)
-        if self.current_note:
-            self.load_current_note()
+        # Done tasks keep their own colour
+        if self.current_view is self.task_view:
+            self.task_view.render_tasks()
 
     def update_widget_theme(self, widget):
         widget_class = widget.__class__.__name__
@@ -1321,6 +8434,12 @@ class ModernNoteApp(tk.Tk):
                 if "secondary" not in str(widget.cget("font"))
                 else theme.get_color("text_secondary"),
             )
+        elif isinstance(widget, tk.Listbox):
+            widget.configure(
+                bg=theme.get_color("surface"),
+                fg=theme.get_color("text"),
+                selectbackground=theme.get_color("primary"),
+            )
         elif isinstance(widget, tk.Canvas):
             widget.configure(bg=theme.get_color("surface"), highlightthickness=0)
         elif isinstance(widget, tk.Checkbutton):
@@ -1335,22 +8454,120 @@ class ModernNoteApp(tk.Tk):
             self.update_widget_theme(child)
 
     def on_closing(self):
-        if self.current_note:
-            self.current_note.title = self.title_entry.get().strip()
-            self.current_note.category = self.category_entry.get().strip()
-            self.current_note.color_tag = self.color_var.get()
-            if self.current_view and hasattr(self.current_view, "update_note"):
-                self.current_view.update_note()
-            if self.current_note.title:
-                NotesDB.save_note(self.current_note)
+        if not self.commit_current_note():
+            return
+        self.change_watcher.close()
+        self.maintenance.close()
+        if self.markdown_sync:
+            self.markdown_sync.stop()
+        if self.rpc_server:
+            self.rpc_server.stop()
+        if self.related:
+            self.related.stop()
+        self.jobs.shutdown()
         self.destroy()
 
 
+# ──────────────────────────────────────────────
+# Self-Checks
+# ──────────────────────────────────────────────
+
+
+def temporary_database(path: str):
+    # Points the module at a fresh database, so checks never touch notes.db
+    global DB_FILE
+    DB_FILE = path
+    init_database()
+
+
+def benchmark_note_memory(count: str = "100000") -> int:
+    # Memory held by loaded notes
+    count = int(count)
+    body = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 36
+    with tempfile.TemporaryDirectory() as folder:
+        temporary_database(os.path.join(folder, "memory.db"))
+        conn = get_connection()
+        conn.executemany(
+            "INSERT INTO notes (id, title, content) VALUES (?, ?, ?)",
+            ((note_id, f"Note {note_id}", body) for note_id in range(1, count + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO tasks (note_id, content, done, position) VALUES (?, ?, ?, ?)",
+            (
+                (note_id, f"Task {number} of note {note_id}", number % 2, number)
+                for note_id in range(1, count + 1, 2)
+                for number in range(8)
+            ),
+        )
+        conn.commit()
+        conn.close()
+        tracemalloc.start()
+        notes = [NotesDB.load_note(note_id) for note_id in range(1, count + 1)]
+        stages = [("load_note()", tracemalloc.get_traced_memory()[0])]
+        for note in notes:
+            note.content
+            note.tasks
+        stages.append(
+            ("every body and task list read", tracemalloc.get_traced_memory()[0])
+        )
+        for note in notes:
+            for task in note.tasks:
+                pass
+        stages.append(("every task expanded", tracemalloc.get_traced_memory()[0]))
+        tracemalloc.stop()
+    print(f"{count} notes")
+    for label, size in stages:
+        print(f"  {label:32} {size / 1e6:8.1f} MB")
+    return 0
+
+
+def benchmark_backup(size_mb: str = "2048") -> int:
+    # Snapshot and restore of a database of about size_mb megabytes
+    size_mb = int(size_mb)
+    with tempfile.TemporaryDirectory() as folder:
+        temporary_database(os.path.join(folder, "backup.db"))
+        conn = get_connection()
+        conn.execute(
+            """
+            WITH RECURSIVE n (i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO attachment_blobs (sha256, size, data)
+            SELECT hex(randomblob(32)), 1048576, randomblob(1048576) FROM n
+        """,
+            (size_mb,),
+        )
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        backups = BackupManager(os.path.join(folder, "backups"))
+        snapshot = backups.create_snapshot()
+        restore = backups.restore(snapshot["path"])
+    print(f"{size_mb} MB database, {BackupManager.PAGES_PER_STEP} pages per step")
+    for label, report in (("snapshot", snapshot), ("restore", restore)):
+        print(
+            f"  {label:9} {report['pages']} pages in {report['steps']} steps, "
+            f"{report['step_avg_ms']:.2f} ms/step (max {report['step_max_ms']:.2f}), "
+            f"{report['duration']:.1f} s total"
+        )
+    print(f"  verify    {snapshot['verify_duration']:.1f} s")
+    print(f"  safety snapshot during restore {restore['safety_duration']:.1f} s")
+    return 0
+
+
+SELF_CHECKS = {
+    "--benchmark-note-memory": benchmark_note_memory,
+    "--benchmark-backup": benchmark_backup,
+}
+
+
 # ──────────────────────────────────────────────
 # Enhanced Entry Point (Unchanged)
 # ──────────────────────────────────────────────
 
 if __name__ == "__main__":
+    # Job workers re-import this module and must not start the app
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] in SELF_CHECKS:
+        sys.exit(SELF_CHECKS[sys.argv[1]](*sys.argv[2:]))
     app = ModernNoteApp()
     try:
         app.iconbitmap("")
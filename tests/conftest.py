@@ -0,0 +1,29 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # A fresh database per test, so nothing touches notes.db
+    monkeypatch.setattr(main, "DB_FILE", str(tmp_path / "notes.db"))
+    monkeypatch.setattr(main.NotesDB, "listeners", [])
+    main.init_database()
+    return tmp_path
+
+
+class FakeJobContext:
+    # Stands in for JobContext when a job runs outside a worker process
+    def __init__(self):
+        self.progress = []
+
+    def report(self, done, total):
+        self.progress.append((done, total))
+
+    def cancelled(self):
+        return False
+
+
+@pytest.fixture
+def job_context():
+    return FakeJobContext()
@@ -0,0 +1,91 @@
+import pytest
+
+import main
+from main import AttachmentStore, Note, NotesDB
+
+PNG_HEADER = (
+    b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+    + (300).to_bytes(4, "big")
+    + (200).to_bytes(4, "big")
+)
+
+
+def blob_count():
+    conn = main.get_connection()
+    count = conn.execute("SELECT COUNT(*) FROM attachment_blobs").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_add_and_export_stream_the_file(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(AttachmentStore, "CHUNK_SIZE", 1000)
+    source = tmp_path / "data.bin"
+    source.write_bytes(bytes(range(256)) * 50)
+    note_id = NotesDB.save_note(Note(title="Files"))
+    attachment_id = AttachmentStore.add(note_id, str(source))
+    [row] = AttachmentStore.list_attachments(note_id)
+    assert row == (attachment_id, "data.bin", "application/octet-stream", 12800, None)
+    target = tmp_path / "copy.bin"
+    AttachmentStore.export(attachment_id, str(target))
+    assert target.read_bytes() == source.read_bytes()
+
+
+def test_identical_files_share_one_blob(db, tmp_path):
+    first = tmp_path / "a.txt"
+    second = tmp_path / "b.txt"
+    first.write_text("same")
+    second.write_text("same")
+    note_ids = [NotesDB.save_note(Note(title=f"Note {n}")) for n in range(2)]
+    kept = AttachmentStore.add(note_ids[0], str(first))
+    removed = AttachmentStore.add(note_ids[1], str(second))
+    assert blob_count() == 1
+    AttachmentStore.remove(removed)
+    assert blob_count() == 1
+    NotesDB.delete_note(note_ids[0])
+    assert blob_count() == 0
+    assert AttachmentStore.metadata(kept) is None
+
+
+def test_metadata_is_read_from_the_header(db, tmp_path):
+    image = tmp_path / "image.png"
+    image.write_bytes(PNG_HEADER + bytes(100))
+    text = tmp_path / "notes.txt"
+    text.write_text("first line\nsecond line")
+    note_id = NotesDB.save_note(Note(title="Files"))
+    image_id = AttachmentStore.add(note_id, str(image))
+    text_id = AttachmentStore.add(note_id, str(text))
+    assert AttachmentStore.metadata(image_id) == {"width": 300, "height": 200}
+    assert AttachmentStore.metadata(text_id) == {"first_line": "first line"}
+    assert AttachmentStore.list_attachments(note_id)[0][4] == {
+        "width": 300,
+        "height": 200,
+    }
+
+
+def test_verify_job_names_damaged_files(db, tmp_path, job_context):
+    note_id = NotesDB.save_note(Note(title="Files"))
+    for name in ("good.txt", "bad.txt"):
+        path = tmp_path / name
+        path.write_text(name)
+        AttachmentStore.add(note_id, str(path))
+    assert main.verify_attachments_job(job_context) == "2 attachments intact"
+    conn = main.get_connection()
+    conn.execute("UPDATE attachment_blobs SET data = zeroblob(size) WHERE id = 2")
+    conn.commit()
+    conn.close()
+    assert main.verify_attachments_job(job_context) == "Damaged: bad.txt"
+    assert job_context.progress[-1] == (2, 2)
+
+
+def test_failed_add_leaves_the_database_unlocked(db, tmp_path, monkeypatch):
+    # The file is gone by the time its blob is written
+    monkeypatch.setattr(
+        AttachmentStore, "file_digest", staticmethod(lambda path: ("0" * 64, 10))
+    )
+    note_id = NotesDB.save_note(Note(title="Files"))
+    with pytest.raises(FileNotFoundError):
+        AttachmentStore.add(note_id, str(tmp_path / "missing.txt"))
+    # A leaked connection would still hold the write lock
+    monkeypatch.setattr(main, "BUSY_TIMEOUT", 0.1)
+    NotesDB.save_note(Note(title="After"))
+    assert blob_count() == 0
@@ -0,0 +1,91 @@
+import os
+import sqlite3
+
+import pytest
+
+import main
+from main import BackupManager, Note, NotesDB
+
+
+def titles():
+    return sorted(row[1] for row in NotesDB.load_all_notes())
+
+
+def snapshot_titles(path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    rows = sorted(row[0] for row in conn.execute("SELECT title FROM notes"))
+    conn.close()
+    return rows
+
+
+@pytest.fixture
+def backups(db):
+    # Several pages per note, so a restore takes more than one step
+    for number in range(20):
+        NotesDB.save_note(Note(title=f"Note {number}", content="x" * 5000))
+    manager = BackupManager(str(db / "backups"))
+    manager.PAGES_PER_STEP = 8
+    return manager
+
+
+def test_snapshot_is_verified_single_file(backups):
+    report = backups.create_snapshot()
+    assert BackupManager.verify(report["path"])
+    assert report["steps"] > 1
+    assert os.listdir(backups.directory) == [os.path.basename(report["path"])]
+
+
+def test_rotation_keeps_the_newest_snapshots(backups):
+    paths = [
+        backups.create_snapshot(keep=2, label=f"-{number}")["path"]
+        for number in range(4)
+    ]
+    assert {path for path, _, _ in backups.list_snapshots()} == set(paths[-2:])
+
+
+def test_restore_brings_back_the_snapshot_and_keeps_a_safety_copy(backups):
+    snapshot = backups.create_snapshot()["path"]
+    before = titles()
+    NotesDB.save_note(Note(title="Written after the snapshot"))
+    report = backups.restore(snapshot)
+    assert titles() == before
+    assert "Written after the snapshot" in snapshot_titles(report["safety_path"])
+    assert report["steps"] > 1
+
+
+def test_no_write_lands_between_safety_snapshot_and_restore(backups, monkeypatch):
+    snapshot = backups.create_snapshot()["path"]
+    take_snapshot = backups._snapshot
+    outcome = []
+
+    def snapshot_then_write(label):
+        report = take_snapshot(label)
+        conn = sqlite3.connect(main.DB_FILE, timeout=0.1)
+        try:
+            conn.execute("INSERT INTO notes (title) VALUES ('In the gap')")
+            conn.commit()
+            outcome.append("written")
+        except sqlite3.OperationalError:
+            outcome.append("blocked")
+        finally:
+            conn.close()
+        return report
+
+    monkeypatch.setattr(backups, "_snapshot", snapshot_then_write)
+    backups.restore(snapshot)
+    assert outcome == ["blocked"]
+
+
+def test_failed_safety_snapshot_leaves_the_database_alone(backups, monkeypatch):
+    snapshot = backups.create_snapshot()["path"]
+    NotesDB.save_note(Note(title="Kept"))
+    before = titles()
+
+    def fail(label):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(backups, "_snapshot", fail)
+    with pytest.raises(OSError):
+        backups.restore(snapshot)
+    assert titles() == before
+    assert not backups.running
@@ -0,0 +1,51 @@
+import main
+from main import DuplicateFinder, Note, NotesDB, TaskItem
+
+TEXT = " ".join(f"word{n}" for n in range(200))
+
+
+def test_similarity_estimates_jaccard():
+    base = DuplicateFinder.shingle_hashes(TEXT)
+    assert (
+        DuplicateFinder.similarity(
+            DuplicateFinder.signature(base), DuplicateFinder.signature(base)
+        )
+        == 1.0
+    )
+    other = DuplicateFinder.shingle_hashes(" ".join(f"other{n}" for n in range(200)))
+    assert (
+        DuplicateFinder.similarity(
+            DuplicateFinder.signature(base), DuplicateFinder.signature(other)
+        )
+        < 0.1
+    )
+
+
+def test_duplicates_job_groups_near_copies(db, job_context):
+    original = NotesDB.save_note(Note(title="Original", content=TEXT))
+    copy = NotesDB.save_note(Note(title="Copy", content=TEXT + " extra"))
+    NotesDB.save_note(Note(title="Other", content=TEXT[::-1]))
+    NotesDB.save_note(Note(title="Empty"))
+    summary, clusters = main.find_duplicates_job(job_context)
+    assert summary == "1 groups of near-duplicates (2 notes), 4 signatures updated"
+    assert sorted(note_id for note_id, _ in clusters[0]) == [original, copy]
+    # Only notes saved since are hashed again
+    note = NotesDB.load_note(original)
+    note.content = "changed"
+    NotesDB.save_note(note)
+    summary, clusters = main.find_duplicates_job(job_context)
+    assert summary.endswith("1 signatures updated") and clusters == []
+
+
+def test_merge_adds_missing_lines_and_tasks():
+    keeper = Note(title="Keep", content="a\nb", tasks=[TaskItem("x")])
+    other = Note(
+        title="Other",
+        content="b\nc",
+        tasks=[TaskItem("x"), TaskItem("y", done=True)],
+        pinned=True,
+    )
+    DuplicateFinder.merge(keeper, [other])
+    assert keeper.content == "a\nb\nc"
+    assert list(keeper.tasks.rows()) == [("x", False), ("y", True)]
+    assert keeper.pinned
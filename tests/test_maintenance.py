@@ -0,0 +1,95 @@
+import sqlite3
+
+import main
+from main import NotesDB
+
+
+def run_job(scheduler, name):
+    for _ in scheduler.jobs[name][1]():
+        pass
+
+
+def count_changes(scheduler):
+    return scheduler.conn.execute("SELECT COUNT(*) FROM note_changes").fetchone()[0]
+
+
+def test_change_log_is_pruned_by_its_own_job(db):
+    NotesDB.save_note(main.Note(title="Recent"))
+    conn = main.get_connection()
+    conn.execute("INSERT INTO note_changes (note_id, changed_at) VALUES (1, 0)")
+    conn.commit()
+    conn.close()
+    scheduler = main.MaintenanceScheduler(None, lambda: 0)
+    try:
+        run_job(scheduler, "revisions")
+        assert count_changes(scheduler) == 2
+        run_job(scheduler, "change_log")
+        assert count_changes(scheduler) == 1
+    finally:
+        scheduler.close()
+
+
+def test_idle_slices_run_every_due_job_and_log_it(db):
+    scheduler = main.MaintenanceScheduler(None, lambda: 0)
+    try:
+        while scheduler.run_slice():
+            pass
+        jobs = {row[0] for row in scheduler.recent_log()}
+        assert {"checkpoint", "optimize", "analyze", "revisions", "change_log"} <= jobs
+        assert scheduler.next_due_job() is None
+    finally:
+        scheduler.close()
+
+
+def test_vacuum_job_returns_free_pages(db):
+    note_ids = [
+        NotesDB.save_note(main.Note(title=f"Big {number}", content="x" * 50000))
+        for number in range(40)
+    ]
+    NotesDB.delete_notes(note_ids)
+    scheduler = main.MaintenanceScheduler(None, lambda: 0)
+    try:
+        assert scheduler.vacuum_due()
+        run_job(scheduler, "vacuum")
+        free = scheduler.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        assert free < main.MaintenanceScheduler.VACUUM_PAGES
+    finally:
+        scheduler.close()
+
+
+def test_crowded_task_positions_are_renumbered(db):
+    note = main.Note(title="Tasks", tasks=[main.TaskItem("a"), main.TaskItem("b")])
+    NotesDB.save_note(note)
+    conn = main.get_connection()
+    conn.execute("UPDATE tasks SET position = 1 + id * 1e-9")
+    conn.commit()
+    conn.close()
+    scheduler = main.MaintenanceScheduler(None, lambda: 0)
+    try:
+        run_job(scheduler, "task_positions")
+    finally:
+        scheduler.close()
+    tasks = NotesDB.load_tasks(note.id)
+    assert [task.content for task in tasks] == ["a", "b"]
+    assert [task.position for task in tasks] == [1.0, 2.0]
+
+
+def test_busy_job_is_not_logged_and_runs_again(db):
+    scheduler = main.MaintenanceScheduler(None, lambda: 0)
+
+    def busy():
+        raise sqlite3.OperationalError("database is locked")
+        yield
+
+    try:
+        interval, steps = scheduler.jobs["checkpoint"]
+        scheduler.jobs["checkpoint"] = (interval, busy)
+        assert scheduler.run_slice()
+        assert scheduler.recent_log() == []
+        assert NotesDB.load_setting("maintenance_checkpoint") == ""
+        assert scheduler.next_due_job() == "checkpoint"
+        scheduler.jobs["checkpoint"] = (interval, steps)
+        scheduler.run_slice()
+        assert scheduler.recent_log()[-1][0] == "checkpoint"
+    finally:
+        scheduler.close()
@@ -0,0 +1,135 @@
+import os
+
+import pytest
+
+from main import (
+    MarkdownSync,
+    Note,
+    NotesDB,
+    TaskItem,
+    export_markdown_job,
+    import_markdown_job,
+)
+
+
+@pytest.fixture
+def sync(db):
+    folder = db / "sync"
+    folder.mkdir()
+    sync = MarkdownSync(str(folder))
+    sync.load_manifest()
+    yield sync
+    sync.conn.close()
+
+
+def sync_pass(sync):
+    sync.import_files()
+    sync.export_notes()
+
+
+def read(sync, note_id):
+    with open(os.path.join(sync.folder, sync.paths[note_id]), encoding="utf-8") as file:
+        return file.read()
+
+
+def write(sync, name, text):
+    with open(os.path.join(sync.folder, name), "w", encoding="utf-8") as file:
+        file.write(text)
+
+
+@pytest.mark.parametrize("mode", ["task", "normal"])
+def test_round_trip_keeps_content_and_tasks(sync, mode):
+    # A note in Notes mode keeps its hidden tasks out of the file and in
+    # the database
+    note = Note(
+        title=f"{mode} note",
+        content="body\n\n- [ ] not a task",
+        tasks=[TaskItem("a"), TaskItem("b", done=True)],
+        mode=mode,
+        category="work",
+        pinned=True,
+    )
+    NotesDB.save_note(note)
+    sync_pass(sync)
+    text = read(sync, note.id)
+    assert ("- [x] b" in text) == (mode == "task")
+    write(sync, sync.paths[note.id], text.replace("body", "body edited"))
+    sync_pass(sync)
+    loaded = NotesDB.load_note(note.id)
+    assert loaded.content == "body edited\n\n- [ ] not a task"
+    assert list(loaded.tasks.rows()) == [("a", False), ("b", True)]
+    assert (loaded.category, loaded.pinned, loaded.mode) == ("work", True, mode)
+
+
+def test_new_and_renamed_files(sync):
+    write(sync, "Ideas.md", '---\ntitle: "Ideas"\n---\n\nfirst idea\n')
+    sync_pass(sync)
+    [(note_id, title, *_)] = NotesDB.load_all_notes()
+    assert title == "Ideas" and NotesDB.load_content(note_id) == "first idea"
+    os.rename(
+        os.path.join(sync.folder, "Ideas.md"), os.path.join(sync.folder, "Moved.md")
+    )
+    sync_pass(sync)
+    assert [row[0] for row in NotesDB.load_all_notes()] == [note_id]
+    assert sync.paths[note_id] == "Moved.md"
+
+
+def test_edits_on_both_sides_keep_both_versions(sync):
+    note = Note(title="Shared", content="original")
+    NotesDB.save_note(note)
+    sync_pass(sync)
+    write(sync, sync.paths[note.id], read(sync, note.id).replace("original", "on disk"))
+    note.content = "in the app"
+    NotesDB.save_note(note)
+    sync_pass(sync)
+    contents = sorted(NotesDB.load_content(row[0]) for row in NotesDB.load_all_notes())
+    assert contents == ["in the app", "on disk"]
+    assert "in the app" in read(sync, note.id)
+
+
+def test_deleted_files_and_notes(sync):
+    note_ids = [NotesDB.save_note(Note(title=f"Note {n}")) for n in range(10)]
+    sync_pass(sync)
+    os.remove(os.path.join(sync.folder, sync.paths[note_ids[0]]))
+    sync_pass(sync)
+    assert NotesDB.load_note(note_ids[0]) is None
+    path = sync.paths[note_ids[1]]
+    NotesDB.delete_note(note_ids[1])
+    sync_pass(sync)
+    assert not os.path.exists(os.path.join(sync.folder, path))
+
+
+def test_mass_removal_waits_for_confirmation(sync):
+    note_ids = [NotesDB.save_note(Note(title=f"Note {n}")) for n in range(10)]
+    sync_pass(sync)
+    for note_id in note_ids[:5]:
+        os.remove(os.path.join(sync.folder, sync.paths[note_id]))
+    sync_pass(sync)
+    assert len(sync.held_removals) == 5
+    assert len(NotesDB.load_all_notes()) == 10
+    sync.removal_decision = "restore"
+    sync_pass(sync)
+    assert sync.held_removals == []
+    assert all(
+        os.path.exists(os.path.join(sync.folder, sync.paths[n])) for n in note_ids
+    )
+    assert len(NotesDB.load_all_notes()) == 10
+
+
+def test_export_and_import_jobs_copy_every_note(db, job_context):
+    NotesDB.save_note(
+        Note(title="Plan", content="body", tasks=[TaskItem("a")], mode="task")
+    )
+    NotesDB.save_note(Note(title="Plan", content="other", category="work"))
+    folder = db / "export"
+    folder.mkdir()
+    assert export_markdown_job(job_context, str(folder)) == "2 notes exported"
+    assert sorted(os.listdir(folder)) == ["Plan (2).md", "Plan.md"]
+    assert import_markdown_job(job_context, str(folder)) == "2 notes imported"
+    assert job_context.progress[-1] == (2, 2)
+    # The imported copies follow the two originals
+    copies = [NotesDB.load_note(note_id) for note_id in (3, 4)]
+    assert sorted(
+        (note.title, note.content, note.category, list(note.tasks.rows()))
+        for note in copies
+    ) == [("Plan", "body", "", [("a", False)]), ("Plan", "other", "work", [])]
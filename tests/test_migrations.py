@@ -0,0 +1,146 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+import main
+from main import NotesDB, RevisionStore
+
+
+def make_baseline_database(path):
+    # The schema and rows the first release wrote: ISO text timestamps
+    # (local time from the app, UTC from the column default), free-text
+    # categories and tasks without positions
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL DEFAULT '',
+            mode TEXT NOT NULL DEFAULT 'normal',
+            category TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            pinned BOOLEAN DEFAULT 0,
+            color_tag TEXT DEFAULT 'default'
+        );
+        CREATE TABLE tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            note_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            done BOOLEAN DEFAULT 0,
+            FOREIGN KEY (note_id) REFERENCES notes (id) ON DELETE CASCADE
+        );
+        CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    """)
+    conn.execute(
+        "INSERT INTO notes (title, content, category, created_at, modified_at) "
+        "VALUES ('Local', 'see [[UTC]]', 'work', '2026-01-02T03:04:05', '2026-01-02T03:04:05')"
+    )
+    conn.execute(
+        "INSERT INTO notes (title, content, category, created_at, modified_at, mode) "
+        "VALUES ('UTC', ?, 'work', '2026-01-02 03:04:05', '2026-01-02 03:04:05', 'task')",
+        ("x" * 20000,),
+    )
+    conn.execute("INSERT INTO notes (title, category) VALUES ('Loose', '')")
+    conn.executemany(
+        "INSERT INTO tasks (note_id, content, done) VALUES (2, ?, ?)",
+        [("first", 1), ("second", 0), ("third", 0)],
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def baseline(tmp_path, monkeypatch):
+    path = str(tmp_path / "notes.db")
+    make_baseline_database(path)
+    monkeypatch.setattr(main, "DB_FILE", path)
+    monkeypatch.setattr(main.NotesDB, "listeners", [])
+    main.init_database()
+    return path
+
+
+def query(sql, params=()):
+    conn = main.get_connection()
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return rows
+
+
+def pragma(name):
+    return query(f"PRAGMA {name}")[0][0]
+
+
+def test_version_1_converts_timestamps_to_epoch_seconds(baseline):
+    local = int(datetime(2026, 1, 2, 3, 4, 5).timestamp())
+    utc = int(datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc).timestamp())
+    assert query(
+        "SELECT created_at, modified_at FROM notes WHERE id IN (1, 2) ORDER BY id"
+    ) == [
+        (local, local),
+        (utc, utc),
+    ]
+    assert query("SELECT typeof(modified_at) FROM notes WHERE id = 3") == [("integer",)]
+
+
+def test_upgrade_normalizes_categories_and_fills_derived_columns(baseline):
+    assert NotesDB.list_categories() == [("work", 2)]
+    assert NotesDB.load_note(1).category == "work"
+    assert NotesDB.load_note(3).category == ""
+    assert [task.content for task in NotesDB.load_tasks(2)] == [
+        "first",
+        "second",
+        "third",
+    ]
+    assert query(
+        "SELECT task_count, open_task_count, link_count, backlink_count FROM notes ORDER BY id"
+    ) == [(0, 0, 1, 0), (3, 2, 0, 1), (0, 0, 0, 0)]
+    assert NotesDB.list_backlinks(2) == [(1, "Local")]
+    assert query("SELECT COUNT(*) FROM notes WHERE preview IS NULL") == [(0,)]
+    assert len(query("SELECT preview FROM notes WHERE id = 2")[0][0]) < 1000
+
+
+def test_upgrade_is_idempotent(baseline):
+    before = query("SELECT * FROM notes ORDER BY id")
+    main.init_database()
+    assert query("SELECT * FROM notes ORDER BY id") == before
+    assert NotesDB.list_categories() == [("work", 2)]
+
+
+def test_first_save_after_upgrade_keeps_the_old_content(baseline):
+    note = NotesDB.load_note(1)
+    note.content = "rewritten"
+    NotesDB.save_note(note)
+    revisions = RevisionStore.list_revisions(1)
+    assert [RevisionStore.load_revision(r[0]) for r in revisions] == [
+        "rewritten",
+        "see [[UTC]]",
+    ]
+
+
+def test_version_2_leaves_the_vacuum_to_a_job(baseline, job_context):
+    assert pragma("user_version") == 2
+    assert pragma("auto_vacuum") == 0
+    assert NotesDB.load_setting("vacuum_pending") == "1"
+    # Starting again does not vacuum either
+    main.init_database()
+    assert pragma("auto_vacuum") == 0
+
+    conn = main.get_connection()
+    conn.execute("UPDATE notes SET content = '' WHERE id = 2")
+    conn.commit()
+    conn.close()
+    message = main.vacuum_database_job(job_context)
+    assert "reclaimed" in message
+    assert pragma("auto_vacuum") == 2
+    assert NotesDB.load_setting("vacuum_pending") == ""
+    log = query("SELECT job, reclaimed_bytes FROM maintenance_log")
+    assert log[0][0] == "full_vacuum" and log[0][1] > 0
+    assert len(NotesDB.load_all_notes()) == 3
+
+
+def test_new_database_starts_with_incremental_vacuum(db):
+    assert pragma("auto_vacuum") == 2
+    assert pragma("user_version") == 2
+    assert NotesDB.load_setting("vacuum_pending") == ""
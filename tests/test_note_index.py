@@ -0,0 +1,82 @@
+import main
+from main import Note, NoteIndex, NotesDB, TaskItem
+
+
+def titles(rows):
+    return [row[1] for row in rows]
+
+
+def make_index():
+    index = NoteIndex()
+    index.load(NotesDB.load_note_metadata())
+    NotesDB.add_listener(index.apply_event)
+    return index
+
+
+def add(title, **fields):
+    return NotesDB.save_note(Note(title=title, **fields))
+
+
+def set_modified(note_id, modified_at):
+    conn = main.get_connection()
+    conn.execute("UPDATE notes SET modified_at=? WHERE id=?", (modified_at, note_id))
+    conn.commit()
+    conn.close()
+
+
+def test_orders_match_the_database(db):
+    for number, title in enumerate(["banana", "Apple", "cherry"]):
+        category = "fruit" if number else ""
+        note_id = add(title, pinned=title == "cherry", category=category)
+        set_modified(note_id, 1000 + number)
+    index = make_index()
+    assert titles(index.query()) == ["cherry", "Apple", "banana"]
+    assert titles(index.query(order="title")) == ["Apple", "banana", "cherry"]
+    assert titles(index.query(order="created")) == ["cherry", "Apple", "banana"]
+    assert titles(index.query(category="fruit", order="title")) == ["Apple", "cherry"]
+    assert index.categories() == ["fruit"]
+    for note_id in (1, 2, 3):
+        assert index.is_current(NotesDB.load_note_metadata([note_id])[0])
+
+
+def test_saves_and_deletes_keep_the_index_current(db):
+    index = make_index()
+    first = add("first")
+    second = add("second", tasks=[TaskItem("a"), TaskItem("b", done=True)])
+    assert index.row(second)[7:9] == (2, 1)
+    note = NotesDB.load_note(first)
+    note.pinned = True
+    NotesDB.save_note(note)
+    assert titles(index.query()) == ["first", "second"]
+    NotesDB.delete_note(first)
+    assert first not in index and len(index) == 1
+    assert titles(index.query()) == ["second"]
+
+
+def test_bulk_events_resort_once(db):
+    index = make_index()
+    note_ids = [add(f"note {number:03}") for number in range(NoteIndex.BULK_EVENT + 10)]
+    NotesDB.set_pinned(note_ids[::2], True)
+    pinned = [row[0] for row in index.query() if row[5]]
+    assert sorted(pinned) == sorted(note_ids[::2])
+    NotesDB.delete_notes(note_ids[: NoteIndex.BULK_EVENT + 1])
+    assert (
+        titles(index.query(order="title"))
+        == [f"note {number:03}" for number in range(len(note_ids))][
+            NoteIndex.BULK_EVENT + 1 :
+        ]
+    )
+
+
+def test_quick_switcher_ranks_title_matches(db):
+    for title in ["Weekly meeting notes", "Meeting agenda", "Grocery list", "Metrics"]:
+        add(title)
+    index = make_index()
+    ranked = [
+        NotesDB.load_note(note_id).title for note_id in index.match_titles("meet")
+    ]
+    assert ranked[0] == "Meeting agenda"
+    assert ranked == ["Meeting agenda", "Weekly meeting notes"]
+    assert index.match_titles("grcl") == [3]
+    assert index.match_titles("zzz") == []
+    assert len(index.match_titles("")) == 4
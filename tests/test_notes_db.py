@@ -0,0 +1,266 @@
+import sqlite3
+
+import pytest
+
+import main
+from main import Note, NotesDB, TaskItem
+
+
+def count_notes():
+    conn = main.get_connection()
+    count = conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_save_and_load_round_trip(db):
+    note = Note(
+        title="Groceries",
+        content="milk",
+        tasks=[TaskItem("eggs"), TaskItem("bread", done=True)],
+        category="home",
+    )
+    note_id = NotesDB.save_note(note)
+    loaded = NotesDB.load_note(note_id)
+    assert loaded.title == "Groceries"
+    assert loaded.category == "home"
+    assert loaded.content == "milk"
+    assert list(loaded.tasks.rows()) == [("eggs", False), ("bread", True)]
+
+
+def test_stale_save_raises_conflict(db):
+    note = Note(title="Shared", content="one")
+    NotesDB.save_note(note)
+    other = NotesDB.load_note(note.id)
+    other.content = "two"
+    NotesDB.save_note(other)
+    note.content = "three"
+    with pytest.raises(main.NoteConflictError):
+        NotesDB.save_note(note)
+    assert NotesDB.load_content(note.id) == "two"
+
+
+def test_busy_retry_of_new_note_inserts_it_once(db, monkeypatch):
+    save_tasks = NotesDB.save_tasks
+    attempts = []
+
+    def busy_once(cursor, note_id, tasks):
+        attempts.append(note_id)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        save_tasks(cursor, note_id, tasks)
+
+    monkeypatch.setattr(NotesDB, "save_tasks", staticmethod(busy_once))
+    monkeypatch.setattr(main.time, "sleep", lambda seconds: None)
+    note = Note(title="Retried", tasks=[TaskItem("a")])
+    note_id = NotesDB.save_note(note)
+    assert len(attempts) == 2
+    assert note.id == note_id
+    assert count_notes() == 1
+    assert list(NotesDB.load_tasks(note_id).rows()) == [("a", False)]
+
+
+def test_failed_save_leaves_note_unsaved_and_database_unlocked(db, monkeypatch):
+    def fail(cursor, note_id, tasks):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(NotesDB, "save_tasks", staticmethod(fail))
+    note = Note(title="Broken")
+    with pytest.raises(RuntimeError):
+        NotesDB.save_note(note)
+    assert note.id is None and note.modified_at is None
+    # A leaked connection would still hold the write lock
+    monkeypatch.setattr(main, "BUSY_TIMEOUT", 0.1)
+    NotesDB.save_setting("theme", "light")
+    assert count_notes() == 0
+
+
+def delete_elsewhere(note_id):
+    conn = main.get_connection()
+    conn.execute("DELETE FROM notes WHERE id=?", (note_id,))
+    conn.execute("DELETE FROM tasks WHERE note_id=?", (note_id,))
+    conn.commit()
+    conn.close()
+
+
+def test_forced_save_brings_back_a_note_deleted_elsewhere(db):
+    NotesDB.save_note(Note(title="Kept", content="body", tasks=[TaskItem("a")]))
+    note = NotesDB.load_note(1)
+    note.content
+    note.tasks
+    delete_elsewhere(note.id)
+    with pytest.raises(main.NoteConflictError) as error:
+        NotesDB.save_note(note)
+    assert error.value.deleted
+    NotesDB.save_note(note, force=True)
+    restored = NotesDB.load_note(note.id)
+    assert restored.content == "body"
+    assert list(restored.tasks.rows()) == [("a", False)]
+
+
+def test_forced_save_never_brings_back_unloaded_tasks(db):
+    NotesDB.save_note(Note(title="Lazy", content="body", tasks=[TaskItem("a")]))
+    note = NotesDB.load_note(1)
+    note.content = "edited"
+    delete_elsewhere(note.id)
+    with pytest.raises(main.NoteConflictError):
+        NotesDB.save_note(note, force=True)
+    assert NotesDB.load_note(note.id) is None
+
+
+def test_batch_operations(db):
+    note_ids = [NotesDB.save_note(Note(title=f"Note {n}")) for n in range(3)]
+    NotesDB.set_pinned(note_ids[:2], True)
+    NotesDB.set_color(note_ids, "#ff9999")
+    NotesDB.set_category(note_ids[1:], "work")
+    notes = {note_id: NotesDB.load_note(note_id) for note_id in note_ids}
+    assert [notes[n].pinned for n in note_ids] == [True, True, False]
+    assert {notes[n].color_tag for n in note_ids} == {"#ff9999"}
+    assert [notes[n].category for n in note_ids] == ["", "work", "work"]
+    NotesDB.delete_notes(note_ids[:2])
+    assert [row[0] for row in NotesDB.load_all_notes()] == note_ids[2:]
+
+
+def test_batch_update_is_seen_as_a_conflict(db):
+    note = Note(title="Open")
+    NotesDB.save_note(note)
+    NotesDB.set_pinned([note.id], True)
+    note.content = "edited"
+    with pytest.raises(main.NoteConflictError):
+        NotesDB.save_note(note)
+
+
+class EditorStub:
+    # The parts of ModernNoteApp that update_open_note touches
+    def __init__(self, note):
+        self.current_note = note
+        self.category = note.category
+        self.color = note.color_tag
+        self.category_entry = self
+        self.color_var = self
+
+    def delete(self, first, last):
+        self.category = ""
+
+    def insert(self, index, text):
+        self.category += text
+
+    def set(self, value):
+        self.color = value
+
+    def show_timestamps(self):
+        pass
+
+
+@pytest.mark.parametrize(
+    "setter, field, value",
+    [
+        (NotesDB.set_pinned, "pinned", True),
+        (NotesDB.set_color, "color_tag", "#ff9999"),
+        (NotesDB.set_category, "category", "work"),
+    ],
+)
+def test_batch_update_of_the_open_note_keeps_it_saveable(db, setter, field, value):
+    note = Note(title="Open", content="body")
+    NotesDB.save_note(note)
+    other = Note(title="Other")
+    NotesDB.save_note(other)
+    editor = EditorStub(note)
+    stamps = setter([note.id, other.id], value)
+    main.ModernNoteApp.update_open_note(editor, stamps, field, value)
+    assert getattr(note, field) == value
+    assert editor.category == (value if field == "category" else "")
+    assert editor.color == (value if field == "color_tag" else "default")
+    note.content = "edited"
+    NotesDB.save_note(note)
+    loaded = NotesDB.load_note(note.id)
+    assert (loaded.content, getattr(loaded, field)) == ("edited", value)
+
+
+def test_category_counts_rename_and_merge(db):
+    for title, category in [("a", "work"), ("b", "work"), ("c", "home"), ("d", "")]:
+        NotesDB.save_note(Note(title=title, category=category))
+    assert NotesDB.list_categories() == [("home", 1), ("work", 2)]
+    assert len(NotesDB.rename_category("work", "job")) == 2
+    assert NotesDB.list_categories() == [("home", 1), ("job", 2)]
+    NotesDB.rename_category("home", "job")
+    assert NotesDB.list_categories() == [("job", 3)]
+    # The emptied category is pruned
+    conn = main.get_connection()
+    names = [row[0] for row in conn.execute("SELECT name FROM categories")]
+    conn.close()
+    assert names == ["job"]
+
+
+def test_wiki_links_follow_renames_and_deletes(db):
+    source = Note(title="Index", content="see [[Plan]] and [[Later]]")
+    NotesDB.save_note(source)
+    plan = Note(title="Plan")
+    NotesDB.save_note(plan)
+    assert NotesDB.resolve_link(source.id, "Plan") == plan.id
+    assert NotesDB.resolve_link(source.id, "Later") is None
+    later = Note(title="Later")
+    NotesDB.save_note(later)
+    assert NotesDB.resolve_link(source.id, "Later") == later.id
+    plan.title = "Roadmap"
+    NotesDB.save_note(plan)
+    assert NotesDB.resolve_link(source.id, "Plan") == plan.id
+    assert NotesDB.list_backlinks(plan.id) == [(source.id, "Index")]
+    NotesDB.delete_note(plan.id)
+    assert NotesDB.resolve_link(source.id, "Plan") is None
+
+
+def test_open_tasks_page_through_every_note(db):
+    for n in range(3):
+        NotesDB.save_note(
+            Note(
+                title=f"Note {n}",
+                tasks=[TaskItem(f"{n}.{t}", done=t == 1) for t in range(4)],
+            )
+        )
+    pages = []
+    after = None
+    while True:
+        page = NotesDB.list_open_tasks(after, limit=4)
+        if not page:
+            break
+        pages.append([row[3] for row in page])
+        after = (page[-1][1], page[-1][4], page[-1][0])
+    assert pages == [
+        ["0.0", "0.2", "0.3", "1.0"],
+        ["1.2", "1.3", "2.0", "2.2"],
+        ["2.3"],
+    ]
+
+
+def test_task_counts_and_previews_in_metadata(db):
+    note = Note(
+        title="Counted",
+        content="# Heading\n\n**bold** and [[Link]]",
+        tasks=[TaskItem("a"), TaskItem("b", done=True), TaskItem("c")],
+    )
+    NotesDB.save_note(note)
+    [row] = NotesDB.load_note_metadata([note.id])
+    assert row[8:] == (3, 1, "Heading bold and Link")
+
+
+def test_note_preview():
+    assert main.note_preview("- [ ] item\n> quoted `code`") == "item quoted code"
+    preview = main.note_preview("word " * 200)
+    lines = preview.split("\n")
+    assert len(lines) == main.PREVIEW_LINES
+    assert all(len(line) <= main.PREVIEW_WIDTH for line in lines)
+    assert preview.endswith("…")
+
+
+def test_change_watcher_sees_commits_of_other_connections(db):
+    watcher = main.ChangeWatcher()
+    try:
+        assert watcher.poll() is None
+        note_id = NotesDB.save_note(Note(title="Elsewhere"))
+        assert watcher.poll() == [note_id]
+        assert watcher.poll() is None
+        NotesDB.delete_note(note_id)
+        assert watcher.poll() == [note_id]
+    finally:
+        watcher.close()
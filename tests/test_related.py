@@ -0,0 +1,28 @@
+import pytest
+
+import main
+from main import Note, NotesDB, RelatedNotes
+
+
+def test_term_counts_weigh_titles_and_skip_stop_words():
+    counts = RelatedNotes.term_counts("Garden plans", "the garden needs water")
+    assert counts == {"garden": 4, "plans": 3, "needs": 1, "water": 1}
+
+
+def test_related_notes_share_terms(db):
+    if main.np is None:
+        pytest.skip("numpy is not installed")
+    note_ids = [
+        NotesDB.save_note(Note(title=title, content=content))
+        for title, content in [
+            ("Garden", "tomatoes basil watering compost"),
+            ("Vegetables", "tomatoes compost raised beds"),
+            ("Taxes", "receipts deadline accountant"),
+        ]
+    ]
+    related = RelatedNotes()
+    conn = main.get_connection()
+    related.catch_up(conn)
+    related.rebuild(conn)
+    conn.close()
+    assert [note_id for note_id, _ in related.related(note_ids[0])] == [note_ids[1]]
@@ -0,0 +1,78 @@
+import main
+from main import Note, NotesDB, RevisionStore
+
+
+def contents(note_id):
+    return [
+        RevisionStore.load_revision(revision_id)
+        for revision_id, _, _ in RevisionStore.list_revisions(note_id)
+    ]
+
+
+def test_revisions_round_trip(db):
+    note = Note(title="Draft", content="")
+    NotesDB.save_note(note)
+    # Enough saves to pass a keyframe; each changes one line of 30
+    versions = []
+    for version in range(RevisionStore.KEYFRAME_INTERVAL + 5):
+        lines = [f"line {line}" for line in range(30)]
+        lines[version % 30] += f" of version {version}"
+        versions.append("\n".join(lines))
+    for text in versions:
+        note.content = text
+        NotesDB.save_note(note)
+    assert contents(note.id) == versions[::-1] + [""]
+
+
+def test_unchanged_save_adds_no_revision(db):
+    note = Note(title="Same", content="text")
+    NotesDB.save_note(note)
+    note.title = "Renamed"
+    NotesDB.save_note(note)
+    assert contents(note.id) == ["text"]
+
+
+def test_first_save_keeps_content_written_before_revisions(db):
+    # A note from before revision history, or written by another tool
+    conn = main.get_connection()
+    note_id = conn.execute(
+        "INSERT INTO notes (title, content) VALUES ('Old', 'original text')"
+    ).lastrowid
+    conn.commit()
+    conn.close()
+    note = NotesDB.load_note(note_id)
+    note.content = "overwritten"
+    NotesDB.save_note(note)
+    assert contents(note_id) == ["overwritten", "original text"]
+
+
+def test_save_after_outside_edit_keeps_the_outside_version(db):
+    note = Note(title="Shared", content="mine")
+    NotesDB.save_note(note)
+    conn = main.get_connection()
+    conn.execute("UPDATE notes SET content='theirs' WHERE id=?", (note.id,))
+    conn.commit()
+    conn.close()
+    note = NotesDB.load_note(note.id)
+    note.content = "final"
+    NotesDB.save_note(note)
+    assert contents(note.id) == ["final", "theirs", "mine"]
+
+
+def test_thinning_keeps_survivors_readable(db):
+    note = Note(title="Old", content="v0")
+    NotesDB.save_note(note)
+    for version in range(1, 10):
+        note.content = f"v{version}\nshared line"
+        NotesDB.save_note(note)
+    conn = main.get_connection()
+    # Pretend every revision but the last was written on one day long ago
+    conn.execute(
+        "UPDATE revisions SET created_at = 1000000 + id "
+        "WHERE id < (SELECT MAX(id) FROM revisions)"
+    )
+    removed = RevisionStore.thin(conn.cursor(), note.id, int(main.time.time()))
+    conn.commit()
+    conn.close()
+    assert removed == 8
+    assert contents(note.id) == ["v9\nshared line", "v8\nshared line"]
@@ -0,0 +1,107 @@
+import json
+import socket
+
+import pytest
+
+import main
+from main import NotesDB, RpcServer
+
+
+@pytest.fixture
+def server(db):
+    server = RpcServer("127.0.0.1:0")
+    server.token = "secret"
+    return server
+
+
+def call(server, method, params=None, request_id=1, token="secret"):
+    request = {"jsonrpc": "2.0", "id": request_id, "method": method, "token": token}
+    if params is not None:
+        request["params"] = params
+    return server.dispatch(request)
+
+
+def test_create_get_and_list(server):
+    tasks = ["a", {"content": "b", "done": True}]
+    created = call(server, "create", {"title": "Plan", "tasks": tasks})["result"]
+    note = call(server, "get", {"id": created["id"]})["result"]
+    assert note["title"] == "Plan"
+    assert note["tasks"] == [{"content": "a", "done": False}, tasks[1]]
+    [summary] = call(server, "list")["result"]
+    assert summary["id"] == created["id"]
+    assert (summary["task_total"], summary["task_done"]) == (2, 1)
+    assert call(server, "search", ["has:open-tasks"])["result"][0]["title"] == "Plan"
+
+
+def test_update_with_stale_modified_at_is_a_conflict(server):
+    created = call(server, "create", {"title": "Plan"})["result"]
+    call(server, "update", {"id": created["id"], "content": "first"})
+    stale = {"id": created["id"], "modified_at": created["modified_at"]}
+    reply = call(server, "update", {**stale, "content": "second"})
+    assert reply["error"]["code"] == RpcServer.CONFLICT
+    assert NotesDB.load_content(created["id"]) == "first"
+
+
+def test_toggle_task(server):
+    created = call(server, "create", {"title": "Plan", "tasks": ["a"]})["result"]
+    assert call(server, "toggle_task", [created["id"], 0])["result"]["done"] is True
+    reply = call(server, "toggle_task", [created["id"], 1])
+    assert reply["error"]["code"] == RpcServer.NOT_FOUND
+
+
+@pytest.mark.parametrize(
+    "method, params, code",
+    [
+        ("nothing", None, RpcServer.METHOD_NOT_FOUND),
+        ("get", {"id": 99}, RpcServer.NOT_FOUND),
+        ("get", {"note": 1}, RpcServer.INVALID_PARAMS),
+        ("create", {"title": "x", "mode": "other"}, RpcServer.INVALID_PARAMS),
+        ("search", ["is:maybe"], RpcServer.INVALID_PARAMS),
+    ],
+)
+def test_errors(server, method, params, code):
+    assert call(server, method, params)["error"]["code"] == code
+
+
+def test_token_is_required(server):
+    reply = call(server, "list", token="wrong")
+    assert reply["error"]["code"] == RpcServer.UNAUTHORIZED
+
+
+def test_batches_and_notifications(server):
+    notification = {"method": "create", "token": "secret", "params": ["Quiet"]}
+    assert server.dispatch([notification]) is None
+    replies = server.dispatch(
+        [notification, {"id": 7, "method": "list", "token": "secret"}]
+    )
+    assert [reply["id"] for reply in replies] == [7]
+    assert len(replies[0]["result"]) == 2
+    assert server.dispatch([])["error"]["code"] == RpcServer.INVALID_REQUEST
+
+
+def test_server_answers_over_tcp(db):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = RpcServer(f"127.0.0.1:{port}")
+    server.start()
+    try:
+        assert server.last_error is None
+        with open(main.DB_FILE + "-rpc-token") as file:
+            token = file.read().strip()
+        with socket.create_connection(("127.0.0.1", port), timeout=5) as client:
+            stream = client.makefile("rwb")
+            for request_id in (1, 2):
+                request = {
+                    "id": request_id,
+                    "method": "create",
+                    "token": token,
+                    "params": [f"Note {request_id}"],
+                }
+                stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            replies = [json.loads(stream.readline()) for _ in range(2)]
+        assert [reply["id"] for reply in replies] == [1, 2]
+    finally:
+        server.stop()
+    assert len(NotesDB.load_all_notes()) == 2
@@ -0,0 +1,165 @@
+import pytest
+
+import main
+from main import AttachmentStore, Note, NotesDB, QueryError, SearchQuery, TaskItem
+
+# Every filter must be answered by an index. Negated terms and words
+# shorter than a trigram read every note by design and are not listed.
+FILTER_QUERIES = [
+    "cat:work",
+    "cat:none",
+    "is:pinned",
+    "is:unpinned",
+    "is:task",
+    "mode:note",
+    "color:#ff9999",
+    "modified:>2026-09-01",
+    "modified:7d",
+    "created:<2026-01-01",
+    "has:tasks",
+    "has:open-tasks",
+    "has:attachments",
+    "has:links",
+    "has:backlinks",
+    "cat:work OR is:pinned",
+    "(has:links OR has:backlinks) is:task",
+]
+TEXT_QUERIES = [
+    "meeting",
+    '"exact phrase"',
+    "title:plan",
+    "content:hello",
+    "meeting cat:work has:open-tasks",
+]
+
+
+def plan(query):
+    sql, params = SearchQuery(query).compile()
+    conn = main.get_connection()
+    details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    conn.close()
+    return details
+
+
+@pytest.mark.parametrize("query", FILTER_QUERIES + TEXT_QUERIES)
+def test_search_never_scans_a_table(db, query):
+    if query in TEXT_QUERIES and not main.FUZZY_SEARCH_AVAILABLE:
+        pytest.skip("SQLite has no trigram tokenizer")
+    details = plan(query)
+    # "SCAN x USING INDEX" still reads every entry; only a trigram MATCH,
+    # shown as a scan of the virtual table, is a lookup
+    scans = [
+        detail
+        for detail in details
+        if detail.startswith("SCAN") and not detail.startswith("SCAN notes_trigram")
+    ]
+    assert not scans, details
+
+
+def matching_titles(query, category=None):
+    ids = SearchQuery(query).note_ids(category)
+    return sorted(NotesDB.load_note(note_id).title for note_id in ids)
+
+
+@pytest.fixture
+def notes(db, tmp_path):
+    NotesDB.save_note(
+        Note(
+            title="Plan",
+            content="weekly meeting [[Ideas]]",
+            category="Work",
+            pinned=True,
+        )
+    )
+    NotesDB.save_note(
+        Note(title="Ideas", tasks=[TaskItem("write", done=True)], mode="task")
+    )
+    NotesDB.save_note(
+        Note(
+            title="Errands",
+            tasks=[TaskItem("milk")],
+            category="home",
+            color_tag="#ff9999",
+        )
+    )
+    attachment = tmp_path / "file.txt"
+    attachment.write_text("hello")
+    AttachmentStore.add(3, str(attachment))
+
+
+def test_filters(notes):
+    assert matching_titles("cat:work") == ["Plan"]
+    assert matching_titles("CAT:WORK") == ["Plan"]
+    assert matching_titles("cat:none") == ["Ideas"]
+    assert matching_titles("is:pinned") == ["Plan"]
+    assert matching_titles("mode:task") == ["Ideas"]
+    assert matching_titles("color:#ff9999") == ["Errands"]
+    assert matching_titles("has:tasks") == ["Errands", "Ideas"]
+    assert matching_titles("has:open-tasks") == ["Errands"]
+    assert matching_titles("has:attachments") == ["Errands"]
+    assert matching_titles("has:links") == ["Plan"]
+    assert matching_titles("has:backlinks") == ["Ideas"]
+    assert matching_titles("-has:tasks") == ["Plan"]
+    assert matching_titles("is:pinned OR has:attachments") == ["Errands", "Plan"]
+    assert matching_titles("has:tasks", category="home") == ["Errands"]
+    assert matching_titles("meeting") == ["Plan"]
+    assert matching_titles("title:errands") == ["Errands"]
+
+
+def test_has_filters_follow_changes(notes):
+    errands = NotesDB.load_note(3)
+    errands.tasks[0].done = True
+    NotesDB.save_note(errands)
+    assert matching_titles("has:open-tasks") == []
+    plan = NotesDB.load_note(1)
+    plan.content = "no links left"
+    NotesDB.save_note(plan)
+    assert matching_titles("has:links OR has:backlinks") == []
+    NotesDB.delete_note(3)
+    assert matching_titles("has:attachments") == []
+    assert matching_titles("has:tasks") == ["Ideas"]
+
+
+@pytest.mark.parametrize(
+    "query", ["is:maybe", "has:everything", "modified:>yesterweek", "(cat:work", "a OR"]
+)
+def test_bad_queries_are_rejected(query):
+    with pytest.raises(QueryError):
+        SearchQuery(query)
+
+
+def test_edit_distance():
+    assert main.edit_distance("meeting", "meting", 2) == 1
+    assert main.edit_distance("kitten", "sitting", 3) == 3
+    # Gives up past the limit
+    assert main.edit_distance("kitten", "sitting", 1) == 2
+    assert main.edit_distance("a", "abcdef", 2) == 3
+
+
+def test_fuzzy_search_ranks_closest_match_first(db):
+    if not main.FUZZY_SEARCH_AVAILABLE:
+        pytest.skip("SQLite has no trigram tokenizer")
+    for title, content in [
+        ("Budget", "quarterly budget review"),
+        ("Standup", "daily meeting with the team"),
+        ("Offsite", "meetings planned for the offsite"),
+        ("Lunch", "sandwiches"),
+    ]:
+        NotesDB.save_note(Note(title=title, content=content))
+    ids = NotesDB.fuzzy_search_note_ids("meetng")
+    assert [NotesDB.load_note(note_id).title for note_id in ids] == [
+        "Standup",
+        "Offsite",
+    ]
+
+
+def test_reindex_job_restores_a_damaged_index(db, job_context):
+    if not main.FUZZY_SEARCH_AVAILABLE:
+        pytest.skip("SQLite has no trigram tokenizer")
+    NotesDB.save_note(Note(title="Standup", content="daily meeting"))
+    with main.closing(main.get_connection()) as conn:
+        conn.execute("INSERT INTO notes_trigram (notes_trigram) VALUES ('delete-all')")
+        conn.commit()
+    assert not NotesDB.fuzzy_search_note_ids("meeting")
+    assert main.reindex_search_job(job_context).startswith("Search index rebuilt")
+    assert NotesDB.fuzzy_search_note_ids("meeting")
@@ -0,0 +1,58 @@
+from main import Note, NotesDB, TaskItem, TaskList
+
+
+def saved_tasks(count):
+    note = Note(title="Tasks", tasks=[TaskItem(str(n)) for n in range(count)])
+    NotesDB.save_note(note)
+    return note.id
+
+
+def test_loaded_tasks_expand_on_access(db):
+    note_id = saved_tasks(3)
+    tasks = NotesDB.load_tasks(note_id)
+    assert tasks.items is None
+    tasks[1].done = True
+    assert tasks.ids is not None
+    assert list(tasks.rows()) == [("0", False), ("1", True), ("2", False)]
+
+
+def test_moving_a_task_only_renumbers_that_task(db):
+    note_id = saved_tasks(4)
+    note = NotesDB.load_note(note_id)
+    before = {task.content: task.position for task in note.tasks}
+    note.tasks.move(3, 0)
+    NotesDB.save_note(note)
+    tasks = NotesDB.load_tasks(note_id)
+    assert [task.content for task in tasks] == ["3", "0", "1", "2"]
+    after = {task.content: task.position for task in tasks}
+    assert [c for c in before if before[c] != after[c]] == ["3"]
+
+
+def test_positions_are_renumbered_when_the_gap_runs_out():
+    tasks = TaskList(
+        [
+            TaskItem("a", position=1.0),
+            TaskItem("b"),
+            TaskItem("c", position=1.0 + 1e-10),
+        ]
+    )
+    tasks.assign_positions()
+    assert [task.position for task in tasks] == [1.0, 2.0, 3.0]
+    tasks = TaskList([TaskItem("a"), TaskItem("b", position=5.0), TaskItem("c")])
+    tasks.assign_positions()
+    positions = [task.position for task in tasks]
+    assert positions == sorted(positions) and positions[1] == 5.0
+
+
+def test_unloaded_note_reads_content_and_tasks_on_first_use(db):
+    note_id = saved_tasks(2)
+    note = NotesDB.load_note(note_id)
+    assert not note.content_loaded and not note.tasks_loaded
+    NotesDB.set_pinned([note_id], True)
+    # Saving metadata only leaves the body and tasks alone
+    note = NotesDB.load_note(note_id)
+    note.title = "Renamed"
+    NotesDB.save_note(note)
+    assert not note.tasks_loaded
+    assert list(NotesDB.load_tasks(note_id).rows()) == [("0", False), ("1", False)]
+    assert NotesDB.load_note(note_id).title == "Renamed"